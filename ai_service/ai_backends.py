@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+from azure.core.exceptions import HttpResponseError
+from google.genai.errors import APIError
+
+import ai_schemas
+import receipt_parser
+
+# ==========================================
+# BACKEND AI (GEMINI + AZURE OCR ATAU STAND-IN LOKAL)
+# ai_core hanya memanggil interface AIBackend:
+# - generate_content(model, contents, config) -> objek dengan .parsed / .text
+# - begin_analyze_receipt(image_url) -> poller dengan .result() (bentuk hasil
+#   Azure Document Intelligence: .documents[0].fields, .confidence, .content)
+#
+# AI_BACKEND=local memakai LocalBackend: tanpa jaringan dan tanpa kuota,
+# hasil deterministik per input (kategori & amount masuk akal), dengan
+# latensi, error rate dan injeksi 429 yang bisa diatur untuk load test.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+AI_BACKEND = os.environ.get("AI_BACKEND", "cloud").lower()
+
+# Distribusi latensi per operasi (ms), mis.:
+# {"generate": {"distribution": "lognormal", "median": 600, "sigma": 0.4},
+#  "ocr": {"distribution": "uniform", "min": 1500, "max": 4000}}
+# distribution: fixed (value) | uniform (min, max) | normal (mean, stddev) | lognormal (median, sigma)
+DEFAULT_LOCAL_LATENCY = {
+    "generate": {"distribution": "lognormal", "median": 500, "sigma": 0.4},
+    "ocr": {"distribution": "lognormal", "median": 2000, "sigma": 0.3},
+}
+LOCAL_AI_ERROR_RATE = float(os.environ.get("LOCAL_AI_ERROR_RATE", "0"))
+LOCAL_AI_THROTTLE_RATE = float(os.environ.get("LOCAL_AI_THROTTLE_RATE", "0"))
+# Porsi struk yang field terstrukturnya dikosongkan (menguji jalur parser lokal / fallback)
+LOCAL_AI_OCR_INCOMPLETE_RATE = float(os.environ.get("LOCAL_AI_OCR_INCOMPLETE_RATE", "0.2"))
+LOCAL_AI_SEED = os.environ.get("LOCAL_AI_SEED")
+
+LOCAL_DEFAULT_CATEGORIES = ["Makanan & Minuman", "Transportasi", "Kebutuhan Harian", "Lainnya"]
+INCOME_CATEGORIES = ("Gaji",)
+LOCAL_MERCHANTS = ["INDOMARET", "ALFAMART", "STARBUCKS", "KOPI KENANGAN", "PERTAMINA", "TOKO SUMBER REJEKI"]
+
+_SINGLE_INPUT_PATTERN = re.compile(r"Input Transaksi: '(.*)'\n\n", re.DOTALL)
+_BATCH_LINE_PATTERN = re.compile(r'^- id: (".*?") \| input: (".*")$', re.MULTILINE)
+_CATEGORY_LIST_PATTERN = re.compile(r"salah satu dari:([^.]*)", re.IGNORECASE)
+
+
+class AIBackend(ABC):
+    """Interface backend yang dipakai ai_core."""
+
+    name = "base"
+
+    @abstractmethod
+    def generate_content(self, model: str, contents: list, config):
+        """Satu panggilan LLM; return objek dengan .parsed dan .text."""
+
+    @abstractmethod
+    def begin_analyze_receipt(self, image_url: str):
+        """Mulai analisis struk; return poller dengan .result()."""
+
+
+def _load_latency() -> dict:
+    latency = dict(DEFAULT_LOCAL_LATENCY)
+    raw = os.environ.get("LOCAL_AI_LATENCY_MS")
+    if raw:
+        try:
+            latency.update(json.loads(raw))
+        except json.JSONDecodeError:
+            logger.error("LOCAL_AI_LATENCY_MS is not valid JSON, using defaults")
+    return latency
+
+
+def _stable_int(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class LocalBackend(AIBackend):
+    """
+    Stand-in lokal untuk Gemini + Azure OCR. Jawaban ditentukan hash input,
+    jadi input yang sama selalu menghasilkan kategori & amount yang sama;
+    hanya latensi dan error yang diacak (LOCAL_AI_SEED untuk run yang bisa diulang).
+    """
+
+    name = "local"
+
+    def __init__(self, latency: dict, error_rate: float, throttle_rate: float, seed: str | None = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # --- Injeksi latensi & error ---
+
+    def _sample_latency_ms(self, spec: dict) -> float:
+        distribution = spec.get("distribution", "fixed")
+        with self._lock:
+            if distribution == "uniform":
+                value = self._random.uniform(spec.get("min", 0), spec.get("max", 0))
+            elif distribution == "normal":
+                value = self._random.gauss(spec.get("mean", 0), spec.get("stddev", 0))
+            elif distribution == "lognormal":
+                value = self._random.lognormvariate(math.log(max(spec.get("median", 1), 1)), spec.get("sigma", 0))
+            else:
+                value = spec.get("value", 0)
+        return max(value, 0.0)
+
+    def _simulate(self, operation: str):
+        time.sleep(self._sample_latency_ms(self.latency.get(operation, {})) / 1000)
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            self._raise(operation, 429, "RESOURCE_EXHAUSTED", "Injected quota exhaustion")
+        if roll < self.throttle_rate + self.error_rate:
+            self._raise(operation, 500, "INTERNAL", "Injected backend error")
+
+    def _raise(self, operation: str, code: int, status: str, message: str):
+        if operation == "ocr":
+            error = HttpResponseError(message=message)
+            error.status_code = code
+            raise error
+        raise APIError(code, {"error": {"code": code, "status": status, "message": message}})
+
+    # --- Kategorisasi ---
+
+    def _categorize(self, text: str, system_prompt: str) -> dict:
+        seed = _stable_int(text)
+        match = _CATEGORY_LIST_PATTERN.search(system_prompt)
+        categories = re.findall(r"'([^']+)'", match.group(1)) if match else []
+        categories = categories or LOCAL_DEFAULT_CATEGORIES
+
+        hint = receipt_parser.category_hint(text, system_prompt)
+        if hint:
+            category_name, category_type = hint
+        else:
+            # Kategori income hanya jika teksnya memang menyebut kategori itu
+            expense = [c for c in categories if c not in INCOME_CATEGORIES] or categories
+            income = [c for c in categories if c in INCOME_CATEGORIES and c.lower() in text.lower()]
+            category_name = income[0] if income else expense[seed % len(expense)]
+            category_type = "Income" if category_name in INCOME_CATEGORIES else "Expense"
+
+        amount = receipt_parser.parse_amount(text) or float((seed % 1000 + 1) * 500)
+        return {
+            "category_name": category_name,
+            "category_type": category_type,
+            "amount": amount,
+            "ai_confidence": round(0.7 + (seed % 30) / 100, 2),
+        }
+
+    def generate_content(self, model: str, contents: list, config):
+        self._simulate("generate")
+        prompt = "\n".join(str(c) for c in contents)
+        system_prompt = prompt.split("\n", 1)[0]
+
+        if getattr(config, "response_schema", None) == ai_schemas.BATCH_RESPONSE_SCHEMA:
+            parsed = [
+                ai_schemas.BatchCategoryResult(id=json.loads(raw_id), **self._categorize(json.loads(raw_text), system_prompt))
+                for raw_id, raw_text in _BATCH_LINE_PATTERN.findall(prompt)
+            ]
+            text = json.dumps([r.model_dump() for r in parsed])
+        else:
+            match = _SINGLE_INPUT_PATTERN.search(prompt)
+            parsed = ai_schemas.CategoryResult(**self._categorize(match.group(1) if match else prompt, system_prompt))
+            text = parsed.model_dump_json()
+        return SimpleNamespace(parsed=parsed, text=text)
+
+    # --- OCR ---
+
+    def _receipt(self, image_url: str):
+        seed = _stable_int(image_url)
+        merchant = LOCAL_MERCHANTS[seed % len(LOCAL_MERCHANTS)]
+        items = [(f"ITEM {i + 1}", ((seed >> (i * 8)) % 90 + 10) * 500) for i in range(seed % 4 + 1)]
+        total = float(sum(price for _, price in items))
+        content = "\n".join(
+            [merchant, "JL. MERDEKA NO. 1", "17/08/2024 10:00"]
+            + [f"{name} {price:,}".replace(",", ".") for name, price in items]
+            + [f"TOTAL {int(total):,}".replace(",", ".")]
+        )
+
+        fields = {}
+        # Sebagian struk sengaja tanpa field terstruktur, seperti foto buram di produksi
+        if (seed % 1000) / 1000 >= LOCAL_AI_OCR_INCOMPLETE_RATE:
+            fields = {
+                "MerchantName": SimpleNamespace(value=merchant),
+                "Total": SimpleNamespace(value=total),
+                "Items": SimpleNamespace(value=[
+                    SimpleNamespace(value={"Description": SimpleNamespace(value=name)}) for name, _ in items
+                ]),
+            }
+        document = SimpleNamespace(fields=fields, confidence=round(0.8 + (seed % 20) / 100, 2))
+        return SimpleNamespace(documents=[document], content=content)
+
+    def begin_analyze_receipt(self, image_url: str):
+        self._simulate("ocr")
+        result = self._receipt(image_url)
+        return SimpleNamespace(result=lambda: result)
+
+
+_local_backend = None
+_local_backend_lock = threading.Lock()
+
+
+def get_local_backend() -> LocalBackend:
+    global _local_backend
+    if _local_backend is None:
+        with _local_backend_lock:
+            if _local_backend is None:
+                _local_backend = LocalBackend(
+                    _load_latency(), LOCAL_AI_ERROR_RATE, LOCAL_AI_THROTTLE_RATE, LOCAL_AI_SEED
+                )
+                logger.warning("AI_BACKEND=local: using offline stand-in for Gemini and Azure OCR")
+    return _local_backend
@@ -1,16 +1,36 @@
 import os
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 from google import genai
 from google.genai.errors import APIError
 
-# --- LIBRARY BARU UNTUK AZURE OCR ---
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
+# --- KLIEN AZURE OCR (POOLED, LIHAT azure_clients.py) ---
+import azure_clients
+import result_cache
+import rate_limiter
+import receipt_parser
+import ai_schemas
+import model_router
+import ai_backends
 
 # Setup Logging
 logger = logging.getLogger(__name__)
 
+# --- KONFIGURASI BATCH (ai/language/batch) ---
+# Estimasi kasar token = karakter / 4; satu prompt chunk dibatasi budget ini
+AI_BATCH_TOKEN_BUDGET = int(os.environ.get("AI_BATCH_TOKEN_BUDGET", "4000"))
+AI_BATCH_MAX_ITEMS_PER_CHUNK = int(os.environ.get("AI_BATCH_MAX_ITEMS_PER_CHUNK", "50"))
+AI_BATCH_MAX_CONCURRENCY = int(os.environ.get("AI_BATCH_MAX_CONCURRENCY", "4"))
+CHARS_PER_TOKEN = 4
+ITEM_PROMPT_OVERHEAD_TOKENS = 40  # baris id + jawaban JSON per item
+
+# Confidence untuk hasil struk yang dikategorikan parser lokal (tanpa Gemini)
+RECEIPT_PARSER_CONFIDENCE = 0.9
+
+# Nama limiter untuk Azure Document Intelligence (Gemini memakai nama model)
+OCR_LIMITER_NAME = "azure-ocr"
+
 # --- GLOBAL VARS ---
 gemini_client = None
 AI_CLIENT_INITIALIZED = False
@@ -35,87 +55,256 @@ def _initialize_gemini():
         AI_CLIENT_INITIALIZED = False
 
 def _get_azure_client():
-    """Helper untuk membuat Azure Document Intelligence Client saat dibutuhkan"""
+    """Helper untuk mengambil Azure Document Intelligence Client (dibuat sekali per worker)"""
     endpoint = os.environ.get("AZURE_FORM_ENDPOINT")
     key = os.environ.get("AZURE_FORM_KEY")
-    
-    if not endpoint or not key:
-        raise ValueError("AZURE_FORM_ENDPOINT or AZURE_FORM_KEY is missing.")
-        
-    return DocumentAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(key))
+    return azure_clients.get_document_analysis_client(endpoint, key)
+
+
+class CloudBackend(ai_backends.AIBackend):
+    """Backend produksi: Gemini API + Azure Document Intelligence."""
+
+    name = "cloud"
+
+    def generate_content(self, model: str, contents: list, config):
+        return gemini_client.models.generate_content(model=model, contents=contents, config=config)
 
-def process_ai_request(text_input: str, ai_instruction: dict) -> dict:
+    def begin_analyze_receipt(self, image_url: str):
+        return _get_azure_client().begin_analyze_document_from_url("prebuilt-receipt", image_url)
+
+
+_cloud_backend = CloudBackend()
+
+
+def _get_backend(require_gemini: bool = True) -> ai_backends.AIBackend:
     """
-    Fungsi modular yang memproses permintaan AI (LLM).
+    Backend sesuai AI_BACKEND ("cloud" default, "local" untuk load test offline).
+    require_gemini=False untuk OCR: Azure OCR tetap jalan walau Gemini belum siap.
     """
+    if ai_backends.AI_BACKEND == "local":
+        return ai_backends.get_local_backend()
+
     # Coba inisialisasi jika belum
     _initialize_gemini()
 
-    if not AI_CLIENT_INITIALIZED:
+    if require_gemini and not AI_CLIENT_INITIALIZED:
         raise ConnectionError("Gemini Client not initialized. Check GEMINI_API_KEY configuration.")
+    return _cloud_backend
+
+def process_ai_request(text_input: str, ai_instruction: dict, route_path: str = "text") -> dict:
+    """
+    Fungsi modular yang memproses permintaan AI (LLM).
+    route_path: "text" atau jalur OCR ("ocr" / "ocr_fallback") untuk model_router.
+    """
+    backend = _get_backend()
 
     # Ambil instruksi dan prompt
     system_prompt = ai_instruction.get("system_prompt", "Anda adalah asisten kategorisasi keuangan profesional.")
     model_name = ai_instruction.get("model_name", "gemini-2.5-flash") 
 
-    # 1. Tentukan Prompt ke LLM
-    # Tips: Berikan contoh format JSON di prompt agar akurasi lebih tinggi
+    # 0. Cache: teks yang sama (ternormalisasi) + prompt + model tidak perlu ke Gemini lagi
+    cached = result_cache.get(text_input, system_prompt, model_name)
+    if cached:
+        cached["ai_service_used"] = "result_cache"
+        return cached
+
+    # 1. Tentukan Prompt ke LLM (format output dijamin response_schema)
     prompt_text = (
         f"Role: {system_prompt}\n"
         f"Input Transaksi: '{text_input}'\n\n"
         f"Instruksi: Analisis input di atas. "
-        f"Output WAJIB JSON valid tanpa markdown (```json). "
-        # f"Format JSON: {{ \"category\": \"string\", \"confidence\": float (0.0-1.0) }}"
+        f"ai_confidence adalah keyakinan Anda (0.0-1.0)."
     )
     
+    # model_name instruksi tetap jadi namespace cache; model yang dipanggil dipilih router
+    routed_model = model_router.choose_model(len(text_input), route_path, model_name)
+
     try:
         # 2. Panggilan ke Gemini API
-        response = gemini_client.models.generate_content(
-            model=model_name,
+        response = rate_limiter.call_with_limits(
+            routed_model,
+            model_router.observed(routed_model, backend.generate_content),
+            model=routed_model,
             contents=[prompt_text],
             config=genai.types.GenerateContentConfig(
-                response_mime_type="application/json"
+                response_mime_type="application/json",
+                response_schema=ai_schemas.CategoryResult
             )
         )
         
-        # 3. Parsing Hasil
-        raw_text = response.text
-        # Bersihkan markdown jika LLM bandel (opsional tapi aman)
-        if raw_text.startswith("```json"):
-            raw_text = raw_text.replace("```json", "").replace("```", "")
-            
-        ai_result = json.loads(raw_text)
-        logger.info(f"AI Result: {ai_result}")
-        
-        # 4. Kembalikan data yang siap digunakan
-        return {
-            "category_name": ai_result.get("category_name", "Uncategorized"),
-            "category_type": ai_result.get("category_type", "Uncategorized"),
-            "amount": float(ai_result.get("amount", 0.0)),
-            "ai_service_used": "gemini_llm",
-            "ai_confidence": float(ai_result.get("confidence", 0.99))
-        }
+        # 3. Validasi hasil ke schema -> bentuk hasil yang siap digunakan
+        final_result = ai_schemas.parse_category(response).to_result("gemini_llm")
+        final_result["model_used"] = routed_model
+        logger.info(f"AI Result: {final_result}")
+        result_cache.put(text_input, system_prompt, model_name, final_result)
+        return final_result
 
+    except rate_limiter.RateLimitExceeded:
+        raise
     except APIError as e:
         logger.error(f"Gemini API Error: {e}")
         raise RuntimeError(f"Gemini API call failed: {e}")
-    except json.JSONDecodeError:
-        logger.error(f"Failed to parse JSON from Gemini: {response.text}")
-        return {
-            "category": "Error_JSON_Parse",
-            "ai_service_used": "gemini_llm",
-            "ai_confidence": 0.0
-        }
+    except ai_schemas.InvalidModelOutput as e:
+        logger.error(f"{e}. Raw output: {response.text}")
+        raise
     except Exception as e:
         logger.error(f"General AI processing error: {e}")
         raise Exception(f"General AI processing error: {e}")
 
-def process_receipt_ocr(image_url: str, ai_instruction: dict) -> dict: 
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _chunk_batch_items(items: list[dict], base_tokens: int) -> list[list[dict]]:
+    """
+    Bagi items menjadi chunk prompt yang masing-masing muat di AI_BATCH_TOKEN_BUDGET
+    (dan maksimal AI_BATCH_MAX_ITEMS_PER_CHUNK item). Item yang sendirian sudah
+    melebihi budget tetap dikirim sebagai chunk sendiri.
+    """
+    chunks, current, current_tokens = [], [], base_tokens
+    for item in items:
+        item_tokens = _estimate_tokens(str(item.get("text", ""))) + ITEM_PROMPT_OVERHEAD_TOKENS
+        if current and (current_tokens + item_tokens > AI_BATCH_TOKEN_BUDGET
+                        or len(current) >= AI_BATCH_MAX_ITEMS_PER_CHUNK):
+            chunks.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _categorize_batch_chunk(items: list[dict], system_prompt: str, model_name: str) -> list[dict]:
+    """
+    Satu panggilan LLM untuk satu chunk. Return satu hasil per item (urutan sama),
+    item yang tidak ada di jawaban LLM diberi field 'error'.
+    """
+    # 1. Prompt terstruktur: satu baris per transaksi, dikunci dengan id
+    transaction_lines = "\n".join(
+        f"- id: {json.dumps(str(item['id']))} | input: {json.dumps(item.get('text', ''), ensure_ascii=False)}"
+        for item in items
+    )
+    prompt_text = (
+        f"Role: {system_prompt}\n"
+        f"Daftar Transaksi ({len(items)} item):\n{transaction_lines}\n\n"
+        f"Instruksi: Analisis SETIAP transaksi di atas secara terpisah. "
+        f"Jawab satu elemen per transaksi dengan 'id' sama persis dengan input; "
+        f"ai_confidence adalah keyakinan Anda (0.0-1.0)."
+    )
+
+    try:
+        response = rate_limiter.call_with_limits(
+            model_name,
+            model_router.observed(model_name, _get_backend().generate_content),
+            model=model_name,
+            contents=[prompt_text],
+            config=genai.types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=ai_schemas.BATCH_RESPONSE_SCHEMA
+            )
+        )
+        by_id = {r.id: r for r in ai_schemas.parse_batch(response)}
+    except APIError as e:
+        logger.error(f"Gemini API Error (batch chunk): {e}")
+        return [{"id": str(item["id"]), "error": f"Gemini API call failed: {e}", "is_success": False} for item in items]
+    except ai_schemas.InvalidModelOutput as e:
+        logger.error(f"{e} (batch chunk)")
+        by_id = {}
+
+    # 2. Petakan kembali ke id input
+    results = []
+    for item in items:
+        item_id = str(item["id"])
+        ai_result = by_id.get(item_id)
+        if ai_result is None:
+            results.append({"id": item_id, "error": "Missing result in LLM response", "is_success": False})
+            continue
+        results.append({"id": item_id, **ai_result.to_result("gemini_llm_batch"), "model_used": model_name, "is_success": True})
+    return results
+
+
+def process_ai_batch_request(items: list[dict], ai_instruction: dict) -> list[dict]:
+    """
+    Kategorisasi banyak transaksi sekaligus.
+    items: [{"id": str, "text": str}] dibagi ke chunk sesuai AI_BATCH_TOKEN_BUDGET,
+    chunk dijalankan paralel (maks AI_BATCH_MAX_CONCURRENCY). Return satu hasil
+    per item (urutan sama); chunk yang gagal hanya menandai item-nya dengan 'error'.
+    """
+    _get_backend()
+
+    system_prompt = ai_instruction.get("system_prompt", "Anda adalah asisten kategorisasi keuangan profesional.")
+    model_name = ai_instruction.get("model_name", "gemini-2.5-flash")
+
+    # Item yang sudah pernah dikategorikan diambil dari cache, sisanya ke LLM
+    cached_results = {}
+    pending_items = []
+    for item in items:
+        cached = result_cache.get(str(item.get("text", "")), system_prompt, model_name)
+        if cached:
+            cached.update({"id": str(item["id"]), "ai_service_used": "result_cache", "is_success": True})
+            cached_results[str(item["id"])] = cached
+        else:
+            pending_items.append(item)
+
+    chunks = _chunk_batch_items(pending_items, _estimate_tokens(system_prompt) + 100)
+    logger.info(f"AI Batch: {len(items)} items, {len(cached_results)} cached, {len(chunks)} chunks")
+
+    def run_chunk(chunk):
+        # Dirute per chunk berdasarkan item terpanjang (tiap item dijawab terpisah)
+        longest = max(len(str(item.get("text", ""))) for item in chunk)
+        try:
+            return _categorize_batch_chunk(chunk, system_prompt, model_router.choose_model(longest, "batch", model_name))
+        except Exception as e:
+            logger.error(f"AI Batch chunk failed: {e}")
+            return [{"id": str(item["id"]), "error": str(e), "is_success": False} for item in chunk]
+
+    if len(chunks) <= 1:
+        chunk_results = [run_chunk(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(AI_BATCH_MAX_CONCURRENCY, len(chunks)))) as executor:
+            chunk_results = list(executor.map(run_chunk, chunks))
+
+    texts_by_id = {str(item["id"]): str(item.get("text", "")) for item in pending_items}
+    llm_results = {}
+    for chunk in chunk_results:
+        for result in chunk:
+            llm_results[result["id"]] = result
+            if result.get("is_success"):
+                cache_value = {k: v for k, v in result.items() if k not in ("id", "is_success")}
+                result_cache.put(texts_by_id[result["id"]], system_prompt, model_name, cache_value)
+
+    results = [cached_results.get(str(item["id"])) or llm_results[str(item["id"])] for item in items]
+    logger.info(f"AI Batch Result: {sum(r['is_success'] for r in results)}/{len(items)} categorized")
+    return results
+
+def _analyze_receipt(backend: ai_backends.AIBackend, image_url: str):
+    """
+    Submit + tunggu hasil analisis dalam satu panggilan, supaya slot concurrency
+    OCR di rate_limiter dipegang selama analisis berjalan (bukan hanya saat submit).
+    """
+    return backend.begin_analyze_receipt(image_url).result()
+
+
+def process_receipt_ocr(image_url: str, ai_instruction: dict, on_progress=None, image_sha256: str | None = None) -> dict: 
+    """
+    on_progress (opsional): callback(stage) untuk job OCR asinkron.
+    image_sha256 (opsional): digest byte gambar dari TransactionService; gambar yang
+    sama persis memakai hasil cache tanpa memanggil Azure OCR maupun Gemini.
+    """
+    system_prompt = ai_instruction.get("system_prompt", "Anda adalah asisten kategorisasi keuangan profesional.")
+    model_name = ai_instruction.get("model_name", "gemini-2.5-flash")
+    cached = result_cache.get_ocr(image_sha256, system_prompt, model_name)
+    if cached:
+        logger.info(f"OCR cache hit for image {image_sha256[:12]}")
+        cached["ocr_cache_hit"] = True
+        return cached
+
     try:
         # 1. AZURE OCR
-        azure_client = _get_azure_client()
-        poller = azure_client.begin_analyze_document_from_url("prebuilt-receipt", image_url)
-        result = poller.result()
+        if on_progress: on_progress("analyzing_document")
+        backend = _get_backend(require_gemini=False)
+        result = rate_limiter.call_with_limits(OCR_LIMITER_NAME, _analyze_receipt, backend, image_url)
         
         if not result.documents:
             raise Exception("No document detected by Azure")
@@ -143,14 +332,26 @@ def process_receipt_ocr(image_url: str, ai_instruction: dict) -> dict:
         logger.info(f"Azure OCR Raw Text: {raw_full_text}")
         
         # Tentukan teks mana yang akan dikirim ke Gemini
-        if azure_amount > 0 and merchant_str != "Unknown":
+        fields_complete = azure_amount > 0 and merchant_str != "Unknown"
+        if fields_complete:
             # Jika Azure sukses, kirim ringkasan saja (hemat token)
             text_for_ai = f"Merchant: {merchant_str}. Items: {items_str}. Total: {azure_amount}"
+            route_path = "ocr"
             logger.info("Azure Fields Valid. Using structured data.")
+            hint = receipt_parser.category_hint(merchant_str, system_prompt)
         else:
-            # JIKA AZURE FIELDS SALAH/KOSONG:
-            # Kirim SELURUH teks mentah ke Gemini. Biarkan Gemini yang mencari totalnya.
-            text_for_ai = f"""
+            # JIKA AZURE FIELDS SALAH/KOSONG: parser lokal cari TOTAL/JUMLAH & merchant
+            parsed = receipt_parser.parse_receipt(raw_full_text)
+            hint = receipt_parser.category_hint(parsed.merchant, system_prompt) if parsed.is_confident else None
+            if parsed.total > 0:
+                # Kirim baris relevan saja (total sudah angka murni)
+                text_for_ai = receipt_parser.compact_prompt_text(parsed)
+                route_path = "ocr"
+                azure_amount = azure_amount or parsed.total
+                logger.info(f"Receipt pre-parser: total={parsed.total}, prompt {len(raw_full_text)} -> {len(text_for_ai)} chars")
+            else:
+                # Parser juga gagal: kirim SELURUH teks mentah ke Gemini. Biarkan Gemini yang mencari totalnya.
+                text_for_ai = f"""
             SYSTEM WARNING: Azure gagal untuk mengekstrak field terstruktur dengan sempurna.
             Ini adalah FULL RAW TEXT dari receipt:
             ---
@@ -166,22 +367,23 @@ def process_receipt_ocr(image_url: str, ai_instruction: dict) -> dict:
             - WRONG: 66,900
             - CORRECT: 66900
             """
-            logger.warning("Azure Fields Incomplete/Zero. Sending RAW CONTENT to Gemini.")
-
-        # 2. GEMINI PROCESSING (Dengan Retry Logic 429)
-        cat_result = {}
-        cat_result = process_ai_request(text_for_ai, ai_instruction)
-        logger.info(f"Gemini Categorization Result: {cat_result}")
-        # max_retries = 3
-        # for attempt in range(max_retries):
-        #     try:
-        #         # Pastikan prompt di process_ai_request meminta return JSON dengan field 'amount'
-        #         break 
-        #     except Exception as e:
-        #         if "429" in str(e):
-        #             time.sleep(2 ** attempt)
-        #         else:
-        #             break
+                route_path = "ocr_fallback"
+                logger.warning("Azure Fields Incomplete/Zero. Sending RAW CONTENT to Gemini.")
+
+        # 2. GEMINI PROCESSING (retry 429 ditangani rate_limiter)
+        if on_progress: on_progress("categorizing")
+        if hint and azure_amount > 0:
+            # Merchant dikenal + total jelas: tidak perlu Gemini
+            cat_result = {
+                "category_name": hint[0],
+                "category_type": hint[1],
+                "amount": azure_amount,
+                "ai_confidence": RECEIPT_PARSER_CONFIDENCE
+            }
+            logger.info(f"Receipt pre-parser confident ({hint[0]}), skipping Gemini.")
+        else:
+            cat_result = process_ai_request(text_for_ai, ai_instruction, route_path)
+            logger.info(f"Gemini Categorization Result: {cat_result}")
 
         # 3. FINAL MERGE
         # Prioritas nilai Amount:
@@ -193,15 +395,26 @@ def process_receipt_ocr(image_url: str, ai_instruction: dict) -> dict:
             final_amount = azure_amount
 
         # C. Gabungkan Hasil
-        return {
+        final_result = {
             "description": raw_full_text, 
             "amount": final_amount, # Amount diambil dari Azure (lebih percaya Azure)
             "category_name": cat_result.get("category_name", "Uncategorized"),
             "category_type": cat_result.get("category_type", "Expense"),
             "ai_confidence": float(cat_result.get("ai_confidence", 0.99)),
-            "is_ocr_success": True
+            "is_ocr_success": True,
+            # Indikator kualitas OCR (dibandingkan dengan/tanpa normalisasi gambar)
+            "ocr_quality": {
+                "document_confidence": receipt.confidence,
+                "fields_complete": fields_complete,
+                "total_found": final_amount > 0
+            }
         }
+        result_cache.put_ocr(image_sha256, system_prompt, model_name, final_result)
+        return final_result
 
+    except rate_limiter.RateLimitExceeded:
+        # Biarkan caller tahu ini throttle (bisa di-retry), bukan struk gagal dibaca
+        raise
     except Exception as e:
         logger.error(f"OCR Error: {e}")
         return {"error": str(e), "is_ocr_success": False}
\ No newline at end of file
@@ -0,0 +1,63 @@
+from typing import Literal
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# ==========================================
+# SCHEMA OUTPUT GEMINI (response_schema)
+# Dikirim ke GenerateContentConfig supaya Gemini memakai constrained decoding:
+# output selalu JSON sesuai schema (tanpa markdown, tanpa field hilang), jadi
+# tidak ada lagi perbaikan JSON manual / hasil "Error_JSON_Parse".
+# Jalur teks (ai/language), OCR (fallback Gemini) dan batch memakai schema ini.
+# ==========================================
+
+
+class InvalidModelOutput(RuntimeError):
+    """Output Gemini tidak lolos validasi schema (mis. respons terpotong/diblokir)."""
+
+
+class CategoryResult(BaseModel):
+    category_name: str
+    category_type: Literal["Expense", "Income"]
+    amount: float
+    ai_confidence: float
+
+    def to_result(self, ai_service_used: str) -> dict:
+        """
+        Bentuk hasil yang dikembalikan ai_core (sama untuk semua jalur).
+        """
+        return {
+            "category_name": self.category_name,
+            "category_type": self.category_type,
+            "amount": max(self.amount, 0.0),
+            "ai_service_used": ai_service_used,
+            "ai_confidence": min(max(self.ai_confidence, 0.0), 1.0),
+        }
+
+
+class BatchCategoryResult(CategoryResult):
+    id: str
+
+
+BATCH_RESPONSE_SCHEMA = list[BatchCategoryResult]
+_batch_adapter = TypeAdapter(BATCH_RESPONSE_SCHEMA)
+
+
+def parse_category(response) -> CategoryResult:
+    """
+    response.parsed sudah berupa CategoryResult jika SDK berhasil mem-parse;
+    kalau kosong (mis. SDK lama), validasi response.text terhadap schema yang sama.
+    """
+    if isinstance(response.parsed, CategoryResult):
+        return response.parsed
+    try:
+        return CategoryResult.model_validate_json(response.text or "")
+    except ValidationError as e:
+        raise InvalidModelOutput(f"Gemini output does not match schema: {e.error_count()} error(s)") from e
+
+
+def parse_batch(response) -> list[BatchCategoryResult]:
+    if isinstance(response.parsed, list):
+        return response.parsed
+    try:
+        return _batch_adapter.validate_json(response.text or "")
+    except ValidationError as e:
+        raise InvalidModelOutput(f"Gemini batch output does not match schema: {e.error_count()} error(s)") from e
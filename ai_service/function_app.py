@@ -1,10 +1,53 @@
 import azure.functions as func
 import logging
 import json
+import os
+import hmac
 import ai_core  # Mengimpor modul ai_core.py yang ada di folder yang sama
+import result_cache
+import rate_limiter
+import ocr_jobs
+import model_router
+import ocr_context
 
 app = func.FunctionApp()
 
+# Retry-After (detik) yang dikirim saat kuota Gemini / OCR habis
+RATE_LIMIT_RETRY_AFTER_SECONDS = os.environ.get("RATE_LIMIT_RETRY_AFTER_SECONDS", "5")
+
+MAX_DEQUEUE_COUNT = 5 # Sama dengan default maxDequeueCount Functions host
+
+# Batas jumlah item per request ai/language/batch
+AI_BATCH_MAX_ITEMS = int(os.environ.get("AI_BATCH_MAX_ITEMS", "500"))
+
+# Endpoint admin (ai/cache/invalidate, ai/stats) wajib header X-Admin-Key = AI_ADMIN_KEY;
+# tanpa AI_ADMIN_KEY endpoint itu selalu ditolak. Gateway juga memblokirnya.
+AI_ADMIN_KEY = os.environ.get("AI_ADMIN_KEY")
+ADMIN_KEY_HEADER = "X-Admin-Key"
+
+def _admin_forbidden(req: func.HttpRequest) -> func.HttpResponse | None:
+    """
+    None jika request membawa admin key yang benar, selain itu response 403.
+    """
+    provided = req.headers.get(ADMIN_KEY_HEADER) or ""
+    if AI_ADMIN_KEY and hmac.compare_digest(provided.encode("utf-8"), AI_ADMIN_KEY.encode("utf-8")):
+        return None
+    logging.warning(f"Admin endpoint {req.url} rejected: missing or invalid {ADMIN_KEY_HEADER}")
+    return func.HttpResponse(json.dumps({"error": "Forbidden"}), mimetype="application/json", status_code=403)
+
+def _throttled_response(e: Exception) -> func.HttpResponse:
+    """
+    429 + Retry-After saat limiter kehabisan kuota, supaya caller me-retry
+    (bukan menganggap kategorisasi gagal permanen).
+    """
+    logging.warning(f"AI Service throttled: {e}")
+    return func.HttpResponse(
+        json.dumps({"error": f"AI Service throttled: {str(e)}"}),
+        mimetype="application/json",
+        status_code=429,
+        headers={"Retry-After": RATE_LIMIT_RETRY_AFTER_SECONDS}
+    )
+
 @app.route(route="ai/language", methods=["POST"])
 def LanguageFunction(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('LanguageFunction (API Host) received HTTP request with AI Instructions.')
@@ -40,6 +83,8 @@ def LanguageFunction(req: func.HttpRequest) -> func.HttpResponse:
             status_code=200
         )
         
+    except rate_limiter.RateLimitExceeded as e:
+        return _throttled_response(e)
     except (ConnectionError, RuntimeError, PermissionError) as e:
         # Menangani kesalahan konfigurasi atau API (misal: API Key salah)
         logging.error(f"AI Service configuration/API error: {e}")
@@ -57,6 +102,108 @@ def LanguageFunction(req: func.HttpRequest) -> func.HttpResponse:
              status_code=500
         )
 
+@app.route(route="ai/language/batch", methods=["POST"])
+def LanguageBatchFunction(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('LanguageBatchFunction received batch categorization request.')
+
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        return func.HttpResponse(
+            json.dumps({"error": "Invalid JSON format. Please send valid request body."}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    # Validasi Input: 'items' = [{"id": ..., "text": ...}] dan 'instructions'
+    items = req_body.get('items') if isinstance(req_body, dict) else None
+    ai_instructions = req_body.get('instructions') if isinstance(req_body, dict) else None
+    if not isinstance(items, list) or not items or not ai_instructions:
+        return func.HttpResponse(
+            json.dumps({"error": "Missing 'items' or 'instructions' field in the request body."}),
+            mimetype="application/json",
+            status_code=400
+        )
+    if any(not isinstance(item, dict) or 'id' not in item or 'text' not in item for item in items):
+        return func.HttpResponse(
+            json.dumps({"error": "Each item must have 'id' and 'text'."}),
+            mimetype="application/json",
+            status_code=400
+        )
+    if len(items) > AI_BATCH_MAX_ITEMS:
+        return func.HttpResponse(
+            json.dumps({"error": f"Too many items. Max {AI_BATCH_MAX_ITEMS} per request."}),
+            mimetype="application/json",
+            status_code=413
+        )
+    if len({str(item['id']) for item in items}) != len(items):
+        return func.HttpResponse(
+            json.dumps({"error": "Item ids must be unique."}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    try:
+        results = ai_core.process_ai_batch_request(items, ai_instructions)
+        failed = sum(1 for r in results if not r.get("is_success"))
+        if failed == len(results):
+            return func.HttpResponse(
+                json.dumps({"error": "AI Service Unavailable: all items failed", "results": results}),
+                mimetype="application/json",
+                status_code=503
+            )
+        # 200 walau sebagian gagal; status per item ada di 'is_success' / 'error'
+        return func.HttpResponse(
+            json.dumps({"results": results, "succeeded": len(results) - failed, "failed": failed}),
+            mimetype="application/json",
+            status_code=200
+        )
+    except (ConnectionError, RuntimeError, PermissionError) as e:
+        logging.error(f"AI Service configuration/API error: {e}")
+        return func.HttpResponse(
+            json.dumps({"error": f"AI Service Unavailable: {str(e)}"}),
+            mimetype="application/json",
+            status_code=503
+        )
+    except Exception as e:
+        logging.error(f"Unhandled error during batch processing: {e}")
+        return func.HttpResponse(
+             json.dumps({"error": f"Internal Server Error: {str(e)}"}),
+             mimetype="application/json",
+             status_code=500
+        )
+
+@app.route(route="ai/cache/invalidate", methods=["POST"])
+def InvalidateResultCacheFunction(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Hapus cache hasil kategorisasi untuk satu prompt + model (mis. setelah
+    CATEGORIZATION_PROMPT diubah). Body: {"instructions": {"system_prompt", "model_name"}}.
+    Tanpa instructions: hanya kosongkan cache lokal worker ini. Khusus admin.
+    """
+    forbidden = _admin_forbidden(req)
+    if forbidden:
+        return forbidden
+
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        req_body = {}
+
+    instructions = (req_body or {}).get('instructions') or {}
+    try:
+        deleted = result_cache.invalidate(
+            instructions.get("system_prompt") if instructions else None,
+            instructions.get("model_name", "gemini-2.5-flash") if instructions else None
+        )
+        return func.HttpResponse(
+            json.dumps({"invalidated": True, "shared_entries_deleted": deleted, "stats": result_cache.get_stats()}),
+            mimetype="application/json",
+            status_code=200
+        )
+    except Exception as e:
+        logging.error(f"Cache invalidation failed: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), mimetype="application/json", status_code=500)
+
 @app.route(route="ai/ocr", methods=["POST"])
 def OcrFunction(req: func.HttpRequest) -> func.HttpResponse:
     try:
@@ -68,8 +215,122 @@ def OcrFunction(req: func.HttpRequest) -> func.HttpResponse:
              return func.HttpResponse(json.dumps({"error": "Missing image_url or instructions"}), status_code=400)
 
         # Lempar ke Core
-        ocr_result = ai_core.process_receipt_ocr(image_url, instructions)
+        ocr_result = ai_core.process_receipt_ocr(image_url, instructions, image_sha256=req_body.get('image_sha256'))
         
         return func.HttpResponse(json.dumps(ocr_result), status_code=200, mimetype="application/json")
+    except rate_limiter.RateLimitExceeded as e:
+        return _throttled_response(e)
     except Exception as e:
-        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
\ No newline at end of file
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
+
+# ---------------------------------------------------------------------------
+# OCR ASINKRON: submit job -> proses di background -> polling status
+# ---------------------------------------------------------------------------
+@app.route(route="ai/ocr/jobs", methods=["POST"])
+def SubmitOcrJobFunction(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        return func.HttpResponse(json.dumps({"error": "Invalid JSON"}), mimetype="application/json", status_code=400)
+
+    image_url = (req_body or {}).get('image_url')
+    instructions = (req_body or {}).get('instructions')
+    if not image_url or not instructions:
+        return func.HttpResponse(json.dumps({"error": "Missing image_url or instructions"}), mimetype="application/json", status_code=400)
+
+    # Hasil hanya di-push (ke queue hasil milik server) untuk context yang ditandatangani CategoryService
+    context = req_body.get('context')
+    if context is not None and not ocr_context.verify(context, req_body.get('context_signature')):
+        logging.warning("OCR job rejected: invalid context signature")
+        return func.HttpResponse(json.dumps({"error": "Invalid context signature"}), mimetype="application/json", status_code=403)
+
+    try:
+        job = ocr_jobs.submit_job(
+            image_url,
+            instructions,
+            context=context,
+            context_signature=req_body.get('context_signature') if context is not None else None,
+            image_sha256=req_body.get('image_sha256')
+        )
+        job["status_url"] = f"ai/ocr/jobs/{job['job_id']}"
+        return func.HttpResponse(json.dumps(job), mimetype="application/json", status_code=202)
+    except Exception as e:
+        logging.error(f"Failed to submit OCR job: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), mimetype="application/json", status_code=500)
+
+
+@app.route(route="ai/ocr/jobs/{job_id}", methods=["GET"])
+def GetOcrJobFunction(req: func.HttpRequest) -> func.HttpResponse:
+    job_id = req.route_params.get('job_id')
+    try:
+        job = ocr_jobs.get_job(job_id)
+    except Exception as e:
+        logging.error(f"Failed to read OCR job {job_id}: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), mimetype="application/json", status_code=500)
+
+    if not job:
+        return func.HttpResponse(json.dumps({"error": "Job not found"}), mimetype="application/json", status_code=404)
+    return func.HttpResponse(json.dumps(job), mimetype="application/json", status_code=200)
+
+
+@app.queue_trigger(arg_name="msg", queue_name=ocr_jobs.OCR_JOB_QUEUE_NAME, connection="STORAGE_CONN_STR")
+def OcrJobProcessor(msg: func.QueueMessage):
+    try:
+        message = json.loads(msg.get_body().decode('utf-8'))
+        job_id = message["job_id"]
+    except Exception as e:
+        logging.error(f"Invalid OCR job message: {e}")
+        return
+
+    attempt = msg.dequeue_count or 1
+    ocr_jobs.update_job(job_id, status="running", stage="starting", attempts=attempt)
+
+    try:
+        result = ai_core.process_receipt_ocr(
+            message["image_url"],
+            message["instructions"],
+            on_progress=lambda stage: ocr_jobs.update_job(job_id, stage=stage),
+            image_sha256=message.get("image_sha256")
+        )
+    except rate_limiter.RateLimitExceeded as e:
+        if attempt < MAX_DEQUEUE_COUNT:
+            # Kembalikan ke antrean; host me-retry pesan ini
+            ocr_jobs.update_job(job_id, status="queued", stage="throttled")
+            raise
+        ocr_jobs.complete_job(message, None, error=f"AI Service throttled: {e}")
+        return
+    except Exception as e:
+        logging.error(f"OCR job {job_id} attempt {attempt} failed: {e}")
+        if attempt < MAX_DEQUEUE_COUNT:
+            ocr_jobs.update_job(job_id, status="queued", stage="retrying", error=str(e))
+            raise
+        # Percobaan terakhir: job & transaksi harus sampai status akhir (bukan poison queue diam-diam)
+        ocr_jobs.complete_job(message, None, error=f"OCR job failed: {e}")
+        return
+
+    if result.get("error"):
+        ocr_jobs.complete_job(message, None, error=result["error"])
+    else:
+        ocr_jobs.complete_job(message, result)
+    logging.info(f"OCR job {job_id} finished")
+
+
+@app.route(route="ai/stats", methods=["GET"])
+def StatsFunction(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Statistik worker ini: limiter per model (queue depth, throttle, concurrency), cache hasil
+    dan routing model (histogram latensi per model). Khusus admin.
+    """
+    forbidden = _admin_forbidden(req)
+    if forbidden:
+        return forbidden
+
+    return func.HttpResponse(
+        json.dumps({
+            "rate_limits": rate_limiter.get_stats(),
+            "result_cache": result_cache.get_stats(),
+            "model_router": model_router.get_stats()
+        }),
+        mimetype="application/json",
+        status_code=200
+    )
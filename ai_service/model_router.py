@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+# ==========================================
+# ROUTING MODEL GEMINI (BIAYA & LATENSI)
+# Tier di policy diurutkan dari yang paling murah/cepat ke paling kuat.
+# Tier awal = tier termurah yang max_input_chars-nya cukup untuk input,
+# minimal min_tier milik path (text / batch / ocr / ocr_fallback). Jika model
+# tier itu sedang lambat (p95 > max_p95_ms) atau sering error (> max_error_rate)
+# menurut histogram latensi bergulir, tier berikutnya yang sehat dipakai.
+#
+# Policy: AI_MODEL_POLICY_FILE (default model_routing_policy.json di folder ini).
+# AI_MODEL_ROUTING_ENABLED=false -> selalu pakai model_name dari instruksi caller.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+AI_MODEL_ROUTING_ENABLED = os.environ.get("AI_MODEL_ROUTING_ENABLED", "true").lower() == "true"
+AI_MODEL_POLICY_FILE = os.environ.get(
+    "AI_MODEL_POLICY_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routing_policy.json")
+)
+AI_ROUTER_WINDOW_SECONDS = int(os.environ.get("AI_ROUTER_WINDOW_SECONDS", "300"))
+AI_ROUTER_SLICE_SECONDS = int(os.environ.get("AI_ROUTER_SLICE_SECONDS", "30"))
+
+# Batas atas bucket histogram (ms); latensi di atas bucket terakhir masuk bucket overflow
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+class RollingHistogram:
+    """
+    Histogram latensi per potongan waktu (slice); slice yang lebih tua dari
+    window dibuang, jadi statistik hanya mencerminkan panggilan terbaru.
+    """
+
+    def __init__(self, window_seconds: int, slice_seconds: int):
+        self.window_seconds = window_seconds
+        self.slice_seconds = max(1, slice_seconds)
+        self.slices = deque()  # [slice_start, bucket_counts, errors]
+
+    def _current_slice(self, now: float) -> list:
+        start = now - (now % self.slice_seconds)
+        while self.slices and self.slices[0][0] <= now - self.window_seconds:
+            self.slices.popleft()
+        if not self.slices or self.slices[-1][0] != start:
+            self.slices.append([start, [0] * (len(LATENCY_BUCKETS_MS) + 1), 0])
+        return self.slices[-1]
+
+    def record(self, latency_ms: float, ok: bool, now: float):
+        current = self._current_slice(now)
+        if not ok:
+            # Error (termasuk 429) tidak ikut histogram, supaya gagal-cepat tidak menurunkan p95
+            current[2] += 1
+            return
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                current[1][index] += 1
+                return
+        current[1][-1] += 1
+
+    def _percentile(self, counts: list, total: int, fraction: float) -> int:
+        threshold = total * fraction
+        cumulative = 0
+        for index, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)]
+        return LATENCY_BUCKETS_MS[-1]
+
+    def summary(self, now: float) -> dict:
+        self._current_slice(now)
+        counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        errors = 0
+        for _, slice_counts, slice_errors in self.slices:
+            counts = [a + b for a, b in zip(counts, slice_counts)]
+            errors += slice_errors
+        successes = sum(counts)
+        calls = successes + errors
+        return {
+            "calls": calls,
+            "errors": errors,
+            "error_rate": round(errors / calls, 3) if calls else 0.0,
+            "p50_ms": self._percentile(counts, successes, 0.5) if successes else None,
+            "p95_ms": self._percentile(counts, successes, 0.95) if successes else None,
+        }
+
+
+def _load_policy() -> dict | None:
+    try:
+        with open(AI_MODEL_POLICY_FILE, encoding="utf-8") as f:
+            policy = json.load(f)
+        if not policy.get("tiers"):
+            raise ValueError("policy has no tiers")
+        return policy
+    except (OSError, ValueError) as e:
+        logger.error(f"Model routing policy {AI_MODEL_POLICY_FILE} unusable, routing disabled: {e}")
+        return None
+
+
+_policy = _load_policy() if AI_MODEL_ROUTING_ENABLED else None
+_histograms = {}
+_lock = threading.Lock()
+_route_counts = {}
+
+
+def _histogram(model: str) -> RollingHistogram:
+    histogram = _histograms.get(model)
+    if histogram is None:
+        histogram = _histograms[model] = RollingHistogram(AI_ROUTER_WINDOW_SECONDS, AI_ROUTER_SLICE_SECONDS)
+    return histogram
+
+
+def _is_healthy(tier: dict, now: float) -> bool:
+    summary = _histogram(tier["model"]).summary(now)
+    if summary["calls"] < _policy.get("min_samples", 20):
+        return True  # Data belum cukup: anggap sehat
+    if summary["error_rate"] > tier.get("max_error_rate", 1.0):
+        return False
+    max_p95 = tier.get("max_p95_ms")
+    return not (max_p95 and summary["p95_ms"] and summary["p95_ms"] > max_p95)
+
+
+def choose_model(text_length: int, path: str, default_model: str) -> str:
+    """
+    Pilih model untuk input sepanjang text_length karakter di path tertentu.
+    default_model dipakai jika routing dimatikan atau policy tidak bisa dibaca.
+    """
+    if not _policy:
+        return default_model
+
+    tiers = [tier for tier in _policy["tiers"] if tier.get("enabled", True)]
+    if not tiers:
+        return default_model
+    names = [tier["name"] for tier in tiers]
+    min_tier = _policy.get("paths", {}).get(path, {}).get("min_tier")
+    start = names.index(min_tier) if min_tier in names else 0
+    # Naik sampai tier yang sanggup menampung panjang input
+    while start < len(tiers) - 1 and (tiers[start].get("max_input_chars") or float("inf")) < text_length:
+        start += 1
+
+    now = time.monotonic()
+    with _lock:
+        # Prioritas: tier awal, tier lebih kuat, lalu (terakhir) tier lebih murah
+        chosen = tiers[start]
+        for tier in tiers[start:] + tiers[:start][::-1]:
+            if _is_healthy(tier, now):
+                chosen = tier
+                break
+        key = f"{path}:{chosen['name']}"
+        _route_counts[key] = _route_counts.get(key, 0) + 1
+
+    if chosen is not tiers[start]:
+        logger.warning(f"Model router: {tiers[start]['model']} unhealthy, using {chosen['model']}")
+    return chosen["model"]
+
+
+def record(model: str, latency_seconds: float, ok: bool):
+    with _lock:
+        _histogram(model).record(latency_seconds * 1000, ok, time.monotonic())
+
+
+def observed(model: str, fn):
+    """
+    Bungkus fn supaya latensi / error setiap panggilan model tercatat di histogram.
+    """
+    def call(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            record(model, time.monotonic() - start, ok=False)
+            raise
+        record(model, time.monotonic() - start, ok=True)
+        return result
+    return call
+
+
+def get_stats() -> dict:
+    now = time.monotonic()
+    with _lock:
+        return {
+            "enabled": bool(_policy),
+            "routes": dict(_route_counts),
+            "models": {model: histogram.summary(now) for model, histogram in _histograms.items()},
+        }
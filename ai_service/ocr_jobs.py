@@ -0,0 +1,140 @@
+import os
+import json
+import uuid
+import logging
+from datetime import datetime, timezone
+from azure.core.exceptions import ResourceNotFoundError
+
+import azure_clients
+
+# ==========================================
+# JOB OCR ASINKRON
+# POST ai/ocr/jobs membuat job (Table Storage) lalu mengirim pesan ke queue
+# OCR_JOB_QUEUE_NAME; OcrJobProcessor (queue trigger) menjalankan Azure OCR +
+# Gemini di background dan menulis hasilnya ke job. Jika request menyertakan
+# 'context' bertanda tangan (ocr_context), hasil juga di-push ke queue
+# OCR_RESULT_QUEUE_NAME (konfigurasi server, bukan dari request) bersama context itu.
+#
+# Status: queued -> running (stage: analyzing_document / categorizing) -> succeeded | failed
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+STORAGE_CONN_STR = os.environ.get("STORAGE_CONN_STR")
+OCR_JOB_QUEUE_NAME = os.environ.get("OCR_JOB_QUEUE_NAME", "ocr-jobs")
+OCR_JOB_TABLE = os.environ.get("OCR_JOB_TABLE", "ocrjobs")
+OCR_RESULT_QUEUE_NAME = os.environ.get("OCR_RESULT_QUEUE_NAME", "ocr-results")
+
+JOB_ROW_KEY = "job"
+
+_table_ready = False
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _get_table():
+    global _table_ready
+    table = azure_clients.get_table_client(STORAGE_CONN_STR, OCR_JOB_TABLE)
+    if not _table_ready:
+        try:
+            table.create_table()
+        except Exception:
+            pass  # Sudah ada
+        _table_ready = True
+    return table
+
+
+def _send(queue_name: str, payload: dict):
+    queue_client = azure_clients.get_queue_client(STORAGE_CONN_STR, queue_name)
+    try:
+        queue_client.send_message(json.dumps(payload))
+    except Exception:
+        queue_client.create_queue()
+        queue_client.send_message(json.dumps(payload))
+
+
+def _to_job(entity: dict) -> dict:
+    job = {
+        "job_id": entity["PartitionKey"],
+        "status": entity.get("status"),
+        "stage": entity.get("stage"),
+        "attempts": entity.get("attempts", 0),
+        "created_at": entity.get("created_at"),
+        "updated_at": entity.get("updated_at"),
+    }
+    if entity.get("result"):
+        job["result"] = json.loads(entity["result"])
+    if entity.get("error"):
+        job["error"] = entity["error"]
+    return job
+
+
+def submit_job(image_url: str, instructions: dict, context: dict | None = None,
+               context_signature: str | None = None, image_sha256: str | None = None) -> dict:
+    """
+    Buat job baru (status queued) dan kirim ke queue OCR. Return data job.
+    context harus sudah diverifikasi caller (ocr_context.verify).
+    """
+    job_id = str(uuid.uuid4())
+    now = _now()
+    _get_table().create_entity({
+        "PartitionKey": job_id,
+        "RowKey": JOB_ROW_KEY,
+        "status": "queued",
+        "stage": "queued",
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+    _send(OCR_JOB_QUEUE_NAME, {
+        "job_id": job_id,
+        "image_url": image_url,
+        "instructions": instructions,
+        "image_sha256": image_sha256,
+        "context": context,
+        "context_signature": context_signature,
+    })
+    logger.info(f"OCR job {job_id} queued")
+    return {"job_id": job_id, "status": "queued", "created_at": now}
+
+
+def get_job(job_id: str) -> dict | None:
+    try:
+        return _to_job(_get_table().get_entity(partition_key=job_id, row_key=JOB_ROW_KEY))
+    except ResourceNotFoundError:
+        return None
+
+
+def update_job(job_id: str, **fields):
+    """
+    Merge field ke entity job (status, stage, attempts, result, error).
+    """
+    entity = {"PartitionKey": job_id, "RowKey": JOB_ROW_KEY, "updated_at": _now()}
+    for key, value in fields.items():
+        entity[key] = json.dumps(value) if key == "result" else value
+    _get_table().upsert_entity(entity)  # default mode MERGE
+
+
+def complete_job(message: dict, result: dict | None, error: str | None = None):
+    """
+    Tandai job selesai (succeeded/failed) dan push hasil ke OCR_RESULT_QUEUE_NAME
+    jika job punya context.
+    """
+    job_id = message["job_id"]
+    if error:
+        update_job(job_id, status="failed", stage="done", error=error)
+    else:
+        # error dikosongkan: percobaan sebelumnya mungkin sempat menulis error
+        update_job(job_id, status="succeeded", stage="done", result=result, error="")
+
+    if message.get("context"):
+        _send(OCR_RESULT_QUEUE_NAME, {
+            "job_id": job_id,
+            "status": "failed" if error else "succeeded",
+            "result": result,
+            "error": error,
+            "context": message["context"],
+            "context_signature": message.get("context_signature"),
+        })
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+# ==========================================
+# RATE LIMITING ADAPTIF UNTUK GEMINI & AZURE OCR
+# Per model / backend:
+# - Token bucket (rps + burst) membatasi laju request.
+# - Concurrency AIMD: limit naik +1 per "window" sukses, turun setengah
+#   saat kena 429/503, jadi throughput menetap tepat di bawah kuota.
+# - Retry dengan exponential backoff + full jitter untuk error throttle.
+#
+# Konfigurasi per model lewat AI_RATE_LIMITS (JSON), mis.:
+# {"gemini-2.5-flash": {"rps": 5, "burst": 10, "max_concurrency": 8},
+#  "azure-ocr": {"rps": 1, "burst": 2, "max_concurrency": 2}}
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    "rps": float(os.environ.get("AI_RATE_LIMIT_RPS", "5")),
+    "burst": float(os.environ.get("AI_RATE_LIMIT_BURST", "10")),
+    "initial_concurrency": 4,
+    "min_concurrency": 1,
+    "max_concurrency": 16,
+}
+AI_RATE_LIMIT_MAX_RETRIES = int(os.environ.get("AI_RATE_LIMIT_MAX_RETRIES", "4"))
+AI_RATE_LIMIT_BACKOFF_BASE = float(os.environ.get("AI_RATE_LIMIT_BACKOFF_BASE", "0.5"))
+AI_RATE_LIMIT_BACKOFF_CAP = float(os.environ.get("AI_RATE_LIMIT_BACKOFF_CAP", "8"))
+# Batas waktu menunggu slot sebelum menyerah (caller HTTP punya timeout sendiri)
+AI_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("AI_RATE_LIMIT_MAX_WAIT_SECONDS", "20"))
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class RateLimitExceeded(RuntimeError):
+    """Kuota habis: slot tidak didapat dalam batas waktu atau retry throttle habis."""
+
+
+def _load_overrides() -> dict:
+    raw = os.environ.get("AI_RATE_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        logger.error("AI_RATE_LIMITS is not valid JSON, using defaults")
+        return {}
+
+
+def is_throttle_error(e: Exception) -> bool:
+    """
+    429/503 dari Gemini (APIError.code) atau Azure (HttpResponseError.status_code).
+    """
+    status = getattr(e, "code", None) or getattr(e, "status_code", None)
+    return status in THROTTLE_STATUS_CODES
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, rps: float, burst: float, initial_concurrency: int,
+                 min_concurrency: int, max_concurrency: int):
+        self.name = name
+        self.rps = rps
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "rejected": 0, "errors": 0}
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rps)
+        self.updated_at = now
+
+    def acquire(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.in_flight < int(self.limit) and self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.stats["rejected"] += 1
+                        raise RateLimitExceeded(f"{self.name}: no capacity within {timeout}s")
+                    # Tunggu token berikutnya atau slot concurrency dilepas
+                    token_wait = (1 - self.tokens) / self.rps if self.tokens < 1 and self.rps > 0 else remaining
+                    self._cond.wait(min(remaining, max(token_wait, 0.01)))
+            finally:
+                self.waiting -= 1
+
+    def release(self, outcome: str):
+        """
+        outcome: 'success' (additive increase), 'throttled' (multiplicative decrease), 'error'.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.stats["calls"] += 1
+            if outcome in ("throttled", "error"):
+                self.stats["throttled" if outcome == "throttled" else "errors"] += 1
+            if outcome == "success":
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+            elif outcome == "throttled":
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            self._cond.notify_all()
+
+    def count(self, key: str):
+        with self._cond:
+            self.stats[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                **self.stats,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "tokens": round(self.tokens, 2),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_overrides = _load_overrides()
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    limiter = _limiters.get(name)
+    if limiter is not None:
+        return limiter
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            config = {**DEFAULT_LIMITS, **_overrides.get(name, {})}
+            limiter = AdaptiveLimiter(
+                name,
+                rps=float(config["rps"]),
+                burst=float(config["burst"]),
+                initial_concurrency=int(config["initial_concurrency"]),
+                min_concurrency=int(config["min_concurrency"]),
+                max_concurrency=int(config["max_concurrency"]),
+            )
+            _limiters[name] = limiter
+    return limiter
+
+
+def call_with_limits(name: str, fn, *args, **kwargs):
+    """
+    Jalankan fn di bawah limiter 'name'. Error throttle di-retry dengan
+    backoff eksponensial + full jitter; error lain langsung diteruskan.
+    """
+    limiter = get_limiter(name)
+    for attempt in range(AI_RATE_LIMIT_MAX_RETRIES + 1):
+        limiter.acquire(AI_RATE_LIMIT_MAX_WAIT_SECONDS)
+        outcome = "error"
+        try:
+            result = fn(*args, **kwargs)
+            outcome = "success"
+            return result
+        except Exception as e:
+            if not is_throttle_error(e):
+                raise
+            outcome = "throttled"
+            if attempt == AI_RATE_LIMIT_MAX_RETRIES:
+                raise RateLimitExceeded(f"{name}: still throttled after {attempt + 1} attempts: {e}") from e
+        finally:
+            limiter.release(outcome)
+
+        delay = random.uniform(0, min(AI_RATE_LIMIT_BACKOFF_CAP, AI_RATE_LIMIT_BACKOFF_BASE * (2 ** attempt)))
+        limiter.count("retries")
+        logger.warning(f"{name} throttled, retry {attempt + 1} in {delay:.2f}s")
+        time.sleep(delay)
+
+
+def get_stats() -> dict:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.snapshot() for limiter in limiters}
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass, field
+
+# ==========================================
+# PARSER LOKAL TEKS STRUK (SEBELUM FALLBACK GEMINI)
+# Dipakai saat field terstruktur Azure kosong: cari baris TOTAL/JUMLAH,
+# parse nominal format Indonesia ("66.900" -> 66900), ambil kandidat merchant
+# dari header, lalu potong teks jadi baris yang relevan saja. Jika total &
+# merchant jelas dan merchant dikenal, Gemini bisa dilewati sama sekali.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_MAX_ITEM_LINES = int(os.environ.get("RECEIPT_MAX_ITEM_LINES", "15"))
+
+# Urutan = prioritas (keyword paling spesifik dulu)
+TOTAL_KEYWORDS = ["GRAND TOTAL", "TOTAL BAYAR", "TOTAL BELANJA", "TOTAL HARGA", "JUMLAH BAYAR",
+                  "TOTAL", "JUMLAH", "TAGIHAN"]
+# Baris yang mengandung kata ini BUKAN total akhir
+NON_TOTAL_KEYWORDS = ["SUBTOTAL", "SUB TOTAL", "TOTAL ITEM", "TOTAL QTY", "JUMLAH ITEM", "TOTAL DISKON",
+                      "KEMBALI", "KEMBALIAN", "TUNAI", "CASH", "DEBIT", "PPN", "PAJAK", "HEMAT"]
+HEADER_SKIP_KEYWORDS = ["JL", "JLN", "JALAN", "TELP", "TEL", "NPWP", "NO", "KASIR", "TANGGAL", "STRUK",
+                        "RT", "RW", "KEL", "KEC", "WWW", "HTTP"]
+
+# Merchant berantai -> kategori. Hanya dipakai jika nama kategori ada di system prompt
+# caller, supaya hasil tetap salah satu kategori yang diizinkan.
+DEFAULT_MERCHANT_CATEGORIES = {
+    "INDOMARET": ("Kebutuhan Harian", "Expense"),
+    "ALFAMART": ("Kebutuhan Harian", "Expense"),
+    "ALFAMIDI": ("Kebutuhan Harian", "Expense"),
+    "SUPERINDO": ("Kebutuhan Harian", "Expense"),
+    "HYPERMART": ("Kebutuhan Harian", "Expense"),
+    "LOTTE MART": ("Kebutuhan Harian", "Expense"),
+    "TRANSMART": ("Kebutuhan Harian", "Expense"),
+    "STARBUCKS": ("Makanan & Minuman", "Expense"),
+    "KOPI KENANGAN": ("Makanan & Minuman", "Expense"),
+    "JANJI JIWA": ("Makanan & Minuman", "Expense"),
+    "MCDONALD": ("Makanan & Minuman", "Expense"),
+    "KFC": ("Makanan & Minuman", "Expense"),
+    "HOKBEN": ("Makanan & Minuman", "Expense"),
+    "PIZZA HUT": ("Makanan & Minuman", "Expense"),
+    "SOLARIA": ("Makanan & Minuman", "Expense"),
+    "PERTAMINA": ("Transportasi", "Expense"),
+    "SHELL": ("Transportasi", "Expense"),
+}
+
+_DATE_PATTERN = re.compile(r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b")
+_AMOUNT_PATTERN = re.compile(r"(?:RP\.?\s*)?(\d{1,3}(?:[.,]\d{3})+(?:,\d{1,2})?|\d{4,})(?:,-)?")
+
+
+@dataclass
+class ParsedReceipt:
+    total: float = 0.0
+    total_line: str = ""
+    total_keyword: str = ""
+    merchant_candidates: list = field(default_factory=list)
+    relevant_lines: list = field(default_factory=list)
+
+    @property
+    def merchant(self) -> str | None:
+        return self.merchant_candidates[0] if self.merchant_candidates else None
+
+    @property
+    def is_confident(self) -> bool:
+        return self.total > 0 and bool(self.merchant_candidates)
+
+
+def _load_merchant_categories() -> dict:
+    merchants = dict(DEFAULT_MERCHANT_CATEGORIES)
+    raw = os.environ.get("RECEIPT_MERCHANT_CATEGORIES")
+    if raw:
+        try:
+            for name, value in json.loads(raw).items():
+                merchants[name.upper()] = (value["category_name"], value.get("category_type", "Expense"))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"RECEIPT_MERCHANT_CATEGORIES invalid, using defaults: {e}")
+    return merchants
+
+
+MERCHANT_CATEGORIES = _load_merchant_categories()
+
+
+def parse_amount(text: str) -> float:
+    """
+    Nominal terbesar di satu baris, format Indonesia: '66.900' -> 66900,
+    'Rp 1.234.567,50' -> 1234567.5, '150000' -> 150000. Return 0.0 jika tidak ada.
+    """
+    best = 0.0
+    for raw in _AMOUNT_PATTERN.findall((text or "").upper()):
+        if re.fullmatch(r"\d{1,3}(,\d{3})+", raw):
+            # Format Inggris "66,900" juga pemisah ribuan
+            value = float(raw.replace(",", ""))
+        else:
+            integer, _, decimal = raw.partition(",") if re.search(r",\d{1,2}$", raw) else (raw, "", "")
+            value = float(integer.replace(".", "").replace(",", "") + (f".{decimal}" if decimal else ""))
+        best = max(best, value)
+    return best
+
+
+def _has_keyword(line: str, keywords: list[str]) -> str | None:
+    for keyword in keywords:
+        if re.search(rf"(?<![A-Z]){re.escape(keyword)}(?![A-Z])", line):
+            return keyword
+    return None
+
+
+def _merchant_candidates(lines: list[str]) -> list[str]:
+    candidates = []
+    for line in lines[:6]:
+        upper = line.upper()
+        letters = sum(ch.isalpha() for ch in line)
+        if letters < 3 or letters < len(line.replace(" ", "")) * 0.6:
+            continue
+        if _has_keyword(upper, HEADER_SKIP_KEYWORDS):
+            continue
+        candidates.append(line.strip())
+        if len(candidates) == 3:
+            break
+    return candidates
+
+
+def parse_receipt(raw_text: str) -> ParsedReceipt:
+    lines = [line.strip() for line in (raw_text or "").splitlines() if line.strip()]
+    parsed = ParsedReceipt(merchant_candidates=_merchant_candidates(lines))
+
+    # 1. Cari total akhir: keyword paling spesifik, nominal di baris yang sama atau baris berikutnya
+    best_rank = len(TOTAL_KEYWORDS)
+    for index, line in enumerate(lines):
+        upper = line.upper()
+        if _has_keyword(upper, NON_TOTAL_KEYWORDS):
+            continue
+        keyword = _has_keyword(upper, TOTAL_KEYWORDS)
+        if not keyword:
+            continue
+        amount = parse_amount(upper)
+        if amount == 0 and index + 1 < len(lines):
+            amount = parse_amount(lines[index + 1])
+        rank = TOTAL_KEYWORDS.index(keyword)
+        # Keyword sama muncul lagi di bawah -> pakai yang terakhir (total akhir biasanya di bawah)
+        if amount > 0 and rank <= best_rank:
+            best_rank = rank
+            parsed.total, parsed.total_line, parsed.total_keyword = amount, line, keyword
+
+    # 2. Baris relevan: header merchant + baris item (teks + nominal) + baris total
+    item_lines = [
+        line for line in lines
+        if parse_amount(line) > 0 and sum(ch.isalpha() for ch in line) >= 3
+        and not _has_keyword(line.upper(), NON_TOTAL_KEYWORDS + TOTAL_KEYWORDS + HEADER_SKIP_KEYWORDS)
+        and not _DATE_PATTERN.search(line)
+    ]
+    parsed.relevant_lines = parsed.merchant_candidates + item_lines[:RECEIPT_MAX_ITEM_LINES]
+    if parsed.total_line:
+        parsed.relevant_lines.append(parsed.total_line)
+    return parsed
+
+
+def category_hint(merchant_text: str | None, system_prompt: str) -> tuple[str, str] | None:
+    """
+    Kategori untuk merchant berantai yang dikenal, hanya jika nama kategorinya
+    memang termasuk pilihan di system prompt caller.
+    """
+    if not merchant_text:
+        return None
+    upper = merchant_text.upper()
+    for merchant, (category_name, category_type) in MERCHANT_CATEGORIES.items():
+        if merchant in upper and category_name in (system_prompt or ""):
+            return category_name, category_type
+    return None
+
+
+def compact_prompt_text(parsed: ParsedReceipt) -> str:
+    """
+    Ringkasan struk untuk Gemini (pengganti FULL RAW TEXT). Total sudah berupa angka
+    murni, jadi instruksi panjang soal pemisah ribuan tidak diperlukan lagi.
+    """
+    merchant = parsed.merchant or "Unknown"
+    relevant = "\n".join(parsed.relevant_lines)
+    return (
+        f"Merchant: {merchant}. Total: {parsed.total:.0f}.\n"
+        f"Baris relevan dari struk:\n{relevant}"
+    )
@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from azure.core.exceptions import ResourceNotFoundError
+
+import azure_clients
+
+# ==========================================
+# CACHE HASIL KATEGORISASI (ai/language & ai/language/batch)
+# Key = model + hash(system prompt) + AI_RESULT_CACHE_VERSION + hash(teks ternormalisasi),
+# jadi transaksi berulang ("Gojek 25rb") tidak memanggil Gemini lagi, dan
+# perubahan CATEGORIZATION_PROMPT / model otomatis memakai namespace baru.
+#
+# Hasil OCR struk juga di-cache dengan key SHA-256 byte gambar (get_ocr/put_ocr),
+# jadi foto yang sama diupload dua kali tidak memanggil Azure OCR & Gemini lagi.
+#
+# Tier 1: LRU in-process (per worker).
+# Tier 2 (opsional): Azure Table Storage jika AI_RESULT_CACHE_CONN_STR diset,
+#   PartitionKey = namespace, RowKey = hash teks. Namespace lama bisa dihapus
+#   eksplisit lewat invalidate().
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+AI_RESULT_CACHE_ENABLED = os.environ.get("AI_RESULT_CACHE_ENABLED", "true").lower() == "true"
+AI_RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("AI_RESULT_CACHE_MAX_ENTRIES", "5000"))
+AI_RESULT_CACHE_TTL_SECONDS = int(os.environ.get("AI_RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Naikkan manual untuk membuang semua hasil lama tanpa mengubah prompt
+AI_RESULT_CACHE_VERSION = os.environ.get("AI_RESULT_CACHE_VERSION", "1")
+AI_RESULT_CACHE_CONN_STR = os.environ.get("AI_RESULT_CACHE_CONN_STR")
+AI_RESULT_CACHE_TABLE = os.environ.get("AI_RESULT_CACHE_TABLE", "airesultcache")
+
+# Hasil OCR disimpan di namespace terpisah, key = SHA-256 byte gambar
+OCR_NAMESPACE_PREFIX = "ocr-"
+
+_cache = OrderedDict()   # (namespace, text_hash) -> (expires_at, result)
+_lock = threading.Lock()
+_stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0}
+_table_ready = False
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase, rapikan spasi dan buang tanda baca di ujung.
+    Angka tetap dipertahankan karena hasil mengandung amount.
+    """
+    text = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    return text.strip(" .,;:!?-")
+
+
+def namespace_for(system_prompt: str, model_name: str) -> str:
+    prompt_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()[:16]
+    # PartitionKey Table Storage tidak boleh mengandung '/', '\\', '#', '?'
+    safe_model = re.sub(r"[^A-Za-z0-9._-]", "_", model_name or "")
+    return f"{safe_model}-{prompt_hash}-v{AI_RESULT_CACHE_VERSION}"
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def _get_table():
+    global _table_ready
+    table = azure_clients.get_table_client(AI_RESULT_CACHE_CONN_STR, AI_RESULT_CACHE_TABLE)
+    if not _table_ready:
+        try:
+            table.create_table()
+        except Exception:
+            pass  # Sudah ada
+        _table_ready = True
+    return table
+
+
+def _remember(key: tuple, expires_at: float, result: dict):
+    with _lock:
+        _cache[key] = (expires_at, result)
+        _cache.move_to_end(key)
+        while len(_cache) > AI_RESULT_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _lookup(namespace: str, key_hash: str) -> dict | None:
+    key = (namespace, key_hash)
+    now = time.time()
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return dict(entry[1])
+        if entry:
+            del _cache[key]
+
+    if AI_RESULT_CACHE_CONN_STR:
+        try:
+            entity = _get_table().get_entity(partition_key=namespace, row_key=key_hash)
+            if float(entity.get("expires_at", 0)) > now:
+                result = json.loads(entity["result"])
+                _remember(key, float(entity["expires_at"]), result)
+                _count("shared_hits")
+                return dict(result)
+        except ResourceNotFoundError:
+            pass
+        except Exception as e:
+            # Storage bermasalah: perlakukan sebagai miss
+            logger.warning(f"AI result cache read failed: {e}")
+
+    _count("misses")
+    return None
+
+
+def _store(namespace: str, key_hash: str, result: dict):
+    expires_at = time.time() + AI_RESULT_CACHE_TTL_SECONDS
+    _remember((namespace, key_hash), expires_at, dict(result))
+    _count("stores")
+
+    if AI_RESULT_CACHE_CONN_STR:
+        try:
+            _get_table().upsert_entity({
+                "PartitionKey": namespace,
+                "RowKey": key_hash,
+                "result": json.dumps(result),
+                "expires_at": expires_at,
+            })
+        except Exception as e:
+            logger.warning(f"AI result cache write failed: {e}")
+
+
+def get(text: str, system_prompt: str, model_name: str) -> dict | None:
+    """
+    Cari hasil kategorisasi untuk teks ini. Return copy dict hasil atau None.
+    """
+    if not AI_RESULT_CACHE_ENABLED:
+        return None
+    return _lookup(namespace_for(system_prompt, model_name), _text_hash(text))
+
+
+def put(text: str, system_prompt: str, model_name: str, result: dict):
+    """
+    Simpan hasil kategorisasi yang SUKSES (jangan simpan hasil error).
+    """
+    if not AI_RESULT_CACHE_ENABLED:
+        return
+    _store(namespace_for(system_prompt, model_name), _text_hash(text), result)
+
+
+def get_ocr(image_sha256: str, system_prompt: str, model_name: str) -> dict | None:
+    """
+    Hasil OCR + kategorisasi untuk gambar dengan digest SHA-256 ini (content-addressed).
+    """
+    if not AI_RESULT_CACHE_ENABLED or not image_sha256:
+        return None
+    return _lookup(f"{OCR_NAMESPACE_PREFIX}{namespace_for(system_prompt, model_name)}", image_sha256.lower())
+
+
+def put_ocr(image_sha256: str, system_prompt: str, model_name: str, result: dict):
+    if not AI_RESULT_CACHE_ENABLED or not image_sha256:
+        return
+    _store(f"{OCR_NAMESPACE_PREFIX}{namespace_for(system_prompt, model_name)}", image_sha256.lower(), result)
+
+
+def invalidate(system_prompt: str | None = None, model_name: str | None = None) -> int:
+    """
+    Hapus cache. Tanpa argumen: kosongkan LRU lokal saja. Dengan prompt + model:
+    hapus namespace itu di LRU dan di Table Storage. Return jumlah entri shared yang dihapus.
+    """
+    if system_prompt is None or model_name is None:
+        with _lock:
+            _cache.clear()
+        return 0
+
+    namespace = namespace_for(system_prompt, model_name)
+    namespaces = (namespace, f"{OCR_NAMESPACE_PREFIX}{namespace}")
+    with _lock:
+        for key in [k for k in _cache if k[0] in namespaces]:
+            del _cache[key]
+
+    deleted = 0
+    if AI_RESULT_CACHE_CONN_STR:
+        table = _get_table()
+        for partition in namespaces:
+            entities = table.query_entities(
+                "PartitionKey eq @pk", parameters={"pk": partition}, select=["PartitionKey", "RowKey"]
+            )
+            batch = []
+            for entity in entities:
+                batch.append(("delete", entity))
+                if len(batch) == 100:  # Batas satu transaksi Table Storage
+                    table.submit_transaction(batch)
+                    deleted += len(batch)
+                    batch = []
+            if batch:
+                table.submit_transaction(batch)
+                deleted += len(batch)
+    logger.info(f"AI result cache invalidated: {namespace} ({deleted} shared entries)")
+    return deleted
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_cache)}
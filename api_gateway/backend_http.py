@@ -0,0 +1,127 @@
+import os
+import json
+import socket
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+# ==========================================
+# KONEKSI HTTP GATEWAY -> BACKEND FUNCTION APP
+# Satu requests.Session (connection pool keep-alive) per host backend, dibuat
+# lazy lalu dipakai ulang oleh semua invocation di worker ini, jadi proxy tidak
+# membuka TCP + TLS baru per request. Setiap request punya timeout connect &
+# read terpisah per route, supaya backend lambat tidak menahan worker gateway.
+#
+# Timeout per route lewat GATEWAY_ROUTE_TIMEOUTS (JSON, prefix path terpanjang menang), mis.:
+# {"ai/ocr": {"read": 60}, "report": {"connect": 2, "read": 20}}
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_HTTP_POOL_SIZE = int(os.environ.get("GATEWAY_HTTP_POOL_SIZE", "20"))
+# true: tunggu koneksi bebas saat pool penuh; false: buka koneksi tambahan (tidak disimpan)
+GATEWAY_HTTP_POOL_BLOCK = os.environ.get("GATEWAY_HTTP_POOL_BLOCK", "false").lower() == "true"
+GATEWAY_HTTP_KEEPALIVE = os.environ.get("GATEWAY_HTTP_KEEPALIVE", "true").lower() == "true"
+# TCP keepalive menjaga koneksi idle tetap hidup (load balancer Azure memutus idle ~4 menit)
+GATEWAY_TCP_KEEPALIVE_IDLE_SECONDS = int(os.environ.get("GATEWAY_TCP_KEEPALIVE_IDLE_SECONDS", "60"))
+# Retry hanya untuk gagal connect (request belum terkirim, aman untuk semua method)
+GATEWAY_HTTP_CONNECT_RETRIES = int(os.environ.get("GATEWAY_HTTP_CONNECT_RETRIES", "1"))
+
+GATEWAY_CONNECT_TIMEOUT = float(os.environ.get("GATEWAY_CONNECT_TIMEOUT", "3.05"))
+GATEWAY_READ_TIMEOUT = float(os.environ.get("GATEWAY_READ_TIMEOUT", "30"))
+DEFAULT_ROUTE_TIMEOUTS = {
+    "ai/ocr": {"read": 60},
+    "ai/language/batch": {"read": 120},
+    "transaction": {"read": 60},  # Upload foto struk (normalisasi + blob)
+}
+
+
+def _load_route_timeouts() -> dict:
+    timeouts = dict(DEFAULT_ROUTE_TIMEOUTS)
+    raw = os.environ.get("GATEWAY_ROUTE_TIMEOUTS")
+    if raw:
+        try:
+            timeouts.update(json.loads(raw))
+        except json.JSONDecodeError:
+            logger.error("GATEWAY_ROUTE_TIMEOUTS is not valid JSON, using defaults")
+    return timeouts
+
+
+ROUTE_TIMEOUTS = _load_route_timeouts()
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _socket_options() -> list:
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # Opsi detail keepalive hanya ada di Linux (image Functions)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options += [
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, GATEWAY_TCP_KEEPALIVE_IDLE_SECONDS),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, GATEWAY_TCP_KEEPALIVE_IDLE_SECONDS // 4)),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 4),
+        ]
+    return options
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _socket_options()
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = _KeepAliveAdapter(
+        pool_connections=1,  # Session ini hanya untuk satu host
+        pool_maxsize=GATEWAY_HTTP_POOL_SIZE,
+        pool_block=GATEWAY_HTTP_POOL_BLOCK,
+        max_retries=Retry(total=GATEWAY_HTTP_CONNECT_RETRIES, connect=GATEWAY_HTTP_CONNECT_RETRIES,
+                          read=0, status=0, other=0, redirect=0, raise_on_status=False),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not GATEWAY_HTTP_KEEPALIVE:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Session pooled untuk host backend dari url (scheme + host + port).
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _build_session()
+            logger.info(f"Backend HTTP session created: {key}")
+    return session
+
+
+def timeout_for(path: str) -> tuple[float, float]:
+    """
+    (connect, read) timeout untuk path gateway; prefix terpanjang di ROUTE_TIMEOUTS menang.
+    """
+    config = {}
+    matched = ""
+    for prefix, value in ROUTE_TIMEOUTS.items():
+        if path.startswith(prefix) and len(prefix) > len(matched):
+            matched, config = prefix, value
+    return (float(config.get("connect", GATEWAY_CONNECT_TIMEOUT)), float(config.get("read", GATEWAY_READ_TIMEOUT)))
+
+
+def request(method: str, url: str, path: str, **kwargs) -> requests.Response:
+    """
+    Kirim request ke backend lewat session pooled host-nya dengan timeout route path.
+    """
+    return get_session(url).request(method, url, timeout=timeout_for(path), **kwargs)
@@ -5,9 +5,9 @@ import os
 import requests
 import uuid
 from datetime import datetime
-from azure.eventgrid import EventGridPublisherClient
-from azure.core.credentials import AzureKeyCredential
-import jwt
+import azure_clients
+import token_verifier
+import backend_http
 
 app = func.FunctionApp()
 
@@ -16,24 +16,46 @@ IS_LOCAL_DEMO = os.getenv("IS_LOCAL_DEMO", "false").lower() == "true"
 EVENTGRID_ENDPOINT = os.getenv("EVENTGRID_TOPIC_ENDPOINT")
 EVENTGRID_KEY = os.getenv("EVENTGRID_ACCESS_KEY")
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET") 
-JWT_ALGORITHM = "HS256"
+# Teruskan identitas yang sudah diverifikasi ke backend (header X-FinTrack-Identity
+# bertanda tangan HMAC) supaya backend tidak perlu decode JWT ulang
+FORWARD_IDENTITY_HEADER = os.getenv("FORWARD_IDENTITY_HEADER", "false").lower() == "true"
+
+# Endpoint antar-service / admin (dipanggil langsung dengan function key, bukan lewat gateway)
+INTERNAL_ONLY_PREFIXES = [
+    "ai/ocr/jobs",
+    "ai/cache",
+    "ai/stats",
+]
+
+def _is_internal_path(path: str) -> bool:
+    """
+    True jika path (dinormalisasi: huruf kecil, tanpa segmen kosong) termasuk endpoint internal.
+    """
+    normalized = "/".join(segment for segment in path.lower().split("/") if segment)
+    return any(normalized == prefix or normalized.startswith(prefix + "/") for prefix in INTERNAL_ONLY_PREFIXES)
 
 # --- HELPER: VALIDASI TOKEN ---
 def _get_user_info_from_token(req: func.HttpRequest) -> dict | None:
-    auth_header = req.headers.get('Authorization')
-    if not auth_header:
-        return None
-    try:
-        # Format: "Bearer <token>"
-        token = auth_header.split(' ')[1]
-        
-        # Decode dan validasi signature menggunakan Secret Key kita
-        decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return decoded
-    except Exception as e:
-        logging.error(f"Token invalid: {e}")
-        return None
+    """
+    Validasi Token JWT dan return payloadnya (lewat token_verifier, dengan cache).
+    Header identitas dari client tidak dipercaya di gateway.
+    """
+    return token_verifier.verify_request(req, allow_identity_header=False)
+
+def _build_forward_headers(req: func.HttpRequest, user_info: dict | None, excluded: list[str]) -> dict:
+    """
+    Salin header request client untuk diteruskan ke backend.
+    Header identitas dari client SELALU dibuang (anti spoofing); jika
+    FORWARD_IDENTITY_HEADER aktif, gateway menyisipkan versi yang ditandatanganinya sendiri.
+    """
+    excluded = [h.lower() for h in excluded] + [token_verifier.IDENTITY_HEADER.lower()]
+    fwd_headers = {k: v for k, v in req.headers.items() if k.lower() not in excluded}
+
+    if FORWARD_IDENTITY_HEADER and user_info:
+        signed_identity = token_verifier.sign_identity(user_info)
+        if signed_identity:
+            fwd_headers[token_verifier.IDENTITY_HEADER] = signed_identity
+    return fwd_headers
 
 # ---------------------------------------------------------------------------
 # 1. FUNGSI KHUSUS: Report Generation
@@ -102,7 +124,7 @@ def RequestReportGeneration(req: func.HttpRequest) -> func.HttpResponse:
         if IS_LOCAL_DEMO:
             logging.warning(f"MODE DEMO: Event 'ReportGeneration.Requested' simulated. ID: {request_id}")
         else:
-            client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+            client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
             client.send([report_request_event])
             logging.info(f"Event sent to Event Grid. ID: {request_id}")
 
@@ -136,6 +158,10 @@ def gateway(req: func.HttpRequest) -> func.HttpResponse:
         
         logging.info(f"Gateway proxying request to: {path}")
 
+        if _is_internal_path(path):
+            logging.warning(f"Gateway blocked internal endpoint: {path}")
+            return func.HttpResponse(json.dumps({"error": "Forbidden"}), status_code=403, mimetype="application/json")
+
         # --- 1. SECURITY CHECK (FRONTEND) ---
         # Masukkan endpoint AI ke sini agar lolos pengecekan token
         public_endpoints = [
@@ -146,6 +172,7 @@ def gateway(req: func.HttpRequest) -> func.HttpResponse:
         ]
         
         # Cek Token HANYA JIKA path tidak ada di daftar public
+        user_info = None
         if path not in public_endpoints:
             user_info = _get_user_info_from_token(req)
             if not user_info:
@@ -154,9 +181,8 @@ def gateway(req: func.HttpRequest) -> func.HttpResponse:
                     status_code=401, 
                     mimetype="application/json"
                 )
-            
-            # (Opsional) Inject User ID ke Header untuk service lain
-            # req.headers["x-user-id"] = user_info.get("user_id")
+
+            # Identitas terverifikasi diteruskan lewat header bertanda tangan (lihat _build_forward_headers)
         # ------------------------------------
 
         # --- 2. TENTUKAN TARGET & SISIPKAN BACKEND KEY ---
@@ -187,10 +213,7 @@ def gateway(req: func.HttpRequest) -> func.HttpResponse:
         # --- 3. SIAPKAN REQUEST ---
         
         # A. Headers
-        fwd_headers = {
-            k: v for k, v in req.headers.items() 
-            if k.lower() not in ['host', 'content-length']
-        }
+        fwd_headers = _build_forward_headers(req, user_info, ['host', 'content-length'])
 
         # B. Inject Function Key (Agar Backend AI mau menerima request dari Gateway)
         if backend_key:
@@ -202,13 +225,14 @@ def gateway(req: func.HttpRequest) -> func.HttpResponse:
         except:
             req_body = None
 
-        # --- 4. KIRIM REQUEST KE BACKEND ---
-        resp = requests.request(
-            method=method,
-            url=target_url,
+        # --- 4. KIRIM REQUEST KE BACKEND (session pooled per host + timeout per route) ---
+        resp = backend_http.request(
+            method,
+            target_url,
+            path,
             headers=fwd_headers,
             data=req_body,
-            params=req.params 
+            params=req.params
         )
         
         # --- 5. KEMBALIKAN RESPONSE ---
@@ -218,6 +242,12 @@ def gateway(req: func.HttpRequest) -> func.HttpResponse:
             mimetype=resp.headers.get('Content-Type', 'application/json')
         )
 
+    except requests.exceptions.Timeout as e:
+        logging.error(f"Gateway Timeout ({path}): {e}")
+        return func.HttpResponse(json.dumps({"error": "Backend service timed out"}), status_code=504, mimetype="application/json")
+    except requests.exceptions.ConnectionError as e:
+        logging.error(f"Gateway Connection Error ({path}): {e}")
+        return func.HttpResponse(json.dumps({"error": "Backend service unreachable"}), status_code=502, mimetype="application/json")
     except Exception as e:
         logging.error(f"Gateway Error: {str(e)}")
         return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
@@ -253,10 +283,10 @@ def CheckReportStatus(req: func.HttpRequest) -> func.HttpResponse:
         
         # Teruskan Header (termasuk Authorization Token yang sudah divalidasi)
         # Token ini nanti akan divalidasi ULANG oleh report_service untuk mengambil user_id
-        fwd_headers = {key: value for (key, value) in req.headers.items() if key.lower() != 'host'}
+        fwd_headers = _build_forward_headers(req, user_info, ['host'])
 
-        # Panggil Report Service
-        resp = requests.get(target_url, headers=fwd_headers)
+        # Panggil Report Service (session pooled yang sama dengan proxy gateway)
+        resp = backend_http.request("GET", target_url, "report/status", headers=fwd_headers)
 
         return func.HttpResponse(
             resp.content,
@@ -264,6 +294,12 @@ def CheckReportStatus(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+    except requests.exceptions.Timeout as e:
+        logging.error(f"Gateway Status Check Timeout: {e}")
+        return func.HttpResponse(json.dumps({"error": "Report Service timed out"}), status_code=504, mimetype="application/json")
+    except requests.exceptions.ConnectionError as e:
+        logging.error(f"Gateway Status Check Connection Error: {e}")
+        return func.HttpResponse(json.dumps({"error": "Report Service unreachable"}), status_code=502, mimetype="application/json")
     except Exception as e:
         logging.error(f"Gateway Status Check Error: {e}")
         return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
\ No newline at end of file
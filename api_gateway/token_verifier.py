@@ -0,0 +1,158 @@
+import os
+import time
+import json
+import hmac
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import jwt
+
+# ==========================================
+# VERIFIKASI JWT DENGAN CACHE (DIPAKAI SEMUA SERVICE)
+# - Token yang sudah pernah diverifikasi disimpan (key: SHA-256 token) sampai
+#   min(TTL, exp token), jadi request berikutnya tidak perlu decode HMAC ulang.
+# - Gateway bisa meneruskan identitas yang sudah diverifikasi lewat header
+#   X-FinTrack-Identity yang ditandatangani IDENTITY_HEADER_SECRET; backend
+#   yang punya secret yang sama cukup cek HMAC header itu.
+#
+# File ini identik di setiap service yang memvalidasi token.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET")
+JWT_ALGORITHM = "HS256"
+
+TOKEN_CACHE_TTL_SECONDS = int(os.environ.get("TOKEN_CACHE_TTL_SECONDS", "300"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+IDENTITY_HEADER = "X-FinTrack-Identity"
+IDENTITY_HEADER_SECRET = os.environ.get("IDENTITY_HEADER_SECRET")
+IDENTITY_HEADER_MAX_AGE_SECONDS = int(os.environ.get("IDENTITY_HEADER_MAX_AGE_SECONDS", "60"))
+
+_cache = OrderedDict()   # digest -> (expires_at, payload)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalid": 0, "identity_header": 0}
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def verify_token(token: str) -> dict | None:
+    """
+    Validasi JWT dan return payloadnya. Hasil valid di-cache sampai min(TTL, exp).
+    """
+    if not token:
+        return None
+
+    now = time.time()
+    key = _digest(token)
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return dict(entry[1])
+        if entry:
+            del _cache[key]
+        _stats["misses"] += 1
+
+    if not JWT_SECRET_KEY:
+        logger.error("JWT_SECRET missing in configuration")
+        return None
+
+    try:
+        decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except jwt.PyJWTError as e:
+        _count("invalid")
+        logger.warning(f"Token invalid: {e}")
+        return None
+
+    expires_at = now + TOKEN_CACHE_TTL_SECONDS
+    if isinstance(decoded.get("exp"), (int, float)):
+        expires_at = min(expires_at, float(decoded["exp"]))
+
+    with _lock:
+        _cache[key] = (expires_at, decoded)
+        _cache.move_to_end(key)
+        while len(_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return dict(decoded)
+
+
+def _sign(data: bytes) -> str:
+    return hmac.new(IDENTITY_HEADER_SECRET.encode("utf-8"), data, hashlib.sha256).hexdigest()
+
+
+def sign_identity(user_info: dict) -> str | None:
+    """
+    Buat nilai header X-FinTrack-Identity: base64url(payload JSON) + '.' + HMAC-SHA256.
+    Return None jika IDENTITY_HEADER_SECRET tidak diset.
+    """
+    if not IDENTITY_HEADER_SECRET:
+        return None
+    claims = {k: v for k, v in user_info.items() if k != "iat"}
+    claims["iat"] = int(time.time())
+    encoded = base64.urlsafe_b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{encoded.decode('ascii')}.{_sign(encoded)}"
+
+
+def verify_identity_header(value: str) -> dict | None:
+    """
+    Validasi header identitas dari gateway (HMAC, umur header, dan exp token asal).
+    """
+    if not IDENTITY_HEADER_SECRET or not value or "." not in value:
+        return None
+    try:
+        encoded, signature = value.rsplit(".", 1)
+        encoded_bytes = encoded.encode("ascii")
+        if not hmac.compare_digest(_sign(encoded_bytes), signature):
+            _count("invalid")
+            logger.warning("Identity header signature invalid")
+            return None
+        claims = json.loads(base64.urlsafe_b64decode(encoded_bytes))
+    except (ValueError, TypeError):
+        _count("invalid")
+        return None
+
+    now = time.time()
+    if now - claims.get("iat", 0) > IDENTITY_HEADER_MAX_AGE_SECONDS:
+        return None
+    if isinstance(claims.get("exp"), (int, float)) and claims["exp"] <= now:
+        return None
+    _count("identity_header")
+    return claims
+
+
+def verify_request(req, allow_identity_header: bool = True) -> dict | None:
+    """
+    Ambil identitas user dari request: header identitas gateway (jika diaktifkan)
+    atau 'Authorization: Bearer <token>'. Gateway sendiri memanggil dengan
+    allow_identity_header=False karena request-nya datang langsung dari client.
+    """
+    identity = req.headers.get(IDENTITY_HEADER)
+    if allow_identity_header and identity and IDENTITY_HEADER_SECRET:
+        claims = verify_identity_header(identity)
+        if claims:
+            return claims
+
+    auth_header = req.headers.get('Authorization')
+    if not auth_header:
+        return None
+    parts = auth_header.split(' ')
+    if len(parts) != 2 or parts[0].lower() != 'bearer':
+        return None
+    return verify_token(parts[1])
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_cache)}
@@ -2,17 +2,30 @@ import logging
 import json
 import os
 import uuid
+import time
+import base64
+import threading
 import requests
 import azure.functions as func
-from azure.cosmos import CosmosClient, PartitionKey
-from azure.cosmos.exceptions import CosmosResourceNotFoundError
-from azure.storage.queue import QueueClient
+from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
+import azure_clients
+import local_classifier
+import learned_classifier
+import ocr_context
 
 app = func.FunctionApp()
 
 # --- KONFIGURASI ---
 LANGUAGE_ENDPOINT = os.environ.get("AI_SERVICE_LANGUAGE_ENDPOINT")
+LANGUAGE_BATCH_ENDPOINT = os.environ.get("AI_SERVICE_LANGUAGE_BATCH_ENDPOINT")
+LANGUAGE_BATCH_TIMEOUT = int(os.environ.get("AI_SERVICE_LANGUAGE_BATCH_TIMEOUT", "60"))
 OCR_ENDPOINT = os.environ.get("AI_SERVICE_OCR_ENDPOINT")
+# Jika diset, transaksi gambar dikirim sebagai job OCR asinkron (ai/ocr/jobs);
+# hasilnya datang lewat queue OCR_RESULT_QUEUE_NAME (storage account yang sama,
+# nama queue yang sama juga harus diset di AI Service). Context job ditandatangani
+# dengan OCR_CONTEXT_SECRET (lihat ocr_context.py).
+OCR_JOBS_ENDPOINT = os.environ.get("AI_SERVICE_OCR_JOBS_ENDPOINT")
+OCR_RESULT_QUEUE_NAME = os.environ.get("OCR_RESULT_QUEUE_NAME", "ocr-results")
 COSMOS_CONN_STR = os.environ.get("COSMOS_CONN_STR")
 DATABASE_NAME = os.environ.get("COSMOS_DB_NAME")
 CONTAINER_NAME = os.environ.get("COSMOS_CONTAINER_NAME") # Satu container untuk semua
@@ -20,6 +33,12 @@ INPUT_QUEUE_NAME = os.environ.get("STORAGE_QUEUE_NAME")
 OUTPUT_QUEUE_NAME = "transaction-categorized"
 STORAGE_CONN_STR = os.environ.get("STORAGE_CONN_STR")
 
+# Mode batch: 1 = satu pesan per invocation (default lama),
+# >1 = ambil sampai N pesan dari queue dan kategorikan dalam satu prompt
+CATEGORY_BATCH_SIZE = int(os.environ.get("CATEGORY_BATCH_SIZE", "1"))
+CATEGORY_BATCH_VISIBILITY_TIMEOUT = int(os.environ.get("CATEGORY_BATCH_VISIBILITY_TIMEOUT", "300"))
+MAX_DEQUEUE_COUNT = 5 # Sama dengan default maxDequeueCount Functions host
+
 # --- PROMPT AI ---
 # Kita minta AI mengembalikan nama & tipe agar sesuai struktur DB Category Anda
 CATEGORIZATION_PROMPT = (
@@ -28,112 +47,343 @@ CATEGORIZATION_PROMPT = (
     "Output berupa JSON: {'category_name': string, 'category_type': string, 'amount': float, 'ai_confidence': float}."
 )
 
+STANDARD_INSTRUCTIONS = {
+    "model_name": "gemini-2.5-flash",
+    "system_prompt": CATEGORIZATION_PROMPT
+}
+
+# --- CACHE KATEGORI (IN-PROCESS) ---
+# Kategori hanya sedikit (~5) dan jarang berubah, jadi disimpan di memori worker
+# dan di-refresh per TTL. Id kategori baru deterministik dari name + type,
+# sehingga cache miss cukup point read / create idempotent (tanpa query).
+ADMIN_PK = "ADMIN"
+CATEGORY_CACHE_TTL_SECONDS = int(os.environ.get("CATEGORY_CACHE_TTL_SECONDS", "900"))
+CATEGORY_ID_NAMESPACE = uuid.UUID("6f1c3f0e-2b7a-4c52-9a55-3f1f2d0c8e41")
+
+_category_cache = {}            # (name, category_type) -> snapshot
+_category_cache_loaded_at = None   # None = belum pernah dimuat (monotonic bisa dekat 0 setelah boot)
+_category_cache_lock = threading.Lock()
+
+
+def category_id_for(category_name: str, category_type: str) -> str:
+    """
+    Id kategori deterministik (UUIDv5) dari name + type.
+    """
+    key = f"{category_type.strip().lower()}|{category_name.strip().lower()}"
+    return str(uuid.uuid5(CATEGORY_ID_NAMESPACE, key))
+
+
+def refresh_category_cache(container):
+    """
+    Muat ulang semua kategori ADMIN ke memori (satu query single-partition).
+    Bisa dipanggil manual untuk refresh on demand.
+    """
+    global _category_cache, _category_cache_loaded_at
+    query = "SELECT c.id, c.name, c.category_type FROM c WHERE c.type = 'category'"
+    items = container.query_items(query=query, partition_key=ADMIN_PK)
+
+    fresh = {}
+    for cat in items:
+        fresh[(cat["name"], cat["category_type"])] = {
+            "id": cat["id"],
+            "name": cat["name"],
+            "category_type": cat["category_type"]
+        }
+
+    with _category_cache_lock:
+        _category_cache = fresh
+        _category_cache_loaded_at = time.monotonic()
+    logging.info(f"Category cache refreshed: {len(fresh)} categories")
+
+
 # --- HELPER: Get or Create Category (Cosmos NoSQL Style) ---
 def get_or_create_category_snapshot(container, category_name, category_type):
     """
-    Mencari kategori di Cosmos DB berdasarkan name + type.
-    Jika tidak ada, buat dokumen 'type': 'category' baru.
+    Mencari kategori berdasarkan name + type (cache memori dulu).
+    Jika tidak ada, point read id deterministik lalu buat dokumen 'type': 'category' baru.
     Mengembalikan objek snapshot kategori untuk di-embed ke transaksi.
     """
-    # 1. Query ke Cosmos DB (Wajib filter by user_id agar Partition Key kena)
-    # Kita cari dokumen yang type='category' DAN namanya sama
-    ADMIN_PK = "ADMIN"
-    query = "SELECT * FROM c WHERE c.type = 'category' AND c.user_id = @user_id AND c.name = @name AND c.category_type = @category_type"
-    parameters = [
-        {"name": "@user_id", "value": ADMIN_PK},
-        {"name": "@name", "value": category_name},
-        {"name": "@category_type", "value": category_type}
-    ]
-
-    items = list(container.query_items(
-        query=query,
-        parameters=parameters,
-        enable_cross_partition_query=False # False karena kita supply user_id
-    ))
-
-    if items:
-        # Kategori Ditemukan
-        existing_cat = items[0]
+    # 1. Cache memori (refresh jika sudah lewat TTL)
+    if _category_cache_loaded_at is None or time.monotonic() - _category_cache_loaded_at > CATEGORY_CACHE_TTL_SECONDS:
+        try:
+            refresh_category_cache(container)
+        except Exception as e:
+            logging.warning(f"Category cache refresh failed, using stale cache: {e}")
+
+    cache_key = (category_name, category_type)
+    cached = _category_cache.get(cache_key)
+    if cached:
+        return dict(cached)
+
+    # 2. Cache miss -> point read id deterministik di partition ADMIN
+    cat_id = category_id_for(category_name, category_type)
+    try:
+        existing_cat = container.read_item(item=cat_id, partition_key=ADMIN_PK)
         logging.info(f"Category Found: {existing_cat['name']} (ID: {existing_cat['id']})")
-        
-        # Return snapshot object sesuai struktur di gambar transaksi Anda
-        return {
-            "id": existing_cat['id'],
-            "name": existing_cat['name'],
-            "category_type": existing_cat['category_type']
-        }
-    else:
-        # Kategori Baru -> Create Document
-        new_cat_id = str(uuid.uuid4())
+    except CosmosResourceNotFoundError:
+        # 3. Kategori Baru -> Create Document (idempotent: id sama untuk name + type sama)
         logging.info(f"Creating New Category: {category_name}")
-
-        new_category_doc = {
-            "id": new_cat_id,
-            "user_id": user_id,       # Partition Key
+        existing_cat = {
+            "id": cat_id,
+            "user_id": ADMIN_PK,      # Partition Key
             "type": "category",       # Discriminator
-            "name": ADMIN_PK,
+            "name": category_name,
             "category_type": category_type,
         }
+        try:
+            container.create_item(body=existing_cat)
+        except CosmosResourceExistsError:
+            pass # Dibuat worker lain di saat bersamaan
 
-        container.create_item(body=new_category_doc)
+    # Return snapshot object sesuai struktur di gambar transaksi Anda
+    snapshot = {
+        "id": existing_cat['id'],
+        "name": existing_cat['name'],
+        "category_type": existing_cat['category_type']
+    }
+    with _category_cache_lock:
+        _category_cache[cache_key] = snapshot
+    return dict(snapshot)
+
+def _parse_queue_payload(message_body: str) -> list[dict]:
+    """
+    Isi pesan bisa satu dokumen transaksi (transaction/create) atau list dokumen
+    (transaction/batch & import). Pesan yang dibaca langsung lewat SDK bisa
+    masih ter-encode base64.
+    """
+    try:
+        payload = json.loads(message_body)
+    except json.JSONDecodeError:
+        payload = json.loads(base64.b64decode(message_body).decode('utf-8'))
+    return payload if isinstance(payload, list) else [payload]
+
+
+def _drain_extra_messages(max_messages: int) -> list:
+    """
+    Ambil sampai max_messages pesan tambahan dari queue input (mode batch).
+    Pesan yang sudah terlalu sering gagal dipindah ke queue poison.
+    """
+    queue_client = azure_clients.get_queue_client(STORAGE_CONN_STR, INPUT_QUEUE_NAME)
+    messages = []
+    try:
+        received = queue_client.receive_messages(
+            messages_per_page=min(max_messages, 32),
+            visibility_timeout=CATEGORY_BATCH_VISIBILITY_TIMEOUT,
+            max_messages=max_messages
+        )
+        for queue_msg in received:
+            if queue_msg.dequeue_count > MAX_DEQUEUE_COUNT:
+                poison_client = azure_clients.get_queue_client(STORAGE_CONN_STR, f"{INPUT_QUEUE_NAME}-poison")
+                try:
+                    poison_client.send_message(queue_msg.content)
+                except Exception:
+                    poison_client.create_queue()
+                    poison_client.send_message(queue_msg.content)
+                queue_client.delete_message(queue_msg)
+                continue
+            messages.append(queue_msg)
+    except Exception as e:
+        logging.warning(f"Failed to drain extra messages: {e}")
+    return messages
 
-        return {
-            "id": new_cat_id,
-            "name": category_name,
-            "category_type": category_type
-        }
 
 @app.queue_trigger(arg_name="msg", queue_name=INPUT_QUEUE_NAME, connection="STORAGE_CONN_STR")
 def CategoryProcessor(msg: func.QueueMessage):
     logging.info(">>> PROCESSING TRANSACTION FROM QUEUE...")
 
-    # Variabel inisialisasi awal agar scope aman
-    transaction_id = None
-    user_id = None
-    description = ""
-    current_amount = 0.0
-    input_type = "text"
-    image_url = None
-
     # 1. Parse Event
-    try:    
-        message_body = msg.get_body().decode('utf-8')
-        transaction_doc = json.loads(message_body)
-        
-        transaction_id = transaction_doc.get("id")
-        user_id = transaction_doc.get("user_id")
-        
-        input_type = transaction_doc.get("input_type", "text")
-        image_url = transaction_doc.get("image_url")
-        description = transaction_doc.get("description", "")
-        # FIX: Ambil amount lama agar tidak error reference
-        current_amount = float(transaction_doc.get("amount", 0.0)) 
-        
-        if not transaction_id or not user_id:
-            logging.error("Invalid Message: Missing id or user_id")
-            return
-            
+    try:
+        transaction_docs = _parse_queue_payload(msg.get_body().decode('utf-8'))
     except Exception as e:
         logging.error(f"Error parsing queue: {e}")
         return
 
-    # 2. Panggil AI Service
-    predicted_name = "Lainnya"
-    predicted_type = "Expense"
-    ai_confidence = 0.0
-    detected_amount = 0.0
+    # 2. Mode batch: ambil pesan lain dari queue supaya deskripsinya bisa
+    #    dikategorikan dalam SATU prompt LLM
+    extra_messages = []
+    if CATEGORY_BATCH_SIZE > 1:
+        for queue_msg in _drain_extra_messages(CATEGORY_BATCH_SIZE - 1):
+            try:
+                extra_messages.append((queue_msg, _parse_queue_payload(queue_msg.content)))
+            except Exception as e:
+                logging.error(f"Error parsing drained message {queue_msg.id}: {e}")
+
+    all_docs = transaction_docs + [doc for _, docs in extra_messages for doc in docs]
+    if len(all_docs) > 1:
+        logging.info(f"Batch: {len(all_docs)} transactions from {1 + len(extra_messages)} messages")
+
+    # Percobaan terakhir (setelah ini pesan masuk poison): boleh pakai fallback "Lainnya"
+    final_attempt_ids = set()
+    if (msg.dequeue_count or 1) >= MAX_DEQUEUE_COUNT:
+        final_attempt_ids.update(doc.get("id") for doc in transaction_docs if isinstance(doc, dict))
+    for queue_msg, docs in extra_messages:
+        if queue_msg.dequeue_count >= MAX_DEQUEUE_COUNT:
+            final_attempt_ids.update(doc.get("id") for doc in docs if isinstance(doc, dict))
+
+    failed_ids = categorize_transactions(all_docs, final_attempt_ids)
+
+    # 3. Hapus pesan tambahan yang sukses; yang gagal muncul lagi setelah visibility timeout
+    if extra_messages:
+        queue_client = azure_clients.get_queue_client(STORAGE_CONN_STR, INPUT_QUEUE_NAME)
+        for queue_msg, docs in extra_messages:
+            if any(doc.get("id") in failed_ids for doc in docs):
+                logging.warning(f"Drained message {queue_msg.id} has failures, leaving it for retry")
+                continue
+            try:
+                queue_client.delete_message(queue_msg)
+            except Exception as e:
+                logging.warning(f"Failed to delete drained message {queue_msg.id}: {e}")
+
+    # Kalau ada transaksi di pesan trigger yang gagal update DB,
+    # raise agar pesan di-retry (patch ulang aman karena idempotent)
+    if any(doc.get("id") in failed_ids for doc in transaction_docs):
+        raise RuntimeError("Categorization failed for one or more transactions in message")
+
+
+def categorize_transactions(transaction_docs: list[dict], final_attempt_ids: set | None = None) -> set:
+    """
+    Kategorisasi banyak transaksi sekaligus. Transaksi teks dicoba dulu dengan
+    klasifikasi lokal; yang tidak yakin dikirim ke ai/language/batch dalam satu
+    request (jika endpoint batch diset), transaksi gambar tetap lewat OCR satu per satu.
+    Jika AI gagal (mis. throttle), transaksi TIDAK ditandai processed tapi dihitung
+    gagal supaya pesannya di-retry; fallback "Lainnya" hanya di final_attempt_ids.
+    Return set id transaksi yang GAGAL di-update.
+    """
+    valid_docs = []
+    for transaction_doc in transaction_docs:
+        if not isinstance(transaction_doc, dict) or not transaction_doc.get("id") or not transaction_doc.get("user_id"):
+            logging.error("Invalid Message: Missing id or user_id")
+            continue
+        valid_docs.append(transaction_doc)
+
+    # Fast path: klasifikasi lokal (keyword/merchant trie), hanya sisanya ke LLM
+    ai_results = {}
+    text_docs = []
+    for doc in valid_docs:
+        if _is_image_transaction(doc):
+            continue
+        local_result = local_classifier.classify(doc.get("description", ""))
+        if not local_result:
+            local_result = _predict_with_learned_model(doc)
+        if local_result:
+            ai_results[doc["id"]] = local_result
+        else:
+            text_docs.append(doc)
+    stats = local_classifier.get_stats()
+    nb_stats = learned_classifier.get_stats()
+    logging.info(
+        f"Local classifier: {len(ai_results)} local / {len(text_docs)} to LLM in this batch "
+        f"(hit_rate={stats['hit_rate']}, total={stats['total']}, "
+        f"nb_confident={nb_stats['confident']}/{nb_stats['predictions']})"
+    )
+
+    if len(text_docs) > 1 and LANGUAGE_BATCH_ENDPOINT:
+        ai_results.update(_request_ai_batch_categorization(text_docs))
+
+    # Struk yang difoto ulang: pakai hasil transaksi aslinya (tanpa OCR/Gemini)
+    for doc in valid_docs:
+        if doc.get("duplicate_of") and doc["id"] not in ai_results:
+            reused = _reuse_duplicate_result(doc)
+            if reused:
+                ai_results[doc["id"]] = reused
+
+    failed_ids = set()
+    for transaction_doc in valid_docs:
+        if OCR_JOBS_ENDPOINT and _is_image_transaction(transaction_doc) and transaction_doc["id"] not in ai_results:
+            # Hasil diproses OcrResultProcessor; gagal submit = retry pesan
+            if not _submit_ocr_job(transaction_doc):
+                failed_ids.add(transaction_doc["id"])
+            continue
 
-    standard_instructions = {
-        "model_name": "gemini-2.5-flash",
-        "system_prompt": CATEGORIZATION_PROMPT
+        ai_result = ai_results.get(transaction_doc["id"])
+        if ai_result is None:
+            ai_result = _request_ai_categorization(transaction_doc)
+        if ai_result is None and transaction_doc["id"] not in (final_attempt_ids or set()):
+            logging.warning(f"AI unavailable for {transaction_doc['id']}, will retry")
+            failed_ids.add(transaction_doc["id"])
+            continue
+        try:
+            _apply_categorization(transaction_doc, ai_result)
+        except Exception:
+            failed_ids.add(transaction_doc["id"])
+    return failed_ids
+
+
+def _predict_with_learned_model(transaction_doc: dict) -> dict | None:
+    """
+    Skor dengan model naive Bayes (per user / global) hasil TrainCategoryModelFunction.
+    Return None jika model belum ada atau confidence di bawah NB_MIN_CONFIDENCE.
+    """
+    if not learned_classifier.NB_ENABLED or not STORAGE_CONN_STR:
+        return None
+    try:
+        blob_service = azure_clients.get_blob_service_client(STORAGE_CONN_STR)
+        description = transaction_doc.get("description", "")
+        result = learned_classifier.predict(blob_service, transaction_doc["user_id"], description)
+        if result:
+            # Model hanya memprediksi kategori; nominal diambil dari teks jika ada
+            result["amount"] = local_classifier.parse_amount(description)
+        return result
+    except Exception as e:
+        logging.warning(f"Learned classifier failed: {e}")
+        return None
+
+
+def _reuse_duplicate_result(transaction_doc: dict) -> dict | None:
+    """
+    Hasil kategorisasi transaksi asli (duplicate_of) dalam bentuk respons AI Service.
+    None jika gambarnya tidak identik (sha256), transaksi asli belum diproses
+    atau hanya hasil fallback.
+    """
+    try:
+        container = azure_clients.get_cosmos_container(COSMOS_CONN_STR, DATABASE_NAME, CONTAINER_NAME)
+        original = container.read_item(item=transaction_doc["duplicate_of"], partition_key=transaction_doc["user_id"])
+    except Exception as e:
+        logging.warning(f"Cannot read original transaction {transaction_doc['duplicate_of']}: {e}")
+        return None
+
+    # Kemiripan dHash saja bisa salah (struk berbeda, hash berdekatan): hasil hanya
+    # dipakai ulang jika byte gambarnya identik, selain itu jalur OCR normal
+    if not transaction_doc.get("image_sha256") or original.get("image_sha256") != transaction_doc["image_sha256"]:
+        return None
+
+    category = original.get("category") or {}
+    if not original.get("is_processed") or original.get("ai_status") == "fallback" or category.get("name") in (None, "Pending"):
+        return None
+
+    logging.info(f"Reusing categorization of {original['id']} for duplicate receipt {transaction_doc['id']}")
+    result = {
+        "category_name": category["name"],
+        "category_type": category.get("category_type", "Expense"),
+        "amount": float(original.get("amount") or 0.0),
+        "ai_service_used": "duplicate_reuse",
+        "ai_confidence": float(original.get("ai_confidence") or 0.0),
     }
+    if original.get("description"):
+        result["description"] = original["description"]
+    return result
 
+
+def _is_image_transaction(transaction_doc: dict) -> bool:
+    return transaction_doc.get("input_type", "text") == "image" and bool(transaction_doc.get("image_url"))
+
+
+def _request_ai_categorization(transaction_doc: dict) -> dict | None:
+    """
+    Panggil AI Service untuk satu transaksi (OCR untuk gambar, language untuk teks).
+    Return hasil AI (dict) atau None jika gagal.
+    """
     try:
         response = None
         
-        if input_type == "image" and image_url:
+        if _is_image_transaction(transaction_doc):
+            image_url = transaction_doc.get("image_url")
             logging.info(f"Processing Image Transaction: {image_url}")
-            payload = {"image_url": image_url, "instructions": standard_instructions}
+            payload = {
+                "image_url": image_url,
+                "image_sha256": transaction_doc.get("image_sha256"),
+                "instructions": STANDARD_INSTRUCTIONS
+            }
             # Pastikan OCR_ENDPOINT tidak None
             if OCR_ENDPOINT:
                 response = requests.post(OCR_ENDPOINT, json=payload, timeout=15)
@@ -141,38 +391,118 @@ def CategoryProcessor(msg: func.QueueMessage):
                 logging.error("OCR_ENDPOINT not set!")
         else:
             logging.info("Processing Text Transaction")
-            payload = {"text": description, "instructions": standard_instructions}
+            payload = {"text": transaction_doc.get("description", ""), "instructions": STANDARD_INSTRUCTIONS}
             if LANGUAGE_ENDPOINT:
                 response = requests.post(LANGUAGE_ENDPOINT, json=payload, timeout=10)
             else:
                 logging.error("LANGUAGE_ENDPOINT not set!")
         
-        if response and response.status_code == 200:
+        if response is not None and response.status_code == 200:
             ai_result = response.json()
-            predicted_name = ai_result.get("category_name", "Lainnya")
-            predicted_type = ai_result.get("category_type", "Expense")
-            ai_confidence = ai_result.get("ai_confidence", 0.0)
+            # OCR membalas 200 dengan field 'error' jika struk gagal diproses
+            if ai_result.get("error"):
+                logging.warning(f"AI Service returned error: {ai_result['error']}")
+                return None
+            return ai_result
+        if response is not None and response.status_code == 429:
+            logging.warning(f"AI Service throttled (Retry-After: {response.headers.get('Retry-After')})")
+            return None
+        if response is not None:
+            logging.warning(f"AI Service non-200: {response.text}")
 
-            # Update description jika OCR memberikan detail lebih baik
-            if "description" in ai_result and input_type == "image":
-                description = ai_result["description"]
+    except Exception as e:
+        logging.error(f"AI Service Failed: {e}")
+    return None
 
-            if "amount" in ai_result and ai_result["amount"] > 0:
-                detected_amount = float(ai_result["amount"])
-        else:
-            if response:
-                logging.warning(f"AI Service non-200: {response.text}")
 
+def _submit_ocr_job(transaction_doc: dict) -> bool:
+    """
+    Kirim job OCR asinkron; AI Service akan push hasilnya ke OCR_RESULT_QUEUE_NAME
+    bersama context bertanda tangan (id transaksi + user). Return True jika job diterima.
+    """
+    context = {"transaction_id": transaction_doc["id"], "user_id": transaction_doc["user_id"]}
+    signature = ocr_context.sign(context)
+    if not signature:
+        logging.error("OCR_CONTEXT_SECRET missing, cannot submit OCR job")
+        return False
+    payload = {
+        "image_url": transaction_doc.get("image_url"),
+        "image_sha256": transaction_doc.get("image_sha256"),
+        "instructions": STANDARD_INSTRUCTIONS,
+        "context": context,
+        "context_signature": signature
+    }
+    try:
+        response = requests.post(OCR_JOBS_ENDPOINT, json=payload, timeout=10)
+        if response.status_code == 202:
+            logging.info(f"OCR job {response.json().get('job_id')} submitted for {transaction_doc['id']}")
+            return True
+        logging.warning(f"OCR job submit non-202: {response.status_code} {response.text}")
     except Exception as e:
-        logging.error(f"AI Service Failed: {e}. Using Default.")
+        logging.error(f"OCR job submit failed: {e}")
+    return False
+
+
+def _request_ai_batch_categorization(text_docs: list[dict]) -> dict:
+    """
+    Kirim semua deskripsi ke ai/language/batch dalam satu request.
+    Return {transaction_id: hasil AI}; item yang gagal tidak dimasukkan
+    (akan di-fallback ke request tunggal).
+    """
+    payload = {
+        "items": [{"id": doc["id"], "text": doc.get("description", "")} for doc in text_docs],
+        "instructions": STANDARD_INSTRUCTIONS
+    }
+    try:
+        response = requests.post(LANGUAGE_BATCH_ENDPOINT, json=payload, timeout=LANGUAGE_BATCH_TIMEOUT)
+        if response.status_code != 200:
+            logging.warning(f"AI Batch non-200: {response.text}")
+            return {}
+        results = {}
+        for item in response.json().get("results", []):
+            if item.get("id") and item.get("is_success", True) and "error" not in item:
+                results[item["id"]] = item
+        logging.info(f"AI Batch categorized {len(results)}/{len(text_docs)} transactions")
+        return results
+    except Exception as e:
+        logging.error(f"AI Batch Failed: {e}. Falling back to single requests.")
+        return {}
+
+
+def _apply_categorization(transaction_doc: dict, ai_result: dict | None):
+    """
+    Update dokumen transaksi di Cosmos DB dengan hasil AI (atau default "Lainnya"
+    jika None, hanya di percobaan terakhir), lalu publish event TransactionCategorized.
+    """
+    transaction_id = transaction_doc.get("id")
+    user_id = transaction_doc.get("user_id")
+    input_type = transaction_doc.get("input_type", "text")
+    description = transaction_doc.get("description", "")
+    # FIX: Ambil amount lama agar tidak error reference
+    current_amount = float(transaction_doc.get("amount", 0.0) or 0.0)
+
+    predicted_name = "Lainnya"
+    predicted_type = "Expense"
+    ai_confidence = 0.0
+    detected_amount = 0.0
+
+    if ai_result:
+        predicted_name = ai_result.get("category_name", "Lainnya")
+        predicted_type = ai_result.get("category_type", "Expense")
+        ai_confidence = ai_result.get("ai_confidence", 0.0)
+
+        # Update description jika OCR memberikan detail lebih baik
+        if "description" in ai_result and input_type == "image":
+            description = ai_result["description"]
+
+        if "amount" in ai_result and ai_result["amount"] and ai_result["amount"] > 0:
+            detected_amount = float(ai_result["amount"])
 
     # 3. Update Cosmos DB
     try:
         if not COSMOS_CONN_STR: raise ValueError("COSMOS_CONN_STR missing")
         
-        client = CosmosClient.from_connection_string(COSMOS_CONN_STR)
-        database = client.get_database_client(DATABASE_NAME)
-        container = database.get_container_client(CONTAINER_NAME)
+        container = azure_clients.get_cosmos_container(COSMOS_CONN_STR, DATABASE_NAME, CONTAINER_NAME)
 
         # A. Get Category Snapshot
         category_snapshot = get_or_create_category_snapshot(
@@ -183,14 +513,30 @@ def CategoryProcessor(msg: func.QueueMessage):
         patch_ops = [
             { "op": "add", "path": "/category", "value": category_snapshot },
             { "op": "add", "path": "/ai_confidence", "value": str(ai_confidence) },
-            { "op": "add", "path": "/is_processed", "value": True }
+            { "op": "add", "path": "/is_processed", "value": True },
+            # 'fallback' = AI tetap gagal sampai percobaan terakhir, perlu dicek user
+            { "op": "add", "path": "/ai_status", "value": "categorized" if ai_result else "fallback" },
+            # Sumber hasil (gemini_llm, naive_bayes, local_classifier, ...): label buatan
+            # classifier lokal tidak ikut melatih learned_classifier
+            { "op": "add", "path": "/ai_service_used", "value": (ai_result.get("ai_service_used") or "ai_service") if ai_result else "fallback" }
         ]
 
-        # Update amount jika AI menemukan angka baru
-        if detected_amount > 0:
+        # Nominal yang diisi user secara eksplisit (amount_source "user") atau dari
+        # import mutasi bank (import_hash) tidak ditimpa tebakan deskripsi/OCR;
+        # selain itu amount hasil AI tetap dipakai seperti sebelumnya
+        amount_locked = transaction_doc.get("amount_source") == "user" or bool(transaction_doc.get("import_hash"))
+        final_amount = current_amount
+        if detected_amount > 0 and not amount_locked:
             logging.info(f"AI detected amount: {detected_amount} (Old: {current_amount})")
             patch_ops.append({ "op": "add", "path": "/amount", "value": detected_amount })
+            final_amount = detected_amount
         
+        # Kualitas OCR + apakah gambar dinormalisasi saat upload (evaluasi sebelum/sesudah)
+        if ai_result and ai_result.get("ocr_quality"):
+            ocr_quality = dict(ai_result["ocr_quality"])
+            ocr_quality["normalized"] = (transaction_doc.get("image_normalization") or {}).get("normalized", False)
+            patch_ops.append({ "op": "add", "path": "/ocr_quality", "value": ocr_quality })
+
         # Update description jika berubah (hasil OCR)
         if description != transaction_doc.get("description", ""):
              patch_ops.append({ "op": "add", "path": "/description", "value": description })
@@ -204,20 +550,23 @@ def CategoryProcessor(msg: func.QueueMessage):
 
         # 4. Publish to Output Queue
         try:
-            queue_client = QueueClient.from_connection_string(conn_str=STORAGE_CONN_STR, queue_name=OUTPUT_QUEUE_NAME)
-            try: queue_client.create_queue()
-            except: pass
+            queue_client = azure_clients.get_queue_client(STORAGE_CONN_STR, OUTPUT_QUEUE_NAME)
 
             next_event_payload = {
                 "event_type": "TransactionCategorized",
                 "transaction_id": transaction_id,
                 "user_id": user_id,
                 "category": category_snapshot,
-                "amount": detected_amount if detected_amount > 0 else current_amount,
+                "amount": final_amount,
                 "description": description,
+                "transaction_date": transaction_doc.get("transaction_date"),
             }
 
-            queue_client.send_message(json.dumps(next_event_payload))
+            try:
+                queue_client.send_message(json.dumps(next_event_payload))
+            except Exception:
+                queue_client.create_queue()
+                queue_client.send_message(json.dumps(next_event_payload))
             logging.info(f"Event published to queue: {OUTPUT_QUEUE_NAME}")
 
         except Exception as queue_err:
@@ -225,4 +574,61 @@ def CategoryProcessor(msg: func.QueueMessage):
 
     except Exception as e:
         logging.error(f"Database Update Failed: {e}")
-        raise e
\ No newline at end of file
+        raise e
+
+
+# -----------------------------------------------------------------
+# HASIL JOB OCR ASINKRON (dari AI Service)
+# -----------------------------------------------------------------
+@app.queue_trigger(arg_name="msg", queue_name=OCR_RESULT_QUEUE_NAME, connection="STORAGE_CONN_STR")
+def OcrResultProcessor(msg: func.QueueMessage):
+    try:
+        payload = json.loads(msg.get_body().decode('utf-8'))
+        context = payload["context"]
+        transaction_id = context["transaction_id"]
+        user_id = context["user_id"]
+    except Exception as e:
+        logging.error(f"Invalid OCR result message: {e}")
+        return
+
+    if not ocr_context.verify(context, payload.get("context_signature")):
+        logging.warning(f"OCR result for {transaction_id} rejected: invalid context signature")
+        return
+
+    # Baca ulang transaksinya: hanya struk milik user itu yang masih Pending yang boleh di-patch
+    try:
+        container = azure_clients.get_cosmos_container(COSMOS_CONN_STR, DATABASE_NAME, CONTAINER_NAME)
+        transaction_doc = container.read_item(item=transaction_id, partition_key=user_id)
+    except CosmosResourceNotFoundError:
+        logging.warning(f"OCR result for missing transaction {transaction_id}, ignored")
+        return
+    if (transaction_doc.get("user_id") != user_id
+            or transaction_doc.get("type") != "transaction"
+            or transaction_doc.get("is_processed")
+            or not _is_image_transaction(transaction_doc)
+            or (transaction_doc.get("category") or {}).get("name") != "Pending"):
+        logging.warning(f"OCR result for {transaction_id} ignored: not a pending receipt of this user")
+        return
+
+    if payload.get("status") != "succeeded":
+        # AI Service sudah me-retry job-nya; pakai fallback agar transaksi tidak menggantung
+        logging.warning(f"OCR job {payload.get('job_id')} failed: {payload.get('error')}")
+    _apply_categorization(transaction_doc, payload.get("result") if payload.get("status") == "succeeded" else None)
+
+
+# -----------------------------------------------------------------
+# TRAINING OFFLINE: model naive Bayes dari riwayat kategorisasi
+# Jalan tiap hari jam 02:00 UTC; model dibaca ulang oleh worker setelah
+# NB_MODEL_CACHE_TTL_SECONDS.
+# -----------------------------------------------------------------
+@app.schedule(schedule="0 0 2 * * *", arg_name="mytimer", run_on_startup=False)
+def TrainCategoryModelFunction(mytimer: func.TimerRequest) -> None:
+    logging.info(">>> TRAINING CATEGORY MODEL...")
+    try:
+        container = azure_clients.get_cosmos_container(COSMOS_CONN_STR, DATABASE_NAME, CONTAINER_NAME)
+        blob_service = azure_clients.get_blob_service_client(STORAGE_CONN_STR)
+        summary = learned_classifier.train_models(container, blob_service)
+        logging.info(f"Category model trained: {summary}")
+    except Exception as e:
+        logging.error(f"Error training category model: {e}")
+        raise e
@@ -0,0 +1,244 @@
+import io
+import os
+import re
+import time
+import zlib
+import logging
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+from azure.core.exceptions import ResourceNotFoundError
+
+# ==========================================
+# CLASSIFIER TERLATIH (MULTINOMIAL NAIVE BAYES, NUMPY)
+# - Dilatih offline (timer) dari riwayat transaksi yang sudah dikategorikan:
+#   satu model global + satu model per user yang punya cukup data.
+# - Fitur: unigram + bigram token deskripsi, di-hash ke NB_FEATURES bucket
+#   (tanpa vocabulary, jadi model = array log-probabilitas saja).
+# - Model disimpan sebagai .npz terkompresi di blob container MODEL_CONTAINER:
+#   global.npz dan users/{user_id}.npz.
+# - Scoring = penjumlahan beberapa kolom array (mikrodetik), dipakai
+#   CategoryProcessor sebelum memanggil Gemini.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+NB_ENABLED = os.environ.get("NB_ENABLED", "true").lower() == "true"
+NB_FEATURES = int(os.environ.get("NB_FEATURES", str(2 ** 14)))
+NB_ALPHA = float(os.environ.get("NB_ALPHA", "0.1"))  # Laplace smoothing
+NB_MIN_CONFIDENCE = float(os.environ.get("NB_MIN_CONFIDENCE", "0.9"))
+NB_MIN_USER_SAMPLES = int(os.environ.get("NB_MIN_USER_SAMPLES", "30"))
+# Hanya belajar dari hasil yang cukup yakin (fallback "Lainnya" 0.0 tidak ikut)
+NB_TRAIN_MIN_CONFIDENCE = float(os.environ.get("NB_TRAIN_MIN_CONFIDENCE", "0.6"))
+NB_MODEL_CACHE_TTL_SECONDS = int(os.environ.get("NB_MODEL_CACHE_TTL_SECONDS", "3600"))
+# Model user ~NB_FEATURES x kelas float32 (~320 KB): batasi jumlah model di memori worker
+NB_MODEL_CACHE_MAX_ENTRIES = int(os.environ.get("NB_MODEL_CACHE_MAX_ENTRIES", "100"))
+MODEL_CONTAINER = os.environ.get("NB_MODEL_CONTAINER", "category-models")
+
+GLOBAL_MODEL_BLOB = "global.npz"
+# Hasil dari classifier lokal / model ini sendiri tidak dipakai melatih ulang (feedback loop)
+SELF_LABELED_SOURCES = ["naive_bayes", "local_classifier"]
+
+_models = OrderedDict()   # blob_name -> (loaded_at, model dict | None), LRU
+_lock = threading.Lock()
+_stats = {"predictions": 0, "confident": 0, "no_model": 0}
+
+
+def _blob_name_for_user(user_id: str) -> str:
+    return f"users/{user_id}.npz"
+
+
+def featurize(text: str) -> np.ndarray:
+    """
+    Index fitur hashed (unigram + bigram) untuk satu deskripsi.
+    crc32 dipakai karena stabil antar proses (hash() Python di-salt).
+    """
+    tokens = re.findall(r"[a-z]+|\d+", (text or "").lower())
+    # Angka dinormalisasi supaya "25rb" dan "30rb" berbagi fitur
+    tokens = ["<num>" if t.isdigit() else t for t in tokens]
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return np.array([zlib.crc32(g.encode("utf-8")) % NB_FEATURES for g in grams], dtype=np.int64)
+
+
+def _label_of(doc: dict) -> str | None:
+    category = doc.get("category") or {}
+    name, category_type = category.get("name"), category.get("category_type")
+    if not name or name == "Pending" or category_type not in ("Expense", "Income"):
+        return None
+    return f"{name}|{category_type}"
+
+
+def _fit(counts: np.ndarray, class_totals: np.ndarray) -> dict:
+    """
+    counts: (n_classes, n_features) jumlah fitur per kelas, class_totals: jumlah dokumen per kelas.
+    """
+    smoothed = counts + NB_ALPHA
+    log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+    prior = (class_totals + 1.0) / (class_totals.sum() + len(class_totals))
+    return {
+        "log_prob": log_prob.astype(np.float32),
+        "log_prior": np.log(prior).astype(np.float32),
+        "n_samples": np.array(int(class_totals.sum())),
+    }
+
+
+def _save_model(blob_service, blob_name: str, model: dict, classes: list[str]):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, classes=np.array(classes), n_features=np.array(NB_FEATURES), **model)
+    blob_service.get_blob_client(container=MODEL_CONTAINER, blob=blob_name).upload_blob(
+        buffer.getvalue(), overwrite=True
+    )
+
+
+def train_models(container, blob_service) -> dict:
+    """
+    Latih model global + per user dari semua transaksi yang sudah diproses.
+    Data dibaca streaming (per halaman), hitungan per user disimpan sparse
+    (Counter) dan baru dijadikan array saat model user disimpan.
+    """
+    query = """
+        SELECT c.user_id, c.description, c.category, c.ai_confidence
+        FROM c WHERE c.type = 'transaction' AND c.is_processed = true
+        AND (NOT IS_DEFINED(c.ai_service_used) OR NOT ARRAY_CONTAINS(@selfLabeled, c.ai_service_used))
+    """
+    params = [{"name": "@selfLabeled", "value": SELF_LABELED_SOURCES}]
+    items = container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
+
+    classes = []
+    class_index = {}
+    per_user = defaultdict(lambda: {"features": Counter(), "totals": Counter()})
+    global_features = Counter()
+    global_totals = Counter()
+
+    for doc in items:
+        label = _label_of(doc)
+        if not label or not doc.get("description"):
+            continue
+        try:
+            if float(doc.get("ai_confidence") or 0.0) < NB_TRAIN_MIN_CONFIDENCE:
+                continue
+        except (TypeError, ValueError):
+            continue
+
+        if label not in class_index:
+            class_index[label] = len(classes)
+            classes.append(label)
+        c = class_index[label]
+
+        user_stats = per_user[doc["user_id"]]
+        for f in featurize(doc["description"]).tolist():
+            global_features[(c, f)] += 1
+            user_stats["features"][(c, f)] += 1
+        global_totals[c] += 1
+        user_stats["totals"][c] += 1
+
+    if not classes:
+        logger.warning("No categorized transactions to train on")
+        return {"classes": 0, "samples": 0, "user_models": 0}
+
+    try:
+        blob_service.create_container(MODEL_CONTAINER)
+    except Exception:
+        pass  # Sudah ada
+
+    def to_arrays(features: Counter, totals: Counter):
+        counts = np.zeros((len(classes), NB_FEATURES), dtype=np.float64)
+        if features:
+            keys = np.array(list(features.keys()), dtype=np.int64)
+            np.add.at(counts, (keys[:, 0], keys[:, 1]), np.array(list(features.values()), dtype=np.float64))
+        class_totals = np.array([totals.get(i, 0) for i in range(len(classes))], dtype=np.float64)
+        return counts, class_totals
+
+    _save_model(blob_service, GLOBAL_MODEL_BLOB, _fit(*to_arrays(global_features, global_totals)), classes)
+
+    user_models = 0
+    for user_id, user_stats in per_user.items():
+        if sum(user_stats["totals"].values()) < NB_MIN_USER_SAMPLES:
+            continue
+        _save_model(blob_service, _blob_name_for_user(user_id),
+                    _fit(*to_arrays(user_stats["features"], user_stats["totals"])), classes)
+        user_models += 1
+
+    summary = {"classes": len(classes), "samples": int(sum(global_totals.values())), "user_models": user_models}
+    logger.info(f"Naive Bayes training done: {summary}")
+    return summary
+
+
+def _load_model(blob_service, blob_name: str) -> dict | None:
+    now = time.time()
+    with _lock:
+        entry = _models.get(blob_name)
+        if entry and now - entry[0] < NB_MODEL_CACHE_TTL_SECONDS:
+            _models.move_to_end(blob_name)
+            return entry[1]
+
+    model = None
+    try:
+        data = blob_service.get_blob_client(container=MODEL_CONTAINER, blob=blob_name).download_blob().readall()
+        with np.load(io.BytesIO(data)) as npz:
+            if int(npz["n_features"]) == NB_FEATURES:
+                model = {
+                    "log_prob": npz["log_prob"],
+                    "log_prior": npz["log_prior"],
+                    "classes": [str(c) for c in npz["classes"]],
+                }
+            else:
+                logger.warning(f"Model {blob_name} trained with different NB_FEATURES, ignored")
+    except ResourceNotFoundError:
+        pass  # Model belum ada (cache juga hasil negatif agar tidak download ulang)
+    except Exception as e:
+        logger.warning(f"Failed to load model {blob_name}: {e}")
+
+    with _lock:
+        _models[blob_name] = (now, model)
+        _models.move_to_end(blob_name)
+        while len(_models) > NB_MODEL_CACHE_MAX_ENTRIES:
+            _models.popitem(last=False)
+    return model
+
+
+def predict(blob_service, user_id: str, description: str) -> dict | None:
+    """
+    Prediksi kategori dengan model user (jika ada) atau model global.
+    Return hasil berbentuk respons AI Service jika confidence >= NB_MIN_CONFIDENCE, selain itu None.
+    """
+    if not NB_ENABLED or not description:
+        return None
+    features = featurize(description)
+    if features.size == 0:
+        # Tanpa token [a-z0-9] skor hanya berasal dari prior kelas
+        return None
+
+    model = _load_model(blob_service, _blob_name_for_user(user_id)) or _load_model(blob_service, GLOBAL_MODEL_BLOB)
+    if model is None:
+        with _lock:
+            _stats["no_model"] += 1
+        return None
+
+    scores = model["log_prior"] + model["log_prob"][:, features].sum(axis=1)
+    scores = np.exp(scores - scores.max())
+    probabilities = scores / scores.sum()
+    best = int(probabilities.argmax())
+    confidence = float(probabilities[best])
+
+    with _lock:
+        _stats["predictions"] += 1
+        if confidence >= NB_MIN_CONFIDENCE:
+            _stats["confident"] += 1
+    if confidence < NB_MIN_CONFIDENCE:
+        return None
+
+    category_name, category_type = model["classes"][best].split("|", 1)
+    return {
+        "category_name": category_name,
+        "category_type": category_type,
+        "amount": 0.0,
+        "ai_service_used": "naive_bayes",
+        "ai_confidence": round(confidence, 4),
+    }
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**_stats, "models_cached": sum(1 for _, m in _models.values() if m is not None)}
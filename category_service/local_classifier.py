@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import logging
+import threading
+
+# ==========================================
+# KLASIFIKASI LOKAL (FAST PATH SEBELUM GEMINI)
+# Sebagian besar deskripsi adalah pengulangan ("Gojek", "Indomaret",
+# "Gaji Bulanan"). Keyword & nama merchant disimpan di trie per token
+# (frasa multi-kata = jalur beberapa token), jadi satu deskripsi cukup
+# di-scan sekali (longest match) tanpa loop ke semua keyword.
+# Hanya match yang tidak ambigu yang dipakai; sisanya tetap ke LLM.
+#
+# Aturan tambahan bisa diberikan lewat LOCAL_CLASSIFIER_RULES_PATH (JSON):
+# {"Transportasi": {"category_type": "Expense", "keywords": ["damri", "kereta api"]}}
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CLASSIFIER_ENABLED = os.environ.get("LOCAL_CLASSIFIER_ENABLED", "true").lower() == "true"
+LOCAL_CLASSIFIER_RULES_PATH = os.environ.get("LOCAL_CLASSIFIER_RULES_PATH")
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.environ.get("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.9"))
+
+# Nama kategori harus sama dengan daftar di CATEGORIZATION_PROMPT
+DEFAULT_RULES = {
+    "Makanan & Minuman": {
+        "category_type": "Expense",
+        "keywords": [
+            "makan", "makan siang", "makan malam", "sarapan", "minum", "kopi", "cafe", "warung",
+            "warteg", "resto", "restoran", "bakso", "mie ayam", "nasi goreng", "nasi padang", "sate",
+            "martabak", "gofood", "go food", "grabfood", "grab food", "shopeefood", "shopee food",
+            "starbucks", "kopi kenangan", "janji jiwa", "mcdonald", "mcd", "kfc", "burger king",
+            "pizza hut", "hokben", "jco", "chatime", "mixue", "es teh", "boba", "snack", "jajan",
+        ],
+    },
+    "Transportasi": {
+        "category_type": "Expense",
+        "keywords": [
+            "gojek", "goride", "go ride", "gocar", "go car", "grab", "grabbike", "grabcar", "maxim",
+            "ojek", "ojol", "taksi", "taxi", "bluebird", "blue bird", "bensin", "pertalite", "pertamax",
+            "solar", "spbu", "parkir", "tol", "etoll", "e toll", "krl", "mrt", "lrt", "transjakarta",
+            "busway", "kereta", "kai", "bus", "angkot", "tiket pesawat",
+        ],
+    },
+    "Kebutuhan Harian": {
+        "category_type": "Expense",
+        "keywords": [
+            "indomaret", "alfamart", "alfamidi", "superindo", "hypermart", "giant", "lotte mart",
+            "transmart", "belanja", "sabun", "sampo", "shampoo", "deterjen", "pasta gigi", "tisu",
+            "beras", "minyak goreng", "galon", "gas elpiji", "listrik", "token listrik", "pln",
+            "pulsa", "kuota", "air pdam", "pdam", "sayur", "pasar",
+        ],
+    },
+    "Gaji": {
+        "category_type": "Income",
+        "keywords": [
+            "gaji", "gaji bulanan", "gajian", "salary", "payroll", "upah", "honor", "honorarium",
+            "thr", "bonus", "insentif", "tunjangan",
+        ],
+    },
+}
+
+# Match frasa multi-kata / nama merchant lebih yakin daripada kata umum satu token
+CONFIDENCE_MULTI_TOKEN = 0.97
+CONFIDENCE_SINGLE_TOKEN = 0.92
+
+# Angka harus berdiri sendiri (bukan bagian tanggal "17/10/2025" atau referensi bank "WS95031")
+_AMOUNT_PATTERN = re.compile(
+    r"(?<![\w/.,])(rp\.?\s*)?(\d{1,3}(?:[.,]\d{3})+|\d+(?:[.,]\d+)?)\s*(rb|ribu|k|jt|juta)?(?![\w/])",
+    re.IGNORECASE,
+)
+_MULTIPLIERS = {"rb": 1_000, "ribu": 1_000, "k": 1_000, "jt": 1_000_000, "juta": 1_000_000}
+
+_TERMINAL = "$"
+
+
+def normalize_tokens(text: str) -> list[str]:
+    """
+    Lowercase dan pecah jadi token alfanumerik ("Go-Food" -> ["go", "food"]).
+    """
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+class KeywordTrie:
+    """
+    Trie per token: setiap node adalah dict token -> node, node terminal
+    menyimpan (category_name, category_type) di key '$'.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, phrase: str, category_name: str, category_type: str):
+        tokens = normalize_tokens(phrase)
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[_TERMINAL] = (category_name, category_type)
+
+    def find_matches(self, tokens: list[str]) -> list[tuple[tuple[str, str], int]]:
+        """
+        Scan kiri ke kanan, ambil match TERPANJANG di setiap posisi.
+        Return list ((category_name, category_type), panjang_token).
+        """
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node = self.root
+            best = None
+            j = i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if _TERMINAL in node:
+                    best = (node[_TERMINAL], j - i)
+            if best:
+                matches.append(best)
+                i += best[1]
+            else:
+                i += 1
+        return matches
+
+
+def parse_amount(text: str) -> float:
+    """
+    Ambil nominal dari deskripsi: '25rb', '1,5 jt', 'Rp 66.900', '15k', '66.900'.
+    Hanya angka dengan penanda mata uang (Rp, satuan rb/k/jt, atau pemisah ribuan)
+    yang dianggap nominal; angka polos ('2025', nomor referensi) diabaikan.
+    Jika ada beberapa, ambil yang terbesar. Return 0.0 jika tidak ada.
+    """
+    best = 0.0
+    for currency, number, suffix in _AMOUNT_PATTERN.findall(text or ""):
+        has_separator = bool(re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", number))
+        if not (currency or suffix or has_separator):
+            continue
+        if has_separator:
+            # Pemisah ribuan format Indonesia ("66.900") atau "66,900"
+            value = float(re.sub(r"[.,]", "", number))
+        else:
+            value = float(number.replace(",", "."))
+        value *= _MULTIPLIERS.get(suffix.lower(), 1) if suffix else 1
+        best = max(best, value)
+    return best
+
+
+def _load_rules() -> dict:
+    rules = {name: dict(rule, keywords=list(rule["keywords"])) for name, rule in DEFAULT_RULES.items()}
+    if not LOCAL_CLASSIFIER_RULES_PATH:
+        return rules
+    try:
+        with open(LOCAL_CLASSIFIER_RULES_PATH, "r", encoding="utf-8") as f:
+            extra = json.load(f)
+        for name, rule in extra.items():
+            target = rules.setdefault(name, {"category_type": rule.get("category_type", "Expense"), "keywords": []})
+            target["keywords"].extend(rule.get("keywords", []))
+    except Exception as e:
+        logger.warning(f"Failed to load local classifier rules from {LOCAL_CLASSIFIER_RULES_PATH}: {e}")
+    return rules
+
+
+def _build_trie() -> KeywordTrie:
+    trie = KeywordTrie()
+    for name, rule in _load_rules().items():
+        for keyword in rule["keywords"]:
+            trie.add(keyword, name, rule.get("category_type", "Expense"))
+    return trie
+
+
+_trie = _build_trie()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "ambiguous": 0}
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def classify(description: str) -> dict | None:
+    """
+    Klasifikasi lokal. Return hasil dengan bentuk sama seperti respons AI Service
+    (category_name, category_type, amount, ai_confidence) jika yakin, atau None
+    supaya caller fallback ke LLM.
+    """
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+
+    matches = _trie.find_matches(normalize_tokens(description))
+    categories = {category for category, _ in matches}
+    if not categories:
+        _count("misses")
+        return None
+    if len(categories) > 1:
+        # Mis. "gofood indomaret" -> dua kategori, biarkan LLM yang memutuskan
+        _count("ambiguous")
+        return None
+
+    category_name, category_type = categories.pop()
+    longest = max(length for _, length in matches)
+    confidence = CONFIDENCE_MULTI_TOKEN if longest > 1 else CONFIDENCE_SINGLE_TOKEN
+    if confidence < LOCAL_CLASSIFIER_MIN_CONFIDENCE:
+        _count("misses")
+        return None
+
+    _count("hits")
+    return {
+        "category_name": category_name,
+        "category_type": category_type,
+        "amount": parse_amount(description),
+        "ai_service_used": "local_classifier",
+        "ai_confidence": confidence,
+    }
+
+
+def get_stats() -> dict:
+    with _lock:
+        total = _stats["hits"] + _stats["misses"] + _stats["ambiguous"]
+        return {**_stats, "total": total, "hit_rate": round(_stats["hits"] / total, 4) if total else 0.0}
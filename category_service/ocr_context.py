@@ -0,0 +1,41 @@
+import os
+import hmac
+import json
+import hashlib
+import logging
+
+# ==========================================
+# CONTEXT JOB OCR BERTANDA TANGAN
+# CategoryService menandatangani context job OCR ({"transaction_id", "user_id"})
+# dengan HMAC-SHA256 (OCR_CONTEXT_SECRET, sama di AI Service & CategoryService).
+# AI Service menolak job yang context-nya tidak valid, dan CategoryService
+# memverifikasi ulang sebelum memakai hasil dari queue hasil OCR.
+# File ini identik di ai_service/ dan category_service/.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+OCR_CONTEXT_SECRET = os.environ.get("OCR_CONTEXT_SECRET")
+
+
+def _canonical(context: dict) -> bytes:
+    return json.dumps(context, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def sign(context: dict) -> str | None:
+    """
+    Tanda tangan HMAC-SHA256 (hex) untuk context. Return None jika OCR_CONTEXT_SECRET tidak diset.
+    """
+    if not OCR_CONTEXT_SECRET:
+        return None
+    return hmac.new(OCR_CONTEXT_SECRET.encode("utf-8"), _canonical(context), hashlib.sha256).hexdigest()
+
+
+def verify(context, signature) -> bool:
+    if not isinstance(context, dict) or not isinstance(signature, str):
+        return False
+    expected = sign(context)
+    if expected is None:
+        logger.error("OCR_CONTEXT_SECRET missing in configuration")
+        return False
+    return hmac.compare_digest(expected, signature)
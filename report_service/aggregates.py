@@ -0,0 +1,186 @@
+import logging
+from datetime import datetime, timezone
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosBatchOperationError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+# ==========================================
+# AGREGAT BULANAN PER USER (user x month x category)
+# Di-update inkremental dari event TransactionCategorized, jadi laporan
+# bulanan/tahunan cukup membaca O(bulan) dokumen, bukan O(transaksi).
+#
+# Dokumen (partition key = user_id):
+# {
+#   "id": "monthly-agg-2025-11", "type": "monthly_aggregate", "user_id", "month",
+#   "total_income", "total_expense", "transaction_count",
+#   "categories": {category_id: {"name", "category_type", "total", "count"}}
+# }
+#
+# Penanda idempotensi disimpan sebagai item kecil terpisah per transaksi
+# (partition yang sama, jadi ukuran dokumen agregat tidak tumbuh per transaksi):
+# {"id": "agg-applied-2025-11-{transaction_id}", "type": "aggregate_applied",
+#  "user_id", "month", "transaction_id", "entry": {"category_id", "name", "category_type", "amount"}}
+# Agregat + penanda ditulis dalam satu transactional batch: event yang sama
+# diproses dua kali tidak menghitung ganda, dan kategorisasi ulang memindahkan
+# amount ke kategori baru.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_TYPE = "monthly_aggregate"
+APPLIED_MARKER_TYPE = "aggregate_applied"
+MAX_ETAG_RETRIES = 5
+
+
+def aggregate_id(month: str) -> str:
+    return f"monthly-agg-{month}"
+
+
+def applied_marker_id(month: str, transaction_id: str) -> str:
+    return f"agg-applied-{month}-{transaction_id}"
+
+
+def _batch_failure_status(e: CosmosBatchOperationError) -> int | None:
+    """
+    Status operasi yang membuat batch gagal (409 = agregat sudah dibuat, 412 = ETag berubah).
+    """
+    responses = getattr(e, "operation_responses", None) or []
+    index = getattr(e, "error_index", None)
+    if index is not None and index < len(responses):
+        return responses[index].get("statusCode", e.status_code)
+    return e.status_code
+
+
+def _new_aggregate(user_id: str, month: str) -> dict:
+    return {
+        "id": aggregate_id(month),
+        "type": AGGREGATE_TYPE,
+        "user_id": user_id,
+        "month": month,
+        "total_income": 0.0,
+        "total_expense": 0.0,
+        "transaction_count": 0,
+        "categories": {},
+    }
+
+
+def _apply_entry(doc: dict, entry: dict, sign: int):
+    amount = sign * float(entry["amount"])
+    category = doc["categories"].setdefault(entry["category_id"], {
+        "name": entry["name"],
+        "category_type": entry["category_type"],
+        "total": 0.0,
+        "count": 0,
+    })
+    category["total"] += amount
+    category["count"] += sign
+    if category["count"] <= 0:
+        del doc["categories"][entry["category_id"]]
+
+    if entry["category_type"] == "Income":
+        doc["total_income"] += amount
+    else:
+        doc["total_expense"] += amount
+    doc["transaction_count"] += sign
+
+
+def apply_categorized_event(container, event: dict) -> bool:
+    """
+    Terapkan satu event TransactionCategorized ke agregat bulanannya.
+    Memakai ETag (IfNotModified) supaya update paralel tidak saling menimpa.
+    Return False jika event sudah pernah diterapkan (tidak ada perubahan).
+    """
+    user_id = event["user_id"]
+    transaction_id = event["transaction_id"]
+    month = str(event["transaction_date"])[:7]
+    category = event.get("category") or {}
+    entry = {
+        "category_id": str(category.get("id", "0")),
+        "name": category.get("name", "Uncategorized"),
+        "category_type": category.get("category_type", "Expense"),
+        "amount": float(event.get("amount", 0.0)),
+    }
+
+    marker_id = applied_marker_id(month, transaction_id)
+
+    for attempt in range(MAX_ETAG_RETRIES):
+        try:
+            doc = container.read_item(item=aggregate_id(month), partition_key=user_id)
+            etag = doc.get("_etag")
+        except CosmosResourceNotFoundError:
+            doc, etag = _new_aggregate(user_id, month), None
+        try:
+            previous = container.read_item(item=marker_id, partition_key=user_id).get("entry")
+        except CosmosResourceNotFoundError:
+            previous = None
+
+        # Dokumen lama masih menyimpan map 'applied'; entri transaksi ini dipindah ke penanda
+        legacy_applied = doc.get("applied") or {}
+        if previous is None:
+            previous = legacy_applied.get(transaction_id)
+        if previous == entry:
+            return False
+        legacy_applied.pop(transaction_id, None)
+        if previous:
+            _apply_entry(doc, previous, -1)
+        _apply_entry(doc, entry, +1)
+        now = datetime.now(timezone.utc).isoformat()
+        doc["updated_at"] = now
+
+        marker = {
+            "id": marker_id,
+            "type": APPLIED_MARKER_TYPE,
+            "user_id": user_id,
+            "month": month,
+            "transaction_id": transaction_id,
+            "entry": entry,
+            "updated_at": now,
+        }
+        # ETag agregat menjaga urutan; penanda cukup di-upsert dalam batch yang sama
+        if etag:
+            aggregate_op = ("replace", (doc["id"], doc), {"if_match_etag": etag})
+        else:
+            aggregate_op = ("create", (doc,))
+        try:
+            container.execute_item_batch(
+                batch_operations=[aggregate_op, ("upsert", (marker,))],
+                partition_key=user_id
+            )
+            return True
+        except CosmosBatchOperationError as e:
+            if _batch_failure_status(e) not in (409, 412):
+                raise
+            logger.info(f"Aggregate {doc['id']} for {user_id} changed concurrently, retry {attempt + 1}")
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+            logger.info(f"Aggregate {doc['id']} for {user_id} changed concurrently, retry {attempt + 1}")
+
+    raise RuntimeError(f"Failed to update aggregate {aggregate_id(month)} for user {user_id}: too many conflicts")
+
+
+def iter_month_aggregates(container, month: str):
+    """
+    Semua agregat untuk satu bulan (satu dokumen per user).
+    """
+    query = """
+        SELECT c.user_id, c.month, c.total_income, c.total_expense, c.transaction_count, c.categories
+        FROM c WHERE c.type = @type AND c.month = @month
+    """
+    params = [{"name": "@type", "value": AGGREGATE_TYPE}, {"name": "@month", "value": month}]
+    return container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
+
+
+def get_user_aggregates(container, user_id: str, period_prefix: str) -> list[dict]:
+    """
+    Agregat bulanan user untuk satu periode ('2025' = setahun, '2025-11' = sebulan).
+    Single-partition query, maksimal 12 dokumen per tahun.
+    """
+    query = """
+        SELECT c.month, c.total_income, c.total_expense, c.transaction_count, c.categories
+        FROM c WHERE c.type = @type AND STARTSWITH(c.month, @prefix)
+        ORDER BY c.month
+    """
+    params = [{"name": "@type", "value": AGGREGATE_TYPE}, {"name": "@prefix", "value": period_prefix}]
+    return list(container.query_items(query=query, parameters=params, partition_key=user_id))
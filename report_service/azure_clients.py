@@ -0,0 +1,128 @@
+import os
+import logging
+import threading
+
+# ==========================================
+# REGISTRY KLIEN AZURE SDK (PER WORKER PROCESS)
+# Satu klien per connection string / endpoint, dibuat lazy lalu dipakai ulang
+# oleh semua invocation, jadi request warm tidak perlu TLS handshake,
+# fetch metadata, dan connection pool baru.
+#
+# File ini identik di setiap service (tiap Function App di-deploy dari
+# foldernya sendiri). Import SDK dilakukan di dalam fungsi supaya service
+# hanya butuh library yang memang dipakainya.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+# Ukuran connection pool HTTP per klien (urllib3 pool_maxsize / pool_connections)
+AZURE_HTTP_POOL_SIZE = int(os.environ.get("AZURE_HTTP_POOL_SIZE", "20"))
+AZURE_HTTP_POOL_CONNECTIONS = int(os.environ.get("AZURE_HTTP_POOL_CONNECTIONS", "10"))
+
+_clients = {}
+# RLock: factory container memanggil get_cosmos_client (re-entrant ke _get_or_create)
+_lock = threading.RLock()
+
+
+def _build_transport():
+    """
+    Transport azure-core dengan requests.Session yang pool-nya bisa dikonfigurasi.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from azure.core.pipeline.transport import RequestsTransport
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=AZURE_HTTP_POOL_CONNECTIONS, pool_maxsize=AZURE_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def _get_or_create(key: tuple, factory):
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+            logger.info(f"Azure client created: {key[0]}")
+    return client
+
+
+def get_cosmos_client(conn_str: str):
+    if not conn_str:
+        raise ValueError("Cosmos DB connection string is missing")
+
+    def _factory():
+        from azure.cosmos import CosmosClient
+        return CosmosClient.from_connection_string(conn_str, transport=_build_transport())
+
+    return _get_or_create(("cosmos", conn_str), _factory)
+
+
+def get_cosmos_container(conn_str: str, database_name: str, container_name: str):
+    def _factory():
+        database = get_cosmos_client(conn_str).get_database_client(database_name)
+        return database.get_container_client(container_name)
+
+    return _get_or_create(("cosmos_container", conn_str, database_name, container_name), _factory)
+
+
+def get_queue_client(conn_str: str, queue_name: str):
+    if not conn_str:
+        raise ValueError("Storage connection string is missing")
+
+    def _factory():
+        from azure.storage.queue import QueueClient
+        return QueueClient.from_connection_string(conn_str, queue_name, transport=_build_transport())
+
+    return _get_or_create(("queue", conn_str, queue_name), _factory)
+
+
+def get_blob_service_client(conn_str: str):
+    if not conn_str:
+        raise ValueError("Blob storage connection string is missing")
+
+    def _factory():
+        from azure.storage.blob import BlobServiceClient
+        return BlobServiceClient.from_connection_string(conn_str, transport=_build_transport())
+
+    return _get_or_create(("blob", conn_str), _factory)
+
+
+def get_eventgrid_client(endpoint: str, access_key: str):
+    if not endpoint or not access_key:
+        raise ValueError("Event Grid endpoint or access key is missing")
+
+    def _factory():
+        from azure.eventgrid import EventGridPublisherClient
+        from azure.core.credentials import AzureKeyCredential
+        return EventGridPublisherClient(endpoint, AzureKeyCredential(access_key), transport=_build_transport())
+
+    return _get_or_create(("eventgrid", endpoint, access_key), _factory)
+
+
+def get_document_analysis_client(endpoint: str, access_key: str):
+    if not endpoint or not access_key:
+        raise ValueError("AZURE_FORM_ENDPOINT or AZURE_FORM_KEY is missing.")
+
+    def _factory():
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(access_key), transport=_build_transport())
+
+    return _get_or_create(("document_analysis", endpoint, access_key), _factory)
+
+
+def get_table_client(conn_str: str, table_name: str):
+    if not conn_str:
+        raise ValueError("Table storage connection string is missing")
+
+    def _factory():
+        from azure.data.tables import TableClient
+        return TableClient.from_connection_string(conn_str, table_name=table_name, transport=_build_transport())
+
+    return _get_or_create(("table", conn_str, table_name), _factory)
@@ -4,13 +4,11 @@ import json
 import os
 import uuid
 from datetime import datetime, timezone
-from azure.eventgrid import EventGridPublisherClient
-from azure.core.credentials import AzureKeyCredential
-from azure.cosmos import CosmosClient, exceptions
-from azure.storage.blob import BlobServiceClient
+import azure_clients
+import token_verifier
+import aggregates
 import pandas as pd
 from io import BytesIO
-import jwt
 
 app = func.FunctionApp()
 
@@ -25,42 +23,26 @@ CONTAINER_NAME = "item"
 # 2. Blob Config (Tetap butuh Storage Account biasa untuk simpan file PDF/Excel)
 BLOB_CONN_STR = os.getenv("AZURE_BLOB_CONN_STR") 
 
+# 2b. Queue hasil kategorisasi (dipublish oleh CategoryService)
+CATEGORIZED_QUEUE_NAME = "transaction-categorized"
+
 # 3. Event Grid Config
 EVENTGRID_ENDPOINT = os.getenv("EVENTGRID_TOPIC_ENDPOINT")
 EVENTGRID_KEY = os.getenv("EVENTGRID_ACCESS_KEY")
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET") 
-JWT_ALGORITHM = "HS256"
-
 # --- HELPER: VALIDASI TOKEN MANDIRI ---
 def _get_user_info_from_token(req: func.HttpRequest) -> dict | None:
-    auth_header = req.headers.get('Authorization')
-    if not auth_header:
-        return None
-    try:
-        # Format: "Bearer <token>"
-        token = auth_header.split(' ')[1]
-        
-        # Decode dan validasi signature menggunakan Secret Key yang sama dengan User Service
-        # Kita tidak perlu memanggil User Service, cukup validasi matematik di sini.
-        if not JWT_SECRET_KEY:
-             logging.error("JWT_SECRET missing in configuration")
-             return None
-             
-        decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return decoded
-    except Exception as e:
-        logging.error(f"Token invalid: {e}")
-        return None
+    """
+    Validasi Token JWT dan return payloadnya (lewat token_verifier: cache + header identitas gateway).
+    """
+    return token_verifier.verify_request(req)
 
 # --- HELPER: DB CLIENT ---
 def get_container():
     if not COSMOS_CONN_STR:
         raise ValueError("COSMOS_DB_CONN_STR is missing")
     
-    client = CosmosClient.from_connection_string(COSMOS_CONN_STR)
-    database = client.get_database_client(DB_NAME)
-    return database.get_container_client(CONTAINER_NAME)
+    return azure_clients.get_cosmos_container(COSMOS_CONN_STR, DB_NAME, CONTAINER_NAME)
 
 # -----------------------------------------------------------------
 # FUNGSI 1: GenerateReportFunction (Harian)
@@ -109,7 +91,7 @@ def GenerateReportFunction(event: func.EventGridEvent):
         if IS_LOCAL_DEMO:
             logging.warning(f"MODE DEMO: Event 'Report.Updated' skipped.")
         else:
-            client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+            client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
             client.send([report_event_data])
             logging.info("Event published.")
 
@@ -138,7 +120,7 @@ def MonthlyReportSchedulerFunction(mytimer: func.TimerRequest) -> None:
         if IS_LOCAL_DEMO:
             logging.warning(f"MODE DEMO: Event 'Month.Ended' skipped.")
         else:
-            client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+            client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
             client.send([event_data])
             logging.info("Event 'Month.Ended' published.")
 
@@ -161,40 +143,17 @@ def OnMonthEndedFunction(event: func.EventGridEvent):
 
         container = get_container()
 
-        # 1. Ambil User Unik dari Transaksi di Cosmos
-        # Query SQL Cosmos DB: Ambil distinct user_id dari item tipe 'transaction'
-        query_users = "SELECT DISTINCT VALUE c.user_id FROM c WHERE c.type = 'transaction'"
-        user_ids = list(container.query_items(query=query_users, enable_cross_partition_query=True))
-
-        for user_id in user_ids:
+        # 1. Baca agregat bulanan (satu dokumen per user, di-maintain oleh
+        #    MonthlyAggregateFunction) alih-alih scan semua transaksi tiap user
+        for aggregate in aggregates.iter_month_aggregates(container, month):
+            user_id = aggregate["user_id"]
             logging.info(f"Processing user {user_id}...")
-            
-            total_income = 0.0
-            total_expense = 0.0
-            
-            # 2. Query Transaksi User Ini
-            # Kita filter by user_id dan type='transaction'
-            query_trans = "SELECT * FROM c WHERE c.type = 'transaction' AND c.user_id = @user_id"
-            params = [{"name": "@user_id", "value": user_id}]
-            
-            user_trans = container.query_items(
-                query=query_trans, parameters=params, enable_cross_partition_query=True
-            )
-
-            for t in user_trans:
-                try:
-                    trans_date = datetime.fromisoformat(t["transaction_date"])
-                    if trans_date.strftime("%Y-%m") == month:
-                        if t.get("category_id") == 2: 
-                            total_income += t["amount"]
-                        else:
-                            total_expense += t["amount"]
-                except:
-                    continue
 
+            total_income = aggregate.get("total_income", 0.0)
+            total_expense = aggregate.get("total_expense", 0.0)
             savings = total_income - total_expense
 
-            # 3. Simpan Laporan Bulanan
+            # 2. Simpan Laporan Bulanan
             new_report = {
                 "id": str(uuid.uuid4()),
                 "type": "report",          # Discriminator
@@ -204,6 +163,7 @@ def OnMonthEndedFunction(event: func.EventGridEvent):
                 "total_income": total_income,
                 "total_expense": total_expense,
                 "savings": savings,
+                "transaction_count": aggregate.get("transaction_count", 0),
                 "generated_at": datetime.now(timezone.utc).isoformat()
             }
             container.upsert_item(new_report)
@@ -221,7 +181,7 @@ def OnMonthEndedFunction(event: func.EventGridEvent):
         if IS_LOCAL_DEMO:
             logging.warning(f"MODE DEMO: Event 'Report.Generated' skipped.")
         else:
-            client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+            client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
             client.send([report_gen_event])
             logging.info("Event published.")
 
@@ -229,6 +189,31 @@ def OnMonthEndedFunction(event: func.EventGridEvent):
         logging.error(f"Error OnMonthEnded: {e}")
         raise e
 
+# -----------------------------------------------------------------
+# FUNGSI 3b: MonthlyAggregateFunction (Queue 'transaction-categorized')
+# Update agregat user x bulan x kategori setiap transaksi selesai dikategorikan
+# -----------------------------------------------------------------
+@app.queue_trigger(arg_name="msg", queue_name=CATEGORIZED_QUEUE_NAME, connection="STORAGE_CONN_STR")
+def MonthlyAggregateFunction(msg: func.QueueMessage):
+    try:
+        event = json.loads(msg.get_body().decode('utf-8'))
+    except Exception as e:
+        logging.error(f"Invalid categorized event: {e}")
+        return
+
+    if event.get("event_type") != "TransactionCategorized":
+        return
+    if not event.get("user_id") or not event.get("transaction_id") or not event.get("transaction_date"):
+        logging.error(f"Categorized event missing user_id/transaction_id/transaction_date: {event}")
+        return
+
+    try:
+        changed = aggregates.apply_categorized_event(get_container(), event)
+        logging.info(f"Aggregate {'updated' if changed else 'unchanged'} for transaction {event['transaction_id']}")
+    except Exception as e:
+        logging.error(f"Error MonthlyAggregate: {e}")
+        raise e
+
 # -----------------------------------------------------------------
 # FUNGSI 4: PdfGeneratorFunction (Heavy Workload - PDF/Excel)
 # -----------------------------------------------------------------
@@ -303,7 +288,7 @@ def PdfGeneratorFunction(event: func.EventGridEvent):
             }
             
             if not IS_LOCAL_DEMO:
-                client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+                client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
                 client.send([failure_event])
             
             return # BERHENTI DI SINI
@@ -395,7 +380,7 @@ def PdfGeneratorFunction(event: func.EventGridEvent):
         if not BLOB_CONN_STR:
             raise ValueError("AZURE_BLOB_CONN_STR missing for file upload")
 
-        blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
+        blob_service_client = azure_clients.get_blob_service_client(BLOB_CONN_STR)
         container_name = "reports"
         
         try:
@@ -446,7 +431,7 @@ def PdfGeneratorFunction(event: func.EventGridEvent):
         if IS_LOCAL_DEMO:
             logging.warning(f"MODE DEMO: Event 'ReportGeneration.Completed' skipped.")
         else:
-            client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+            client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
             client.send([completion_event])
             logging.info("Event published.")
 
@@ -601,4 +586,45 @@ def GetReportHistoryFunction(req: func.HttpRequest) -> func.HttpResponse:
 
     except Exception as e:
         logging.error(f"Error GetHistory: {e}")
-        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
\ No newline at end of file
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
+
+# -----------------------------------------------------------------
+# FUNGSI 7: GetReportSummaryFunction (Total Bulanan/Tahunan dari Agregat)
+# Endpoint: GET /report/summary?year=2025 (atau ?month=2025-11)
+# -----------------------------------------------------------------
+@app.route(route="report/summary", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def GetReportSummaryFunction(req: func.HttpRequest) -> func.HttpResponse:
+    user_info = _get_user_info_from_token(req)
+    if not user_info:
+        return func.HttpResponse(json.dumps({"error": "Unauthorized"}), status_code=401, mimetype="application/json")
+
+    user_id = user_info.get("user_id")
+    if not user_id:
+        return func.HttpResponse(json.dumps({"error": "Invalid Token Data: user_id missing"}), status_code=401, mimetype="application/json")
+
+    period = req.params.get("month") or req.params.get("year")
+    if not period:
+        return func.HttpResponse(json.dumps({"error": "Please provide year or month"}), status_code=400, mimetype="application/json")
+
+    try:
+        # Maksimal 12 dokumen per tahun, tidak tergantung jumlah transaksi
+        months = aggregates.get_user_aggregates(get_container(), user_id, str(period))
+
+        total_income = sum(m.get("total_income", 0.0) for m in months)
+        total_expense = sum(m.get("total_expense", 0.0) for m in months)
+
+        return func.HttpResponse(
+            json.dumps({
+                "period": period,
+                "total_income": total_income,
+                "total_expense": total_expense,
+                "savings": total_income - total_expense,
+                "months": months
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Error GetReportSummary: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
@@ -0,0 +1,129 @@
+import sys
+import types
+import importlib.util
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class _FakeFunctionApp:
+    """Decorator route / queue_trigger / schedule / ... yang mengembalikan fungsi aslinya."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: (lambda fn: fn)
+
+
+class _FakeHttpResponse:
+    def __init__(self, body=None, status_code=200, mimetype=None, headers=None, **kwargs):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.status_code = status_code
+        self.mimetype = mimetype
+        self.headers = headers or {}
+
+    def get_body(self):
+        return self.body
+
+
+class FakeRequest:
+    def __init__(self, params=None, headers=None, body=None, route_params=None, method="GET", url="http://localhost/api"):
+        self.params = params or {}
+        self.headers = headers or {}
+        self.route_params = route_params or {}
+        self.method = method
+        self.url = url
+        self._body = body
+
+    def get_json(self):
+        if not isinstance(self._body, (dict, list)):
+            raise ValueError("No JSON body")
+        return self._body
+
+    def get_body(self):
+        return self._body if isinstance(self._body, bytes) else b""
+
+
+class _FakeError(Exception):
+    def __init__(self, *args, status_code=None, **kwargs):
+        super().__init__(*args)
+        self.status_code = status_code
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def sdk_modules() -> dict:
+    """Modul SDK palsu (azure, jwt, reverse_geocoder) untuk memuat kode service tanpa dependency-nya."""
+    cosmos_errors = {
+        name: type(name, (_FakeError,), {})
+        for name in (
+            "CosmosHttpResponseError", "CosmosResourceNotFoundError", "CosmosResourceExistsError",
+            "CosmosAccessConditionFailedError", "CosmosBatchOperationError",
+        )
+    }
+    return {
+        "azure": _module("azure"),
+        "azure.functions": _module(
+            "azure.functions",
+            FunctionApp=_FakeFunctionApp, HttpResponse=_FakeHttpResponse, HttpRequest=FakeRequest,
+            QueueMessage=object, TimerRequest=object, EventGridEvent=object,
+            AuthLevel=types.SimpleNamespace(ANONYMOUS="anonymous", FUNCTION="function"),
+        ),
+        "azure.core": _module("azure.core", MatchConditions=types.SimpleNamespace(IfNotModified="IfNotModified")),
+        "azure.core.exceptions": _module(
+            "azure.core.exceptions", HttpResponseError=_FakeError, ResourceNotFoundError=_FakeError,
+            ResourceExistsError=_FakeError,
+        ),
+        "azure.cosmos": _module("azure.cosmos", CosmosClient=object),
+        "azure.cosmos.exceptions": _module("azure.cosmos.exceptions", **cosmos_errors),
+        "azure.storage": _module("azure.storage"),
+        "azure.storage.blob": _module(
+            "azure.storage.blob", BlobBlock=types.SimpleNamespace, BlobSasPermissions=types.SimpleNamespace,
+            ContentSettings=types.SimpleNamespace,
+            generate_blob_sas=lambda **kwargs: "sas",
+        ),
+        "jwt": _module("jwt", PyJWTError=_FakeError, decode=lambda *args, **kwargs: {}),
+        "reverse_geocoder": _module(
+            "reverse_geocoder", RGeocoder=lambda **kwargs: types.SimpleNamespace(query=lambda coordinates: []),
+        ),
+    }
+
+
+class ServiceLoader:
+    """
+    Pasang modul SDK palsu + folder service di sys.path, lalu muat modul service
+    dengan kode aslinya. restore() mengembalikan sys.modules & sys.path.
+    """
+
+    def __init__(self, service: str):
+        self.service_dir = str(ROOT / service)
+        fakes = sdk_modules()
+        self._sibling_names = [path.stem for path in (ROOT / service).glob("*.py")]
+        self._saved = {name: sys.modules.get(name) for name in list(fakes) + self._sibling_names}
+        for name in self._sibling_names:
+            sys.modules.pop(name, None)
+        sys.modules.update(fakes)
+        sys.path.insert(0, self.service_dir)
+
+    def load(self, module_name: str):
+        spec = importlib.util.spec_from_file_location(module_name, Path(self.service_dir) / f"{module_name}.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        return module
+
+    def load_sdk(self, module_name: str):
+        return sys.modules[module_name]
+
+    def restore(self):
+        sys.path.remove(self.service_dir)
+        for name, module in self._saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
@@ -0,0 +1,148 @@
+import copy
+import unittest
+
+from service_fakes import ServiceLoader
+
+
+class _FakeContainer:
+    """Container Cosmos in-memory: read_item + execute_item_batch atomik dengan ETag."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.items = {}
+        self.version = 0
+        self.before_batch = None  # Hook: simulasi writer lain di antara read & batch
+
+    def _store(self, body: dict):
+        self.version += 1
+        stored = copy.deepcopy(body)
+        stored["_etag"] = f"etag-{self.version}"
+        self.items[(stored["user_id"], stored["id"])] = stored
+
+    def read_item(self, item, partition_key):
+        try:
+            return copy.deepcopy(self.items[(partition_key, item)])
+        except KeyError:
+            raise self.errors.CosmosResourceNotFoundError(status_code=404)
+
+    def _fail(self, index: int, status: int):
+        error = self.errors.CosmosBatchOperationError(status_code=status)
+        error.error_index = index
+        error.operation_responses = [{"statusCode": 424}] * index + [{"statusCode": status}]
+        raise error
+
+    def execute_item_batch(self, batch_operations, partition_key):
+        if self.before_batch:
+            hook, self.before_batch = self.before_batch, None
+            hook()
+        for index, (operation, args, *rest) in enumerate(batch_operations):
+            kwargs = rest[0] if rest else {}
+            if operation == "create" and (partition_key, args[0]["id"]) in self.items:
+                self._fail(index, 409)
+            if operation == "replace":
+                current = self.items.get((partition_key, args[0]))
+                if current is None or current["_etag"] != kwargs.get("if_match_etag"):
+                    self._fail(index, 412)
+        for operation, args, *_ in batch_operations:
+            self._store(args[-1])
+
+
+def _event(transaction_id="t-1", amount=25000, category_id="c-food", name="Makanan & Minuman", category_type="Expense"):
+    return {
+        "user_id": "u-1",
+        "transaction_id": transaction_id,
+        "transaction_date": "2025-11-03T10:00:00",
+        "amount": amount,
+        "category": {"id": category_id, "name": name, "category_type": category_type},
+    }
+
+
+class ApplyCategorizedEventTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = ServiceLoader("report_service")
+        self.aggregates = self.loader.load("aggregates")
+        self.container = _FakeContainer(self.loader.load_sdk("azure.cosmos.exceptions"))
+
+    def tearDown(self):
+        self.loader.restore()
+
+    def _aggregate(self) -> dict:
+        return self.container.items[("u-1", "monthly-agg-2025-11")]
+
+    def test_first_event_creates_aggregate_and_marker(self):
+        self.assertTrue(self.aggregates.apply_categorized_event(self.container, _event()))
+        doc = self._aggregate()
+        self.assertEqual((doc["total_expense"], doc["total_income"], doc["transaction_count"]), (25000.0, 0.0, 1))
+        self.assertEqual(doc["categories"]["c-food"], {
+            "name": "Makanan & Minuman", "category_type": "Expense", "total": 25000.0, "count": 1
+        })
+        marker = self.container.items[("u-1", "agg-applied-2025-11-t-1")]
+        self.assertEqual((marker["type"], marker["entry"]["amount"]), ("aggregate_applied", 25000.0))
+        self.assertNotIn("applied", doc)
+
+    def test_redelivered_event_is_not_counted_twice(self):
+        self.aggregates.apply_categorized_event(self.container, _event())
+        self.assertFalse(self.aggregates.apply_categorized_event(self.container, _event()))
+        self.assertEqual(self._aggregate()["transaction_count"], 1)
+
+    def test_recategorization_moves_the_amount(self):
+        self.aggregates.apply_categorized_event(self.container, _event())
+        self.aggregates.apply_categorized_event(self.container, _event(transaction_id="t-2", amount=5000))
+        self.aggregates.apply_categorized_event(
+            self.container, _event(amount=30000, category_id="c-salary", name="Gaji", category_type="Income")
+        )
+        doc = self._aggregate()
+        self.assertEqual((doc["total_expense"], doc["total_income"], doc["transaction_count"]), (5000.0, 30000.0, 2))
+        self.assertEqual(doc["categories"]["c-food"]["count"], 1)
+        self.assertEqual(doc["categories"]["c-salary"]["total"], 30000.0)
+
+    def test_concurrent_update_is_retried_on_fresh_etag(self):
+        self.aggregates.apply_categorized_event(self.container, _event())
+        # Writer lain menerapkan t-2 setelah kita membaca agregat -> 412, lalu retry
+        self.container.before_batch = lambda: self.aggregates.apply_categorized_event(
+            self.container, _event(transaction_id="t-2", amount=5000)
+        )
+        self.assertTrue(self.aggregates.apply_categorized_event(self.container, _event(transaction_id="t-3", amount=1000)))
+        doc = self._aggregate()
+        self.assertEqual((doc["total_expense"], doc["transaction_count"]), (31000.0, 3))
+
+    def test_concurrent_create_is_retried_as_replace(self):
+        self.container.before_batch = lambda: self.aggregates.apply_categorized_event(
+            self.container, _event(transaction_id="t-2", amount=5000)
+        )
+        self.assertTrue(self.aggregates.apply_categorized_event(self.container, _event()))
+        self.assertEqual(self._aggregate()["total_expense"], 30000.0)
+
+    def test_legacy_applied_map_is_honoured_and_migrated(self):
+        legacy_entry = {"category_id": "c-food", "name": "Makanan & Minuman", "category_type": "Expense", "amount": 25000.0}
+        legacy = self.aggregates._new_aggregate("u-1", "2025-11")
+        self.aggregates._apply_entry(legacy, legacy_entry, +1)
+        legacy["applied"] = {"t-1": legacy_entry}
+        self.container._store(legacy)
+
+        self.assertFalse(self.aggregates.apply_categorized_event(self.container, _event()))
+        self.assertTrue(self.aggregates.apply_categorized_event(self.container, _event(amount=20000)))
+        doc = self._aggregate()
+        self.assertEqual((doc["total_expense"], doc["transaction_count"]), (20000.0, 1))
+        self.assertEqual(doc["applied"], {})
+        self.assertEqual(self.container.items[("u-1", "agg-applied-2025-11-t-1")]["entry"]["amount"], 20000.0)
+
+    def test_persistent_conflicts_give_up(self):
+        container = self.container
+
+        def always_conflict(batch_operations, partition_key):
+            container._fail(0, 412)
+
+        container.execute_item_batch = always_conflict
+        with self.assertRaises(RuntimeError):
+            self.aggregates.apply_categorized_event(container, _event())
+
+    def test_other_batch_errors_are_raised(self):
+        container = self.container
+        container.execute_item_batch = lambda batch_operations, partition_key: container._fail(1, 413)
+        with self.assertRaises(self.aggregates.CosmosBatchOperationError):
+            self.aggregates.apply_categorized_event(container, _event())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import sys
+import types
+import threading
+import importlib.util
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ["ai_service", "api_gateway", "category_service", "report_service", "transaction_service", "user_service"]
+
+
+class _FakeCosmosClient:
+    @classmethod
+    def from_connection_string(cls, conn_str, transport=None):
+        return cls()
+
+    def get_database_client(self, name):
+        return types.SimpleNamespace(get_container_client=lambda container: f"{name}/{container}")
+
+
+def _load(service: str):
+    spec = importlib.util.spec_from_file_location(f"azure_clients_{service}", ROOT / service / "azure_clients.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module._build_transport = lambda: None
+    return module
+
+
+class GetCosmosContainerTest(unittest.TestCase):
+    def setUp(self):
+        cosmos = types.ModuleType("azure.cosmos")
+        cosmos.CosmosClient = _FakeCosmosClient
+        self._saved = {name: sys.modules.get(name) for name in ("azure", "azure.cosmos")}
+        sys.modules.setdefault("azure", types.ModuleType("azure"))
+        sys.modules["azure.cosmos"] = cosmos
+
+    def tearDown(self):
+        for name, module in self._saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+    def test_container_on_empty_cache_does_not_deadlock(self):
+        for service in SERVICES:
+            with self.subTest(service=service):
+                clients = _load(service)
+                result = {}
+                worker = threading.Thread(
+                    target=lambda: result.update(
+                        container=clients.get_cosmos_container("conn", "db", "items")
+                    ),
+                    daemon=True,
+                )
+                worker.start()
+                worker.join(timeout=5)
+                self.assertFalse(worker.is_alive(), "get_cosmos_container deadlocked")
+                self.assertEqual(result["container"], "db/items")
+                # Panggilan kedua memakai klien yang sama dari cache
+                self.assertIs(clients.get_cosmos_container("conn", "db", "items"), result["container"])
+
+    def test_copies_are_identical(self):
+        contents = {(ROOT / service / "azure_clients.py").read_text() for service in SERVICES}
+        self.assertEqual(len(contents), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import importlib.util
+import unittest
+from pathlib import Path
+
+from service_fakes import ServiceLoader
+
+ROOT = Path(__file__).resolve().parent.parent
+
+spec = importlib.util.spec_from_file_location("local_classifier", ROOT / "category_service" / "local_classifier.py")
+local_classifier = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(local_classifier)
+
+# function_app CategoryService butuh numpy (learned_classifier) dan requests
+HAS_SERVICE_DEPS = all(importlib.util.find_spec(name) for name in ("numpy", "requests"))
+
+
+class ParseAmountTest(unittest.TestCase):
+    def test_amounts_with_currency_marker_unit_or_thousand_separator(self):
+        cases = {
+            "Makan siang 25rb": 25000.0,
+            "Bensin 1,5 jt": 1500000.0,
+            "Indomaret Rp 66.900": 66900.0,
+            "Grab 15k": 15000.0,
+            "Belanja 66.900": 66900.0,
+            "Kopi Rp15000": 15000.0,
+            "Transfer 50rb lalu 200rb": 200000.0,
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(local_classifier.parse_amount(text), expected)
+
+    def test_plain_numbers_dates_and_references_are_ignored(self):
+        for text in ("Gaji 2025", "TRF 17/10/2025 WS95031", "Parkir lantai 3", "Tol km 12.5", "", None):
+            with self.subTest(text=text):
+                self.assertEqual(local_classifier.parse_amount(text), 0.0)
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_unambiguous_keyword_match(self):
+        result = local_classifier.classify("Go-Food nasi padang 45rb")
+        self.assertEqual((result["category_name"], result["category_type"]), ("Makanan & Minuman", "Expense"))
+        self.assertEqual(result["amount"], 45000.0)
+        self.assertEqual(result["ai_confidence"], local_classifier.CONFIDENCE_MULTI_TOKEN)
+        self.assertEqual(result["ai_service_used"], "local_classifier")
+
+    def test_single_token_and_income(self):
+        result = local_classifier.classify("GAJI OKTOBER")
+        self.assertEqual((result["category_name"], result["category_type"]), ("Gaji", "Income"))
+        self.assertEqual(result["ai_confidence"], local_classifier.CONFIDENCE_SINGLE_TOKEN)
+
+    def test_longest_match_wins(self):
+        # 'kopi kenangan' (merchant) bukan 'kopi' saja
+        trie = local_classifier.KeywordTrie()
+        trie.add("kopi", "A", "Expense")
+        trie.add("kopi kenangan", "B", "Expense")
+        self.assertEqual(trie.find_matches(["kopi", "kenangan", "kopi"]), [(("B", "Expense"), 2), (("A", "Expense"), 1)])
+
+    def test_ambiguous_or_unknown_goes_to_llm(self):
+        self.assertIsNone(local_classifier.classify("gofood indomaret"))
+        self.assertIsNone(local_classifier.classify("transfer ke budi"))
+
+
+class _FakeContainer:
+    def __init__(self):
+        self.patches = []
+
+    def patch_item(self, item, partition_key, patch_operations):
+        self.patches.append(patch_operations)
+
+
+class _FakeQueue:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message):
+        self.messages.append(message)
+
+
+@unittest.skipUnless(HAS_SERVICE_DEPS, "CategoryService dependencies (numpy, requests) not installed")
+class AmountLockTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = ServiceLoader("category_service")
+        self.app = self.loader.load("function_app")
+        self.container = _FakeContainer()
+        self.queue = _FakeQueue()
+        self.app.COSMOS_CONN_STR = "conn"
+        self.app.azure_clients.get_cosmos_container = lambda *args: self.container
+        self.app.azure_clients.get_queue_client = lambda *args: self.queue
+        self.app.get_or_create_category_snapshot = lambda container, name, category_type: {
+            "id": "c-1", "name": name, "category_type": category_type
+        }
+
+    def tearDown(self):
+        self.loader.restore()
+
+    def _patched_amount(self, transaction_doc: dict):
+        ai_result = {"category_name": "Transportasi", "category_type": "Expense", "amount": 66900.0, "ai_confidence": 0.9}
+        self.app._apply_categorization(dict(transaction_doc, id="t-1", user_id="u-1"), ai_result)
+        amounts = [op["value"] for op in self.container.patches[-1] if op["path"] == "/amount"]
+        return amounts[0] if amounts else None
+
+    def test_user_entered_amount_is_kept(self):
+        self.assertIsNone(self._patched_amount({"amount": 50000.0, "amount_source": "user"}))
+        self.assertIn('"amount": 50000.0', self.queue.messages[-1])
+
+    def test_imported_amount_is_kept(self):
+        self.assertIsNone(self._patched_amount({"amount": 50000.0, "import_hash": "abc"}))
+
+    def test_amount_without_explicit_source_is_replaced(self):
+        self.assertEqual(self._patched_amount({"amount": 0.0}), 66900.0)
+        self.assertEqual(self._patched_amount({"amount": 50000.0}), 66900.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import importlib.util
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent.parent
+POLICY_FILE = ROOT / "ai_service" / "model_routing_policy.json"
+
+
+def _load(**env):
+    with mock.patch.dict(os.environ, env):
+        spec = importlib.util.spec_from_file_location("model_router", ROOT / "ai_service" / "model_router.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+class RollingHistogramTest(unittest.TestCase):
+    def setUp(self):
+        self.model_router = _load()
+
+    def test_percentiles_and_error_rate(self):
+        histogram = self.model_router.RollingHistogram(window_seconds=300, slice_seconds=30)
+        for _ in range(90):
+            histogram.record(200, ok=True, now=1000)
+        for _ in range(10):
+            histogram.record(3000, ok=True, now=1000)
+        histogram.record(50, ok=False, now=1000)
+        summary = histogram.summary(now=1000)
+        self.assertEqual((summary["calls"], summary["errors"]), (101, 1))
+        self.assertEqual((summary["p50_ms"], summary["p95_ms"]), (250, 4000))
+        self.assertEqual(summary["error_rate"], round(1 / 101, 3))
+
+    def test_old_slices_leave_the_window(self):
+        histogram = self.model_router.RollingHistogram(window_seconds=60, slice_seconds=30)
+        histogram.record(40000, ok=True, now=1000)  # slice 990
+        histogram.record(100, ok=True, now=1040)    # slice 1020
+        self.assertEqual(histogram.summary(now=1040)["calls"], 2)
+        # Slice dibuang utuh begitu awalnya lebih tua dari window
+        summary = histogram.summary(now=1060)
+        self.assertEqual((summary["calls"], summary["p95_ms"]), (1, 250))
+        self.assertIsNone(histogram.summary(now=2000)["p95_ms"])
+
+
+class ChooseModelTest(unittest.TestCase):
+    def setUp(self):
+        self.model_router = _load(AI_MODEL_POLICY_FILE=str(POLICY_FILE), AI_MODEL_ROUTING_ENABLED="true")
+
+    def _mark_unhealthy(self, model: str, errors: int = 30):
+        for _ in range(errors):
+            self.model_router.record(model, 0.1, ok=False)
+
+    def test_cheapest_tier_that_fits_the_input(self):
+        choose = self.model_router.choose_model
+        self.assertEqual(choose(30, "text", "default"), "gemini-2.5-flash-lite")
+        self.assertEqual(choose(800, "text", "default"), "gemini-2.5-flash")
+        self.assertEqual(choose(10000, "batch", "default"), "gemini-2.5-pro")
+
+    def test_path_minimum_tier(self):
+        self.assertEqual(self.model_router.choose_model(30, "ocr_fallback", "default"), "gemini-2.5-flash")
+
+    def test_unhealthy_tier_falls_forward_then_back(self):
+        self._mark_unhealthy("gemini-2.5-flash-lite")
+        self.assertEqual(self.model_router.choose_model(30, "text", "default"), "gemini-2.5-flash")
+        self._mark_unhealthy("gemini-2.5-flash")
+        self._mark_unhealthy("gemini-2.5-pro")
+        # Semua tier sakit: tetap pakai tier awal
+        self.assertEqual(self.model_router.choose_model(30, "text", "default"), "gemini-2.5-flash-lite")
+
+    def test_stronger_tiers_unhealthy_uses_cheaper_tier(self):
+        self._mark_unhealthy("gemini-2.5-flash")
+        self._mark_unhealthy("gemini-2.5-pro")
+        self.assertEqual(self.model_router.choose_model(800, "text", "default"), "gemini-2.5-flash-lite")
+
+    def test_few_samples_are_treated_as_healthy(self):
+        self._mark_unhealthy("gemini-2.5-flash-lite", errors=5)
+        self.assertEqual(self.model_router.choose_model(30, "text", "default"), "gemini-2.5-flash-lite")
+
+    def test_observed_records_latency_and_errors(self):
+        def boom():
+            raise RuntimeError("429")
+
+        self.assertEqual(self.model_router.observed("gemini-2.5-flash", lambda x: x * 2)(21), 42)
+        with self.assertRaises(RuntimeError):
+            self.model_router.observed("gemini-2.5-flash", boom)()
+        stats = self.model_router.get_stats()["models"]["gemini-2.5-flash"]
+        self.assertEqual((stats["calls"], stats["errors"]), (2, 1))
+
+    def test_route_counts_in_stats(self):
+        self.model_router.choose_model(30, "text", "default")
+        self.model_router.choose_model(30, "ocr_fallback", "default")
+        stats = self.model_router.get_stats()
+        self.assertTrue(stats["enabled"])
+        self.assertEqual(stats["routes"], {"text:lite": 1, "ocr_fallback:standard": 1})
+
+
+class RoutingDisabledTest(unittest.TestCase):
+    def test_disabled_uses_caller_model(self):
+        model_router = _load(AI_MODEL_ROUTING_ENABLED="false")
+        self.assertEqual(model_router.choose_model(30, "text", "gemini-2.5-flash"), "gemini-2.5-flash")
+        self.assertFalse(model_router.get_stats()["enabled"])
+
+    def test_unreadable_policy_uses_caller_model(self):
+        with self.assertLogs(level="ERROR"):
+            model_router = _load(AI_MODEL_POLICY_FILE=str(ROOT / "missing-policy.json"), AI_MODEL_ROUTING_ENABLED="true")
+        self.assertEqual(model_router.choose_model(30, "text", "gemini-2.5-flash"), "gemini-2.5-flash")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import importlib.util
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ["ai_service", "category_service"]
+
+
+def _load(service: str, secret: str | None):
+    spec = importlib.util.spec_from_file_location(f"ocr_context_{service}", ROOT / service / "ocr_context.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.OCR_CONTEXT_SECRET = secret
+    return module
+
+
+class OcrContextTest(unittest.TestCase):
+    def test_signature_from_category_service_verifies_in_ai_service(self):
+        context = {"transaction_id": "t-1", "user_id": "u-1"}
+        signature = _load("category_service", "s3cret").sign(context)
+        ai_context = _load("ai_service", "s3cret")
+        self.assertTrue(ai_context.verify(dict(reversed(list(context.items()))), signature))
+
+    def test_tampered_context_or_wrong_secret_is_rejected(self):
+        context = {"transaction_id": "t-1", "user_id": "u-1"}
+        signer = _load("category_service", "s3cret")
+        signature = signer.sign(context)
+        self.assertFalse(signer.verify({"transaction_id": "t-1", "user_id": "u-2"}, signature))
+        self.assertFalse(_load("ai_service", "other").verify(context, signature))
+        self.assertFalse(signer.verify(context, None))
+        self.assertFalse(signer.verify("t-1", signature))
+
+    def test_missing_secret_never_verifies(self):
+        unsigned = _load("ai_service", None)
+        self.assertIsNone(unsigned.sign({"transaction_id": "t-1"}))
+        self.assertFalse(unsigned.verify({"transaction_id": "t-1"}, ""))
+
+    def test_copies_are_identical(self):
+        contents = {(ROOT / service / "ocr_context.py").read_text() for service in SERVICES}
+        self.assertEqual(len(contents), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
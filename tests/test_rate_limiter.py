@@ -0,0 +1,139 @@
+import importlib.util
+import threading
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load():
+    spec = importlib.util.spec_from_file_location("rate_limiter", ROOT / "ai_service" / "rate_limiter.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Throttled(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.rate_limiter = _load()
+
+    def _limiter(self, **overrides):
+        config = dict(rps=1000.0, burst=1000.0, initial_concurrency=4, min_concurrency=1, max_concurrency=6)
+        config.update(overrides)
+        return self.rate_limiter.AdaptiveLimiter("test", **config)
+
+    def test_additive_increase_and_multiplicative_decrease(self):
+        limiter = self._limiter()
+        for _ in range(4):
+            limiter.acquire(1)
+            limiter.release("success")
+        # +1/limit per sukses: kira-kira +1 per window (4 panggilan di limit 4)
+        self.assertAlmostEqual(limiter.limit, 5.0, delta=0.1)
+        before = limiter.limit
+
+        limiter.acquire(1)
+        limiter.release("throttled")
+        self.assertEqual(limiter.limit, before / 2)
+        for _ in range(3):
+            limiter.acquire(1)
+            limiter.release("throttled")
+        self.assertEqual(limiter.limit, 1.0)  # Tidak turun di bawah min_concurrency
+
+        snapshot = limiter.snapshot()
+        self.assertEqual((snapshot["calls"], snapshot["throttled"], snapshot["in_flight"]), (8, 4, 0))
+
+    def test_limit_never_exceeds_max_concurrency(self):
+        limiter = self._limiter(initial_concurrency=6)
+        for _ in range(50):
+            limiter.acquire(1)
+            limiter.release("success")
+        self.assertEqual(limiter.limit, 6)
+
+    def test_no_token_within_timeout_is_rejected(self):
+        limiter = self._limiter(rps=0.01, burst=1.0)
+        limiter.acquire(1)
+        limiter.release("success")
+        with self.assertRaises(self.rate_limiter.RateLimitExceeded):
+            limiter.acquire(0.05)
+        self.assertEqual(limiter.snapshot()["rejected"], 1)
+
+    def test_waiter_gets_the_slot_when_it_is_released(self):
+        limiter = self._limiter(initial_concurrency=1)
+        limiter.acquire(1)
+        acquired = threading.Event()
+
+        def waiter():
+            limiter.acquire(5)
+            acquired.set()
+
+        thread = threading.Thread(target=waiter, daemon=True)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))  # Slot concurrency masih dipakai
+        limiter.release("success")
+        self.assertTrue(acquired.wait(2))
+        thread.join(2)
+        limiter.release("success")
+        self.assertEqual(limiter.snapshot()["in_flight"], 0)
+
+
+class CallWithLimitsTest(unittest.TestCase):
+    def setUp(self):
+        self.rate_limiter = _load()
+        self.rate_limiter.AI_RATE_LIMIT_BACKOFF_BASE = 0.0
+        self.rate_limiter.AI_RATE_LIMIT_MAX_RETRIES = 2
+
+    def test_throttle_errors_are_retried(self):
+        outcomes = [_Throttled(429), _Throttled(503), "ok"]
+
+        def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(self.rate_limiter.call_with_limits("gemini", call), "ok")
+        stats = self.rate_limiter.get_stats()["gemini"]
+        self.assertEqual((stats["calls"], stats["throttled"], stats["retries"], stats["in_flight"]), (3, 2, 2, 0))
+
+    def test_retries_exhausted_raise_rate_limit_exceeded(self):
+        def call():
+            raise _Throttled(429)
+
+        with self.assertRaises(self.rate_limiter.RateLimitExceeded):
+            self.rate_limiter.call_with_limits("gemini", call)
+        self.assertEqual(self.rate_limiter.get_stats()["gemini"]["calls"], 3)
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        def call():
+            calls.append(1)
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            self.rate_limiter.call_with_limits("azure-ocr", call)
+        stats = self.rate_limiter.get_stats()["azure-ocr"]
+        self.assertEqual((len(calls), stats["errors"], stats["in_flight"]), (1, 1, 0))
+
+    def test_is_throttle_error(self):
+        self.assertTrue(self.rate_limiter.is_throttle_error(_Throttled(429)))
+        azure_error = Exception()
+        azure_error.status_code = 503
+        self.assertTrue(self.rate_limiter.is_throttle_error(azure_error))
+        self.assertFalse(self.rate_limiter.is_throttle_error(_Throttled(500)))
+
+    def test_overrides_from_config(self):
+        self.rate_limiter._overrides = {"azure-ocr": {"max_concurrency": 2, "initial_concurrency": 2}}
+        limiter = self.rate_limiter.get_limiter("azure-ocr")
+        self.assertEqual((limiter.max_concurrency, limiter.limit), (2, 2.0))
+        self.assertIs(self.rate_limiter.get_limiter("azure-ocr"), limiter)
+
+
+if __name__ == "__main__":
+    unittest.main()
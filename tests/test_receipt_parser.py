@@ -0,0 +1,102 @@
+import importlib.util
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+spec = importlib.util.spec_from_file_location("receipt_parser", ROOT / "ai_service" / "receipt_parser.py")
+receipt_parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(receipt_parser)
+
+INDOMARET_RECEIPT = """
+INDOMARET
+PT INDOMARCO PRISMATAMA
+JL. MERDEKA NO. 1 BANDUNG
+NPWP 01.337.994.6-092.000
+17/10/2025 13:45 KASIR: ANI
+AQUA 600ML 2 x 3.500 7.000
+INDOMIE GORENG 5 x 3.100 15.500
+ROTI TAWAR 14.900
+SUBTOTAL 37.400
+HEMAT 1.000
+TOTAL 36.400
+TUNAI 50.000
+KEMBALI 13.600
+"""
+
+CAFE_RECEIPT = """
+Kedai Kopi Senja
+Jl. Braga 10
+Es Kopi Susu 25.000
+Croissant 30.000
+TOTAL
+55.000
+GRAND TOTAL Rp 60.500,-
+"""
+
+CATEGORY_PROMPT = "Nama kategori HARUS salah satu dari: 'Makanan & Minuman', 'Transportasi', 'Kebutuhan Harian', 'Lainnya'."
+
+
+class ParseAmountTest(unittest.TestCase):
+    def test_indonesian_formats(self):
+        cases = {
+            "TOTAL 66.900": 66900.0,
+            "Rp 1.234.567,50": 1234567.5,
+            "150000": 150000.0,
+            "TOTAL 66,900": 66900.0,
+            "Rp 15.000,-": 15000.0,
+            "2 x 3.500 7.000": 7000.0,
+            "MEJA 12": 0.0,
+            "": 0.0,
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(receipt_parser.parse_amount(text), expected)
+
+
+class ParseReceiptTest(unittest.TestCase):
+    def test_total_skips_subtotal_change_and_cash(self):
+        parsed = receipt_parser.parse_receipt(INDOMARET_RECEIPT)
+        self.assertEqual((parsed.total, parsed.total_keyword), (36400.0, "TOTAL"))
+        self.assertEqual(parsed.merchant, "INDOMARET")
+        self.assertTrue(parsed.is_confident)
+
+    def test_relevant_lines_keep_items_and_drop_header_noise(self):
+        parsed = receipt_parser.parse_receipt(INDOMARET_RECEIPT)
+        self.assertIn("ROTI TAWAR 14.900", parsed.relevant_lines)
+        self.assertEqual(parsed.relevant_lines[-1], "TOTAL 36.400")
+        joined = "\n".join(parsed.relevant_lines)
+        for noise in ("NPWP", "KASIR", "KEMBALI", "TUNAI", "SUBTOTAL", "JL. MERDEKA"):
+            self.assertNotIn(noise, joined)
+
+    def test_more_specific_keyword_and_amount_on_next_line(self):
+        parsed = receipt_parser.parse_receipt(CAFE_RECEIPT)
+        self.assertEqual((parsed.total, parsed.total_keyword), (60500.0, "GRAND TOTAL"))
+        parsed = receipt_parser.parse_receipt(CAFE_RECEIPT.replace("GRAND TOTAL Rp 60.500,-", ""))
+        self.assertEqual(parsed.total, 55000.0)
+        self.assertEqual(parsed.merchant, "Kedai Kopi Senja")
+
+    def test_unreadable_receipt_is_not_confident(self):
+        parsed = receipt_parser.parse_receipt("#### 12\n$$ 7")
+        self.assertEqual(parsed.total, 0.0)
+        self.assertFalse(parsed.is_confident)
+
+    def test_compact_prompt_text(self):
+        text = receipt_parser.compact_prompt_text(receipt_parser.parse_receipt(INDOMARET_RECEIPT))
+        self.assertTrue(text.startswith("Merchant: INDOMARET. Total: 36400."))
+        self.assertIn("INDOMIE GORENG", text)
+
+
+class CategoryHintTest(unittest.TestCase):
+    def test_known_merchant_with_allowed_category(self):
+        self.assertEqual(receipt_parser.category_hint("INDOMARET CABANG 12", CATEGORY_PROMPT), ("Kebutuhan Harian", "Expense"))
+        self.assertEqual(receipt_parser.category_hint("Pertamina SPBU 34.401", CATEGORY_PROMPT), ("Transportasi", "Expense"))
+
+    def test_category_outside_the_prompt_or_unknown_merchant(self):
+        self.assertIsNone(receipt_parser.category_hint("STARBUCKS", "Nama kategori: 'Transportasi', 'Lainnya'."))
+        self.assertIsNone(receipt_parser.category_hint("Kedai Kopi Senja", CATEGORY_PROMPT))
+        self.assertIsNone(receipt_parser.category_hint(None, CATEGORY_PROMPT))
+
+
+if __name__ == "__main__":
+    unittest.main()
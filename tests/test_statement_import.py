@@ -0,0 +1,57 @@
+import json
+import unittest
+
+from service_fakes import FakeRequest, ServiceLoader
+
+
+class ImportStatementTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = ServiceLoader("transaction_service")
+        self.app = self.loader.load("function_app")
+        self.app._get_user_info_from_token = lambda req: {"user_id": "u-1"}
+        self.app._get_container = lambda: None
+        self.app._enqueue_for_categorization = lambda docs: None
+        self.stored = {}
+
+        def find_existing(container, user_id, ids):
+            return {doc_id for doc_id in ids if doc_id in self.stored}
+
+        def write_batch(container, user_id, docs):
+            self.stored.update({doc["id"]: doc for doc in docs})
+            return [{"status": "created"} for _ in docs]
+
+        self.app._find_existing_ids = find_existing
+        self.app._write_transactions_batch = write_batch
+
+    def tearDown(self):
+        self.loader.restore()
+
+    def _import(self, body: str, content_type: str) -> dict:
+        response = self.app.ImportStatement(
+            FakeRequest(headers={"Content-Type": content_type}, body=body.encode("utf-8"), method="POST")
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_body())
+
+    def test_identical_csv_rows_import_once_each_and_reimport_is_deduplicated(self):
+        csv_text = (
+            "Tanggal,Keterangan,Jumlah\n"
+            "01/10/2025,BIAYA ADM,-10.000\n"
+            "01/10/2025,BIAYA ADM,-10.000\n"
+            "02/10/2025,KOPI,-25.000\n"
+        )
+        first = self._import(csv_text, "text/csv")
+        self.assertEqual((first["imported"], first["duplicates"]), (3, 0))
+
+        second = self._import(csv_text, "text/csv")
+        self.assertEqual((second["imported"], second["duplicates"]), (0, 3))
+        self.assertTrue(all(doc["amount_source"] == "user" and doc["import_hash"] for doc in self.stored.values()))
+
+    def test_repeated_fitid_in_one_file_is_a_duplicate(self):
+        block = "<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20251017\n<TRNAMT>25000\n<FITID>A1\n<NAME>INDOMARET\n</STMTTRN>\n"
+        summary = self._import("OFXHEADER:100\n<OFX>\n" + block + block + "</OFX>\n", "application/x-ofx")
+        self.assertEqual((summary["rows_read"], summary["imported"], summary["duplicates"]), (2, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import importlib.util
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+spec = importlib.util.spec_from_file_location("statement_parser", ROOT / "transaction_service" / "statement_parser.py")
+statement_parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(statement_parser)
+
+
+def _rows(text: str, statement_format: str) -> list:
+    return list(statement_parser.iter_statement_rows(text.splitlines(keepends=True), statement_format))
+
+
+class ParseValuesTest(unittest.TestCase):
+    def test_indonesian_and_english_amounts(self):
+        cases = {
+            "66.900": 66900.0,
+            "1.234.567,89": 1234567.89,
+            "Rp 15.000,-": 15000.0,
+            "1,234.50": 1234.5,
+            "(25.000)": -25000.0,
+            "50.000 DB": -50000.0,
+            "75.000 CR": 75000.0,
+            "12,5": 12.5,
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(statement_parser.parse_indonesian_amount(raw), expected)
+
+    def test_invalid_amount_raises(self):
+        for raw in ("", "abc", None):
+            with self.subTest(raw=raw), self.assertRaises(ValueError):
+                statement_parser.parse_indonesian_amount(raw)
+
+    def test_dates(self):
+        cases = {
+            "17/10/2025": "2025-10-17T00:00:00",
+            "17-10-25": "2025-10-17T00:00:00",
+            "2025-10-17": "2025-10-17T00:00:00",
+            "17 Okt 2025": "2025-10-17T00:00:00",
+            "17-Des-2025": "2025-12-17T00:00:00",
+            "17/10/2025 13:45": "2025-10-17T00:00:00",
+            "20251017": "2025-10-17T00:00:00",
+            "20251017120000[-7:MST]": "2025-10-17T12:00:00",
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(statement_parser.parse_indonesian_date(raw), expected)
+
+
+class IterRowsTest(unittest.TestCase):
+    def test_csv_with_debit_credit_columns_reports_bad_rows_and_continues(self):
+        rows = _rows(
+            "Tanggal;Keterangan;Debet;Kredit\n"
+            "01/10/2025;BIAYA ADM;10.000;\n"
+            "02/10/2025;GAJI OKTOBER;;5.000.000,00\n"
+            "bukan tanggal;TRANSFER;20.000;\n"
+            "\n"
+            "03/10/2025;KOPI KENANGAN;25.000;\n",
+            "csv",
+        )
+        self.assertEqual(len(rows), 4)
+        adm, gaji, invalid, kopi = rows
+        self.assertEqual((adm.direction, adm.amount, adm.line_number), ("debit", 10000.0, 2))
+        self.assertEqual((gaji.direction, gaji.amount), ("credit", 5000000.0))
+        self.assertIsInstance(invalid, statement_parser.StatementParseError)
+        self.assertEqual(invalid.line_number, 4)
+        self.assertEqual((kopi.description, kopi.transaction_date), ("KOPI KENANGAN", "2025-10-03T00:00:00"))
+
+    def test_csv_without_required_columns(self):
+        rows = _rows("foo,bar\n1,2\n", "csv")
+        self.assertEqual(len(rows), 1)
+        self.assertIsInstance(rows[0], statement_parser.StatementParseError)
+
+    def test_ofx_sgml_without_closing_tags(self):
+        rows = _rows(
+            "OFXHEADER:100\n"
+            "<OFX><BANKTRANLIST>\n"
+            "<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20251017\n<TRNAMT>25000.00\n<FITID>A1\n<NAME>INDOMARET\n</STMTTRN>\n"
+            "<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20251018\n<TRNAMT>100000.00\n<FITID>A2\n<NAME>GAJI\n<MEMO>PT MAJU\n",
+            "ofx",
+        )
+        self.assertEqual([row.external_id for row in rows], ["A1", "A2"])
+        self.assertEqual((rows[0].direction, rows[0].amount), ("debit", 25000.0))
+        self.assertEqual((rows[1].direction, rows[1].description), ("credit", "GAJI - PT MAJU"))
+
+    def test_detect_format(self):
+        self.assertEqual(statement_parser.detect_format("anything", "mutasi.OFX"), "ofx")
+        self.assertEqual(statement_parser.detect_format("OFXHEADER:100"), "ofx")
+        self.assertEqual(statement_parser.detect_format("Tanggal,Keterangan,Jumlah"), "csv")
+
+
+class RowHashTest(unittest.TestCase):
+    CSV = (
+        "Tanggal,Keterangan,Jumlah\n"
+        "01/10/2025,BIAYA ADM,-10.000\n"
+        "01/10/2025,BIAYA ADM,-10.000\n"
+        "01/10/2025,Biaya  adm,-10.000\n"
+        "02/10/2025,BIAYA ADM,-10.000\n"
+    )
+
+    def _hashes(self, user_id: str = "u-1", window: int = 1000) -> list[str]:
+        counter = statement_parser.OccurrenceCounter(window)
+        hashes = []
+        for row in _rows(self.CSV, "csv"):
+            occurrence = counter.next(statement_parser.row_basis(user_id, row))
+            hashes.append(statement_parser.row_hash(user_id, row, occurrence))
+        return hashes
+
+    def test_identical_rows_in_one_file_stay_distinct(self):
+        hashes = self._hashes()
+        # Tiga biaya admin identik (deskripsi dinormalisasi) di hari yang sama + satu di hari lain
+        self.assertEqual(len(set(hashes)), 4)
+
+    def test_reimport_produces_the_same_hashes(self):
+        self.assertEqual(self._hashes(), self._hashes())
+        self.assertNotEqual(self._hashes("u-1"), self._hashes("u-2"))
+
+    def test_first_occurrence_matches_plain_row_hash(self):
+        row = _rows(self.CSV, "csv")[0]
+        self.assertEqual(statement_parser.row_hash("u-1", row, 0), statement_parser.row_hash("u-1", row))
+
+    def test_occurrence_counter_forgets_beyond_window(self):
+        counter = statement_parser.OccurrenceCounter(window=2)
+        self.assertEqual([counter.next("a"), counter.next("a")], [0, 1])
+        counter.next("b")
+        counter.next("c")  # 'a' terdorong keluar dari window
+        self.assertEqual(counter.next("a"), 0)
+        self.assertEqual(counter.next("c"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
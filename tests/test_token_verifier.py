@@ -0,0 +1,142 @@
+import sys
+import time
+import types
+import importlib.util
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ["api_gateway", "report_service", "transaction_service", "user_service"]
+
+
+class _FakeJWT(types.ModuleType):
+    """jwt palsu: token 'valid:<user_id>:<exp>' valid, selain itu PyJWTError."""
+
+    class PyJWTError(Exception):
+        pass
+
+    def __init__(self):
+        super().__init__("jwt")
+        self.decoded = []
+
+    def decode(self, token, key, algorithms):
+        self.decoded.append(token)
+        parts = token.split(":")
+        if len(parts) != 3 or parts[0] != "valid":
+            raise self.PyJWTError("bad token")
+        return {"user_id": parts[1], "exp": float(parts[2])}
+
+
+class _Request:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class TokenVerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.jwt = _FakeJWT()
+        self._saved = sys.modules.get("jwt")
+        sys.modules["jwt"] = self.jwt
+        spec = importlib.util.spec_from_file_location("token_verifier", ROOT / "api_gateway" / "token_verifier.py")
+        self.verifier = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.verifier)
+        self.verifier.JWT_SECRET_KEY = "jwt-secret"
+        self.verifier.IDENTITY_HEADER_SECRET = "header-secret"
+
+    def tearDown(self):
+        if self._saved is None:
+            sys.modules.pop("jwt", None)
+        else:
+            sys.modules["jwt"] = self._saved
+
+    def _token(self, user_id="u-1", ttl=3600) -> str:
+        return f"valid:{user_id}:{time.time() + ttl}"
+
+    # --- Header identitas gateway ---
+
+    def test_identity_header_round_trip(self):
+        header = self.verifier.sign_identity({"user_id": "u-1", "email": "a@b.c", "iat": 1})
+        claims = self.verifier.verify_identity_header(header)
+        self.assertEqual((claims["user_id"], claims["email"]), ("u-1", "a@b.c"))
+        self.assertGreater(claims["iat"], 1)  # iat header, bukan iat token asal
+
+    def test_tampered_header_is_rejected(self):
+        header = self.verifier.sign_identity({"user_id": "u-1"})
+        encoded, signature = header.rsplit(".", 1)
+        forged = self.verifier.sign_identity({"user_id": "u-2"}).rsplit(".", 1)[0]
+        self.assertIsNone(self.verifier.verify_identity_header(f"{forged}.{signature}"))
+        self.assertIsNone(self.verifier.verify_identity_header(f"{encoded}.{'0' * len(signature)}"))
+        self.assertIsNone(self.verifier.verify_identity_header("not-a-header"))
+        self.assertIsNone(self.verifier.verify_identity_header(f"%%%.{signature}"))
+
+    def test_header_signed_with_another_secret_is_rejected(self):
+        header = self.verifier.sign_identity({"user_id": "u-1"})
+        self.verifier.IDENTITY_HEADER_SECRET = "other-secret"
+        self.assertIsNone(self.verifier.verify_identity_header(header))
+
+    def test_stale_header_or_expired_token_is_rejected(self):
+        header = self.verifier.sign_identity({"user_id": "u-1"})
+        later = time.time() + self.verifier.IDENTITY_HEADER_MAX_AGE_SECONDS + 1
+        with mock.patch.object(self.verifier.time, "time", return_value=later):
+            self.assertIsNone(self.verifier.verify_identity_header(header))
+
+        expired = self.verifier.sign_identity({"user_id": "u-1", "exp": time.time() - 1})
+        self.assertIsNone(self.verifier.verify_identity_header(expired))
+
+    def test_without_secret_header_is_never_issued_or_trusted(self):
+        header = self.verifier.sign_identity({"user_id": "u-1"})
+        self.verifier.IDENTITY_HEADER_SECRET = None
+        self.assertIsNone(self.verifier.sign_identity({"user_id": "u-1"}))
+        self.assertIsNone(self.verifier.verify_identity_header(header))
+        self.assertIsNone(self.verifier.verify_request(_Request({self.verifier.IDENTITY_HEADER: header})))
+
+    def test_verify_request_prefers_valid_identity_header(self):
+        header = self.verifier.sign_identity({"user_id": "u-1"})
+        claims = self.verifier.verify_request(_Request({self.verifier.IDENTITY_HEADER: header}))
+        self.assertEqual(claims["user_id"], "u-1")
+        self.assertEqual(self.jwt.decoded, [])  # Tanpa decode JWT
+
+    def test_gateway_ignores_client_identity_header(self):
+        header = self.verifier.sign_identity({"user_id": "admin"})
+        request = _Request({self.verifier.IDENTITY_HEADER: header, "Authorization": f"Bearer {self._token('u-1')}"})
+        self.assertEqual(self.verifier.verify_request(request, allow_identity_header=False)["user_id"], "u-1")
+        self.assertIsNone(self.verifier.verify_request(_Request({self.verifier.IDENTITY_HEADER: header}), allow_identity_header=False))
+
+    def test_invalid_identity_header_falls_back_to_bearer(self):
+        request = _Request({self.verifier.IDENTITY_HEADER: "forged.sig", "Authorization": f"Bearer {self._token('u-1')}"})
+        self.assertEqual(self.verifier.verify_request(request)["user_id"], "u-1")
+
+    # --- Cache JWT ---
+
+    def test_valid_token_is_cached_and_invalid_is_not(self):
+        token = self._token()
+        self.assertEqual(self.verifier.verify_token(token)["user_id"], "u-1")
+        self.assertEqual(self.verifier.verify_token(token)["user_id"], "u-1")
+        self.assertEqual(self.jwt.decoded, [token])
+
+        self.assertIsNone(self.verifier.verify_token("garbage"))
+        self.assertIsNone(self.verifier.verify_token("garbage"))
+        stats = self.verifier.get_stats()
+        self.assertEqual((stats["hits"], stats["invalid"], stats["size"]), (1, 2, 1))
+
+    def test_cache_entry_expires_with_the_token(self):
+        token = self._token(ttl=5)
+        self.verifier.verify_token(token)
+        with mock.patch.object(self.verifier.time, "time", return_value=time.time() + 10):
+            self.verifier.verify_token(token)
+        self.assertEqual(len(self.jwt.decoded), 2)
+
+    def test_cache_is_bounded(self):
+        self.verifier.TOKEN_CACHE_MAX_ENTRIES = 2
+        for user_id in ("a", "b", "c"):
+            self.verifier.verify_token(self._token(user_id))
+        self.assertEqual(self.verifier.get_stats()["size"], 2)
+
+    def test_copies_are_identical(self):
+        contents = {(ROOT / service / "token_verifier.py").read_text() for service in SERVICES}
+        self.assertEqual(len(contents), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
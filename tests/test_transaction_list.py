@@ -0,0 +1,130 @@
+import json
+import types
+import unittest
+
+from service_fakes import FakeRequest, ServiceLoader
+
+
+class _FakePager:
+    def __init__(self, items):
+        self._pages = iter([items])
+        self.continuation_token = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._pages)
+
+
+class _FakeContainer:
+    def __init__(self, items):
+        self.items = items
+        self.queries = []
+
+    def query_items(self, query, parameters, partition_key, max_item_count=None, **kwargs):
+        self.queries.append((query, parameters))
+        return type("Iterable", (), {"by_page": lambda _, token=None: _FakePager(self.items)})()
+
+
+class GetUserTransactionsTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = ServiceLoader("transaction_service")
+        self.app = self.loader.load("function_app")
+        self.app._get_user_info_from_token = lambda req: {"user_id": "u-1"}
+
+    def tearDown(self):
+        self.loader.restore()
+
+    def _list(self, items, params=None):
+        container = _FakeContainer(items)
+        self.app._get_container = lambda: container
+        response = self.app.GetUserTransactions(FakeRequest(params=params))
+        return response, container
+
+    def test_flagged_receipt_returns_duplicate_fields(self):
+        response, _ = self._list([
+            {"id": "t-2", "type": "transaction", "input_type": "image", "image_url": "https://blob/t-2.jpg",
+             "duplicate_of": "t-1", "duplicate_distance": 3},
+            {"id": "t-1", "type": "transaction", "input_type": "image", "image_url": "https://blob/t-1.jpg"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        flagged, original = json.loads(response.get_body())["data"]
+        self.assertEqual((flagged["duplicate_of"], flagged["duplicate_distance"]), ("t-1", 3))
+        self.assertIsNone(original["duplicate_of"])
+        self.assertIsNone(original["duplicate_distance"])
+
+    def test_projection_includes_duplicate_fields(self):
+        _, container = self._list([])
+        query, _ = container.queries[0]
+        self.assertIn("c.duplicate_of", query)
+        self.assertIn("c.duplicate_distance", query)
+
+    def test_filters_reach_the_query(self):
+        _, container = self._list([], params={"category_id": "c-1", "min_amount": "1000"})
+        query, parameters = container.queries[0]
+        self.assertIn("c.category.id = @categoryId", query)
+        self.assertIn({"name": "@minAmount", "value": 1000.0}, parameters)
+
+    def test_offset_date_bounds_are_normalised_to_stored_utc(self):
+        _, container = self._list([], params={"from": "2025-11-30T07:00:00+07:00", "to": "2025-11-30T23:59:59Z"})
+        _, parameters = container.queries[0]
+        self.assertIn({"name": "@fromDate", "value": "2025-11-30T00:00:00"}, parameters)
+        self.assertIn({"name": "@toDate", "value": "2025-11-30T23:59:59"}, parameters)
+
+    def test_date_only_upper_bound_covers_the_whole_day(self):
+        _, container = self._list([], params={"to": "2025-11-30"})
+        query, parameters = container.queries[0]
+        self.assertIn("c.transaction_date < @toDate", query)
+        self.assertIn({"name": "@toDate", "value": "2025-12-01"}, parameters)
+
+    def test_invalid_filter_is_bad_request(self):
+        response, container = self._list([], params={"min_amount": "banyak"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(container.queries, [])
+
+
+class _FakeBlobClient:
+    account_name, container_name, blob_name, url = "acct", "exports", "u-1/file", "https://acct/exports/u-1/file"
+
+    def __init__(self):
+        self.blocks = []
+
+    def stage_block(self, block_id, data):
+        self.blocks.append(data)
+
+    def commit_block_list(self, blocks, content_settings=None):
+        pass
+
+
+class ExportTransactionsTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = ServiceLoader("transaction_service")
+        self.app = self.loader.load("function_app")
+        self.app._get_user_info_from_token = lambda req: {"user_id": "u-1"}
+        self.blob_client = _FakeBlobClient()
+        container_client = types.SimpleNamespace(
+            create_container=lambda: None, get_blob_client=lambda name: self.blob_client
+        )
+        blob_service = types.SimpleNamespace(
+            credential=types.SimpleNamespace(account_key="key"),
+            get_container_client=lambda name: container_client,
+        )
+        self.app.azure_clients.get_blob_service_client = lambda conn_str: blob_service
+
+    def tearDown(self):
+        self.loader.restore()
+
+    def test_export_uses_the_list_query(self):
+        params = {"from": "2025-01-01", "to": "2025-01-31", "category_type": "Expense", "format": "csv"}
+        container = _FakeContainer([{"id": "t-1", "amount": 5000, "category": {"name": "Transportasi"}}])
+        self.app._get_container = lambda: container
+        response = self.app.ExportTransactions(FakeRequest(params=params))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_body())["total_rows"], 1)
+        self.assertEqual(container.queries, [self.app._build_transaction_query("u-1", params)])
+
+
+if __name__ == "__main__":
+    unittest.main()
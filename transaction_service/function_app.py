@@ -4,12 +4,18 @@ import json
 import uuid
 import os
 import hashlib
-import jwt # Pastikan library PyJWT terinstall
-from datetime import datetime
-import reverse_geocoder as rg
-from azure.cosmos import CosmosClient
-from azure.storage.queue import QueueClient
-from azure.storage.blob import BlobServiceClient
+import base64
+import io
+import csv
+from datetime import datetime, timedelta, timezone
+from azure.cosmos.exceptions import CosmosBatchOperationError
+from azure.storage.blob import BlobBlock, BlobSasPermissions, ContentSettings, generate_blob_sas
+import azure_clients
+import token_verifier
+import statement_parser
+import image_normalizer
+import image_hash_index
+import geocoder
 
 # --- KONFIGURASI ENVIRONMENT ---
 COSMOS_CONN_STR = os.environ.get("COSMOS_CONN_STR")
@@ -19,52 +25,401 @@ CONTAINER_NAME = os.environ.get("COSMOS_CONTAINER_NAME")
 OUTPUT_QUEUE_NAME = os.environ.get("STORAGE_QUEUE_NAME")
 BLOB_CONTAINER_NAME = "receipt-images"
 
-# Konfigurasi JWT
-JWT_SECRET_KEY = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = "HS256"
+# Konfigurasi Pagination (transaction/list)
+DEFAULT_PAGE_SIZE = int(os.environ.get("TRANSACTION_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("TRANSACTION_MAX_PAGE_SIZE", "200"))
+
+# Field yang dibutuhkan list view (projection di sisi Cosmos, bukan SELECT *)
+LIST_VIEW_FIELDS = [
+    "id", "type", "amount", "description", "transaction_date", "image_url",
+    "location", "category", "source", "input_type", "is_processed", "ai_confidence",
+    "duplicate_of", "duplicate_distance"
+]
+
+# Konfigurasi Bulk Ingest (transaction/batch)
+# Cosmos transactional batch maksimal 100 operasi per partition key
+BATCH_MAX_ITEMS = int(os.environ.get("TRANSACTION_BATCH_MAX_ITEMS", "500"))
+COSMOS_BATCH_CHUNK_SIZE = 100
+# Batas aman isi pesan Storage Queue (limit 64 KB, sisakan ruang untuk base64)
+QUEUE_MESSAGE_MAX_BYTES = 45000
+
+# Konfigurasi Export (transaction/export)
+# Hasil export ditulis bertahap (block per block) ke Blob Storage, lalu client
+# mengunduh langsung dari URL SAS; service & gateway tidak memegang seluruh data.
+EXPORT_BLOB_CONTAINER_NAME = "transaction-exports"
+EXPORT_PAGE_SIZE = int(os.environ.get("TRANSACTION_EXPORT_PAGE_SIZE", "500"))
+EXPORT_BLOCK_BYTES = 4 * 1024 * 1024
+EXPORT_LINK_TTL_MINUTES = int(os.environ.get("TRANSACTION_EXPORT_LINK_TTL_MINUTES", "60"))
+EXPORT_CSV_COLUMNS = [
+    "id", "transaction_date", "description", "amount", "category_id", "category_name",
+    "category_type", "source", "input_type", "city", "country", "is_processed"
+]
+
+# Konfigurasi Import Mutasi Rekening (transaction/import)
+IMPORT_CHUNK_SIZE = min(int(os.environ.get("TRANSACTION_IMPORT_CHUNK_SIZE", "100")), COSMOS_BATCH_CHUNK_SIZE)
+IMPORT_MAX_ERROR_SAMPLES = 20
+# Jumlah basis baris terakhir yang diingat untuk menghitung baris identik (memori terbatas)
+IMPORT_DEDUPE_WINDOW = int(os.environ.get("TRANSACTION_IMPORT_DEDUPE_WINDOW", "1000"))
 
 # Inisialisasi Function App (V2 Model)
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+# Preload KD-tree reverse geocoder saat worker start (bukan di request pertama)
+try:
+    geocoder.warm_up()
+except Exception as e:
+    logging.warning(f"Geocoder warm-up failed, will retry on first lookup: {e}")
+
 # --- HELPER FUNCTIONS ---
 
 def _get_user_info_from_token(req: func.HttpRequest) -> dict | None:
     """
-    Validasi Token JWT dan return payloadnya.
+    Validasi Token JWT dan return payloadnya (lewat token_verifier: cache + header identitas gateway).
+    """
+    return token_verifier.verify_request(req)
+
+_blob_container_ready = False
+
+class _HashingReader:
+    """
+    Bungkus stream upload: setiap read() ikut meng-update SHA-256, jadi digest
+    didapat sambil streaming ke Blob tanpa membaca file dua kali.
     """
-    auth_header = req.headers.get('Authorization')
-    if not auth_header:
-        return None
-    
-    try:
-        parts = auth_header.split(' ')
-        if len(parts) != 2 or parts[0].lower() != 'bearer':
-            return None
-        
-        token = parts[1]
-        decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return decoded
-    except Exception as e:
-        logging.error(f"Token invalid: {e}")
-        return None
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        if chunk:
+            self._sha256.update(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
 
 def upload_image_to_blob(file, filename):
     """
-    Upload file gambar ke Azure Blob Storage
+    Upload file gambar ke Azure Blob Storage (setelah dinormalisasi, lihat image_normalizer.py).
+    Return (url, sha256 hex byte yang disimpan, info normalisasi) atau (None, None, None) jika gagal.
     """
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(STORAGE_CONN_STR)
+        global _blob_container_ready
+        blob_service_client = azure_clients.get_blob_service_client(STORAGE_CONN_STR)
         container_client = blob_service_client.get_container_client(BLOB_CONTAINER_NAME)
         
-        if not container_client.exists():
-            container_client.create_container()
+        # Cek/buat container cukup sekali per worker
+        if not _blob_container_ready:
+            if not container_client.exists():
+                container_client.create_container()
+            _blob_container_ready = True
+
+        upload_stream, normalization_info = image_normalizer.normalize_image(file.stream)
+        content_type = "image/jpeg" if normalization_info["normalized"] else (file.content_type or "application/octet-stream")
 
         blob_client = container_client.get_blob_client(filename)
-        blob_client.upload_blob(file.stream, overwrite=True)
-        return blob_client.url
+        reader = _HashingReader(upload_stream)
+        blob_client.upload_blob(reader, overwrite=True, content_settings=ContentSettings(content_type=content_type))
+        return blob_client.url, reader.hexdigest(), normalization_info
     except Exception as e:
         logging.error(f"Error uploading blob: {e}")
+        return None, None, None
+
+def _encode_continuation_token(token: str | None) -> str | None:
+    """
+    Bungkus continuation token Cosmos jadi string opaque (base64 URL-safe)
+    supaya aman dikirim lewat query string.
+    """
+    if not token:
+        return None
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii")
+
+def _decode_continuation_token(token: str | None) -> str | None:
+    """
+    Kebalikan dari _encode_continuation_token. Raise ValueError jika token rusak.
+    """
+    if not token:
         return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+    except Exception:
+        raise ValueError("Invalid continuation_token")
+
+def _parse_page_size(raw_value: str | None) -> int:
+    """
+    Ambil page_size dari query param, dibatasi antara 1 dan MAX_PAGE_SIZE.
+    """
+    if not raw_value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(raw_value)
+    except ValueError:
+        raise ValueError("page_size must be an integer")
+    if page_size < 1:
+        raise ValueError("page_size must be greater than 0")
+    return min(page_size, MAX_PAGE_SIZE)
+
+def _to_stored_datetime(value: datetime) -> datetime:
+    """
+    transaction_date disimpan sebagai ISO UTC tanpa offset (datetime.utcnow()).
+    Datetime dengan offset dikonversi ke UTC lalu offset-nya dibuang, supaya
+    perbandingan string di Cosmos tetap benar.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _parse_date_bound(raw_value: str, param_name: str, is_upper: bool) -> tuple[str, str]:
+    """
+    Ubah nilai 'from'/'to' jadi (operator, nilai ISO) untuk dibandingkan dengan
+    c.transaction_date (string ISO, jadi perbandingan leksikografis aman).
+    Tanggal tanpa jam ('2025-11-30') untuk 'to' dianggap inklusif satu hari penuh.
+    Datetime dengan offset ('...+07:00' / 'Z') dinormalisasi ke UTC.
+    """
+    try:
+        parsed = _to_stored_datetime(datetime.fromisoformat(raw_value))
+    except ValueError:
+        raise ValueError(f"{param_name} must be an ISO date (YYYY-MM-DD) or datetime")
+
+    is_date_only = len(raw_value) == 10
+    if not is_upper:
+        return ">=", parsed.isoformat()
+    if is_date_only:
+        return "<", (parsed + timedelta(days=1)).date().isoformat()
+    return "<=", parsed.isoformat()
+
+def _parse_amount(raw_value: str, param_name: str) -> float:
+    try:
+        return float(raw_value)
+    except ValueError:
+        raise ValueError(f"{param_name} must be a number")
+
+def _build_transaction_filters(params) -> tuple[list[str], list[dict]]:
+    """
+    Terjemahkan query param filter (from, to, category_id, category_type,
+    min_amount, max_amount) menjadi klausa WHERE + parameter Cosmos.
+    Semua nilai dikirim sebagai parameter (@...), tidak pernah di-format ke SQL.
+    Index pendukung: lihat cosmos_indexing_policy.json.
+    """
+    clauses = []
+    parameters = []
+
+    if params.get("from"):
+        op, value = _parse_date_bound(params.get("from"), "from", is_upper=False)
+        clauses.append(f"c.transaction_date {op} @fromDate")
+        parameters.append({"name": "@fromDate", "value": value})
+
+    if params.get("to"):
+        op, value = _parse_date_bound(params.get("to"), "to", is_upper=True)
+        clauses.append(f"c.transaction_date {op} @toDate")
+        parameters.append({"name": "@toDate", "value": value})
+
+    if params.get("category_id"):
+        clauses.append("c.category.id = @categoryId")
+        parameters.append({"name": "@categoryId", "value": params.get("category_id")})
+
+    if params.get("category_type"):
+        clauses.append("c.category.category_type = @categoryType")
+        parameters.append({"name": "@categoryType", "value": params.get("category_type")})
+
+    min_amount = None
+    if params.get("min_amount"):
+        min_amount = _parse_amount(params.get("min_amount"), "min_amount")
+        clauses.append("c.amount >= @minAmount")
+        parameters.append({"name": "@minAmount", "value": min_amount})
+
+    if params.get("max_amount"):
+        max_amount = _parse_amount(params.get("max_amount"), "max_amount")
+        if min_amount is not None and max_amount < min_amount:
+            raise ValueError("max_amount must be greater than or equal to min_amount")
+        clauses.append("c.amount <= @maxAmount")
+        parameters.append({"name": "@maxAmount", "value": max_amount})
+
+    return clauses, parameters
+
+def _build_transaction_query(user_id: str, params) -> tuple[str, list[dict]]:
+    """
+    Query list view transaksi milik user (dipakai transaction/list dan transaction/export):
+    projection LIST_VIEW_FIELDS, filter opsional dari query param, urut transaction_date DESC.
+    Raise ValueError jika filter tidak valid.
+    """
+    filter_clauses, filter_parameters = _build_transaction_filters(params)
+    projection = ", ".join(f"c.{field}" for field in LIST_VIEW_FIELDS)
+    extra_where = "".join(f" AND {clause}" for clause in filter_clauses)
+    query = f"""
+        SELECT {projection} FROM c 
+        WHERE c.user_id = @userId 
+        AND c.type = 'transaction'{extra_where}
+        ORDER BY c.transaction_date DESC
+    """
+    return query, [{"name": "@userId", "value": user_id}] + filter_parameters
+
+def _resolve_location(lat, lon) -> dict:
+    """
+    Reverse geocoding koordinat -> {"city", "country"}. Selalu return objek.
+    """
+    if not (lat and lon):
+        return dict(geocoder.UNKNOWN_LOCATION)
+    return geocoder.lookup(lat, lon)
+
+def _build_transaction_document(user_id, description, amount, location_obj, source, input_type,
+                                image_url=None, transaction_date=None, transaction_id=None) -> dict:
+    """
+    Susun dokumen transaksi standar (status Pending, menunggu CategoryService).
+    amount > 0 di sini selalu diisi user (form / batch / baris mutasi), jadi
+    ditandai amount_source "user" agar tidak ditimpa hasil OCR / AI.
+    """
+    return {
+        "id": transaction_id or str(uuid.uuid4()),
+        "user_id": user_id, # Dari Token
+        "type": "transaction",
+        "amount": amount,       # Bisa 0.0
+        "amount_source": "user" if amount > 0 else None,
+        "description": description, # Bisa "Pending Scan"
+        "transaction_date": transaction_date or datetime.utcnow().isoformat(),
+        "image_url": image_url,
+        "location": location_obj,
+        "category": {"id": "0", "name": "Pending", "category_type": "Uncategorized"},
+        "source": source,
+        "input_type": input_type,
+        "is_processed": False
+    }
+
+def _get_container():
+    return azure_clients.get_cosmos_container(COSMOS_CONN_STR, DATABASE_NAME, CONTAINER_NAME)
+
+def _write_transactions_batch(container, user_id, documents) -> list[dict]:
+    """
+    Tulis banyak dokumen milik SATU user memakai Cosmos transactional batch
+    (maks 100 operasi per batch). Return status per dokumen (urutan sama).
+    Jika satu operasi gagal, batch di-rollback oleh Cosmos; dokumen penyebabnya
+    ditandai gagal lalu sisa batch dikirim ulang.
+    """
+    results = {doc["id"]: {"id": doc["id"], "status": "created"} for doc in documents}
+
+    for start in range(0, len(documents), COSMOS_BATCH_CHUNK_SIZE):
+        pending = documents[start:start + COSMOS_BATCH_CHUNK_SIZE]
+        while pending:
+            try:
+                container.execute_item_batch(
+                    batch_operations=[("create", (doc,)) for doc in pending],
+                    partition_key=user_id
+                )
+                break
+            except CosmosBatchOperationError as e:
+                failed_doc = pending[e.error_index]
+                failed_op = e.operation_responses[e.error_index] if e.operation_responses else {}
+                status_code = failed_op.get("statusCode") if isinstance(failed_op, dict) else None
+                results[failed_doc["id"]] = {
+                    "id": failed_doc["id"],
+                    "status": "failed",
+                    "error": "Conflict" if status_code == 409 else f"Batch operation failed ({status_code})"
+                }
+                pending = pending[:e.error_index] + pending[e.error_index + 1:]
+            except Exception as e:
+                logging.error(f"Batch write failed: {e}")
+                for doc in pending:
+                    results[doc["id"]] = {"id": doc["id"], "status": "failed", "error": str(e)}
+                break
+
+    return [results[doc["id"]] for doc in documents]
+
+def _find_existing_ids(container, user_id, ids) -> set:
+    """
+    Cek id mana yang sudah ada di partition user (satu query untuk satu chunk).
+    """
+    if not ids:
+        return set()
+    query = "SELECT VALUE c.id FROM c WHERE ARRAY_CONTAINS(@ids, c.id)"
+    return set(container.query_items(
+        query=query,
+        parameters=[{"name": "@ids", "value": list(ids)}],
+        partition_key=user_id
+    ))
+
+def _enqueue_for_categorization(documents) -> None:
+    """
+    Kirim dokumen ke queue kategorisasi. Satu dokumen dikirim apa adanya (format lama),
+    banyak dokumen digabung jadi list JSON per pesan (dibatasi QUEUE_MESSAGE_MAX_BYTES)
+    sehingga import ratusan baris cukup beberapa kali send_message.
+    """
+    if not documents:
+        return
+
+    queue_client = azure_clients.get_queue_client(STORAGE_CONN_STR, OUTPUT_QUEUE_NAME)
+
+    def _send(payload: str):
+        try:
+            queue_client.send_message(payload)
+        except Exception:
+            queue_client.create_queue()
+            queue_client.send_message(payload)
+
+    if len(documents) == 1:
+        _send(json.dumps(documents[0]))
+        return
+
+    chunk = []
+    chunk_size = 2 # "[]"
+    for doc in documents:
+        encoded = json.dumps(doc)
+        if chunk and chunk_size + len(encoded) + 1 > QUEUE_MESSAGE_MAX_BYTES:
+            _send("[" + ",".join(chunk) + "]")
+            chunk, chunk_size = [], 2
+        chunk.append(encoded)
+        chunk_size += len(encoded) + 1
+    if chunk:
+        _send("[" + ",".join(chunk) + "]")
+
+def _export_rows_to_bytes(items, export_format: str, include_header: bool) -> bytes:
+    """
+    Serialisasi satu halaman hasil query ke NDJSON atau CSV.
+    """
+    if export_format == "ndjson":
+        return "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items).encode("utf-8")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if include_header:
+        writer.writerow(EXPORT_CSV_COLUMNS)
+    for item in items:
+        category = item.get("category") or {}
+        location = item.get("location") or {}
+        writer.writerow([
+            item.get("id"), item.get("transaction_date"), item.get("description"), item.get("amount", 0),
+            category.get("id"), category.get("name"), category.get("category_type"),
+            item.get("source"), item.get("input_type"), location.get("city"), location.get("country"),
+            item.get("is_processed", False)
+        ])
+    return buffer.getvalue().encode("utf-8")
+
+def _export_account_key(blob_service_client) -> str:
+    """
+    Account key untuk menandatangani SAS link export. Container export privat,
+    jadi URL blob tanpa SAS akan 403 di client: gagal jelas di awal, bukan
+    setelah file ditulis.
+    """
+    account_key = getattr(blob_service_client.credential, "account_key", None)
+    if not account_key:
+        raise ValueError("STORAGE_CONN_STR must contain an AccountKey to issue export download links")
+    return account_key
+
+
+def _export_download_url(blob_client, account_key: str) -> str:
+    """
+    URL SAS read-only berumur pendek untuk file export.
+    """
+    sas_token = generate_blob_sas(
+        account_name=blob_client.account_name,
+        container_name=blob_client.container_name,
+        blob_name=blob_client.blob_name,
+        account_key=account_key,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.now(timezone.utc) + timedelta(minutes=EXPORT_LINK_TTL_MINUTES)
+    )
+    return f"{blob_client.url}?{sas_token}"
 
 # --- MAIN FUNCTIONS ---
 
@@ -91,6 +446,8 @@ def CreateTransaction(req: func.HttpRequest) -> func.HttpResponse:
         lat = None
         lon = None
         image_url = None
+        image_sha256 = None
+        image_normalization = None
         input_type = "text"
         source = "Cash"
 
@@ -120,7 +477,7 @@ def CreateTransaction(req: func.HttpRequest) -> func.HttpResponse:
             if 'image' in req.files:
                 file = req.files['image']
                 filename = f"{user_id}_{uuid.uuid4()}.jpg"
-                uploaded_url = upload_image_to_blob(file, filename)
+                uploaded_url, image_sha256, image_normalization = upload_image_to_blob(file, filename)
                 if uploaded_url:
                     image_url = uploaded_url
                 else:
@@ -139,44 +496,46 @@ def CreateTransaction(req: func.HttpRequest) -> func.HttpResponse:
             description = "Pending Scan" # Nanti AI/OCR yang ganti tulisan ini
 
         # 4. Reverse Geocoding
-        location_obj = {"city": "Unknown", "country": "Unknown"}
-        if lat and lon:
-            try:
-                result = rg.search((float(lat), float(lon)))[0]
-                location_obj = {"city": result.get("name", "Unknown"), "country": result.get("cc", "Unknown")}
-            except Exception:
-                pass
+        location_obj = _resolve_location(lat, lon)
 
         # 5. Prepare Document
-        transaction_id = str(uuid.uuid4())
-        document = {
-            "id": transaction_id,
-            "user_id": user_id, # Dari Token
-            "type": "transaction",
-            "amount": amount,       # Bisa 0.0
-            "description": description, # Bisa "Pending Scan"
-            "transaction_date": datetime.utcnow().isoformat(),
-            "image_url": image_url,
-            "location": location_obj,
-            "category": {"id": "0", "name": "Pending", "category_type": "Uncategorized"},
-            "source": source,
-            "input_type": input_type,
-            "is_processed": False
-        }
+        document = _build_transaction_document(
+            user_id, description, amount, location_obj, source, input_type, image_url=image_url
+        )
+        if image_sha256:
+            # Digest konten gambar: key cache hasil OCR di AI Service
+            document["image_sha256"] = image_sha256
+        if image_normalization:
+            # Dipakai untuk membandingkan kualitas OCR dengan/tanpa normalisasi
+            document["image_dhash"] = image_normalization.pop("dhash", None)
+            document["image_normalization"] = image_normalization
+
+        container = _get_container()
+
+        # 5b. Deteksi struk yang difoto ulang (perceptual hash mirip struk terbaru user).
+        # Hanya ditandai supaya terlihat di list view; kategorisasi tetap jalan normal.
+        if document.get("image_dhash"):
+            try:
+                match = image_hash_index.find_match(container, user_id, document["image_dhash"])
+                if match:
+                    document["duplicate_of"] = match["transaction_id"]
+                    document["duplicate_distance"] = match["distance"]
+                    logging.info(f"Possible duplicate receipt of {match['transaction_id']} (distance {match['distance']})")
+            except Exception as e:
+                logging.warning(f"Image hash index check failed: {e}")
 
         # 6. Save to Cosmos DB
-        client = CosmosClient.from_connection_string(COSMOS_CONN_STR)
-        database = client.get_database_client(DATABASE_NAME)
-        container = database.get_container_client(CONTAINER_NAME)
         container.create_item(body=document)
 
+        # 6b. Catat hash hanya setelah transaksi benar-benar tersimpan
+        if document.get("image_dhash"):
+            try:
+                image_hash_index.record(container, user_id, document["image_dhash"], document["id"])
+            except Exception as e:
+                logging.warning(f"Image hash index update failed: {e}")
+
         # 7. Send to Queue
-        queue_client = QueueClient.from_connection_string(STORAGE_CONN_STR, OUTPUT_QUEUE_NAME)
-        try:
-            queue_client.send_message(json.dumps(document))
-        except Exception:
-            queue_client.create_queue()
-            queue_client.send_message(json.dumps(document))
+        _enqueue_for_categorization([document])
 
         return func.HttpResponse(json.dumps({"message": "Success", "data": document}), status_code=201, mimetype="application/json")
 
@@ -185,6 +544,214 @@ def CreateTransaction(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
 
 
+@app.route(route="transaction/batch", methods=["POST"])
+def CreateTransactionBatch(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing Batch Create Transaction request.')
+
+    # --- 1. JWT SECURITY CHECK ---
+    user_info = _get_user_info_from_token(req)
+    if not user_info:
+        return func.HttpResponse(json.dumps({"error": "Unauthorized: Invalid or Missing Token"}), status_code=401)
+
+    user_id = user_info.get("user_id")
+    if not user_id:
+         return func.HttpResponse(json.dumps({"error": "Invalid Token Payload: Missing user_id"}), status_code=401)
+
+    # --- 2. PARSE BODY ---
+    # Format: {"transactions": [{"description", "amount", "latitude", "longitude", "source", "transaction_date"}, ...]}
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        return func.HttpResponse(json.dumps({"error": "Invalid JSON"}), status_code=400, mimetype="application/json")
+
+    raw_items = req_body.get("transactions") if isinstance(req_body, dict) else None
+    if not isinstance(raw_items, list) or not raw_items:
+        return func.HttpResponse(json.dumps({"error": "Field 'transactions' must be a non-empty array"}), status_code=400, mimetype="application/json")
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return func.HttpResponse(json.dumps({"error": f"Maximum {BATCH_MAX_ITEMS} transactions per batch"}), status_code=413, mimetype="application/json")
+
+    try:
+        # --- 3. VALIDASI PER ITEM ---
+        # Item invalid tidak menggagalkan batch, cukup dilaporkan di hasilnya
+        results = [None] * len(raw_items)
+        documents = []
+        doc_index = {}
+
+        # Reverse geocoding semua item sekaligus (satu query KD-tree)
+        locations = geocoder.lookup_many([
+            (item.get("latitude"), item.get("longitude")) if isinstance(item, dict) else (None, None)
+            for item in raw_items
+        ])
+
+        for index, item in enumerate(raw_items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Item must be an object")
+                description = item.get("description")
+                if not description:
+                    raise ValueError("Missing description")
+                amount = float(item.get("amount", 0.0))
+
+                transaction_date = item.get("transaction_date")
+                if transaction_date:
+                    transaction_date = _to_stored_datetime(datetime.fromisoformat(transaction_date)).isoformat()
+
+                document = _build_transaction_document(
+                    user_id, description, amount,
+                    locations[index],
+                    item.get("source", "Cash"), "text",
+                    transaction_date=transaction_date
+                )
+                documents.append(document)
+                doc_index[document["id"]] = index
+            except (TypeError, ValueError) as e:
+                results[index] = {"index": index, "id": None, "status": "failed", "error": str(e)}
+
+        # --- 4. SAVE TO COSMOS DB (Transactional Batch per partition user) ---
+        created_docs = []
+        if documents:
+            container = _get_container()
+            for write_result, document in zip(_write_transactions_batch(container, user_id, documents), documents):
+                results[doc_index[document["id"]]] = {"index": doc_index[document["id"]], **write_result}
+                if write_result["status"] == "created":
+                    created_docs.append(document)
+
+        # --- 5. SEND TO QUEUE (beberapa pesan, bukan satu per transaksi) ---
+        _enqueue_for_categorization(created_docs)
+
+        failed_count = len(raw_items) - len(created_docs)
+        return func.HttpResponse(
+            json.dumps({
+                "message": "Success" if failed_count == 0 else "Partial Success",
+                "total": len(raw_items),
+                "created": len(created_docs),
+                "failed": failed_count,
+                "results": results
+            }),
+            status_code=201 if failed_count == 0 else 207,
+            mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Batch Error: {str(e)}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
+
+
+@app.route(route="transaction/import", methods=["POST"])
+def ImportStatement(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Processing Bank Statement Import request.')
+
+    # --- 1. JWT SECURITY CHECK ---
+    user_info = _get_user_info_from_token(req)
+    if not user_info:
+        return func.HttpResponse(json.dumps({"error": "Unauthorized: Invalid or Missing Token"}), status_code=401)
+
+    user_id = user_info.get("user_id")
+    if not user_id:
+         return func.HttpResponse(json.dumps({"error": "Invalid Token Payload: Missing user_id"}), status_code=401)
+
+    # --- 2. AMBIL STREAM FILE ---
+    # Multipart: field 'file' (dibaca langsung dari stream upload)
+    # Raw body: Content-Type text/csv atau application/x-ofx
+    content_type = req.headers.get("Content-Type", "")
+    filename = ""
+    if "multipart/form-data" in content_type:
+        if 'file' not in req.files:
+            return func.HttpResponse(json.dumps({"error": "Statement file is required (field 'file')"}), status_code=400)
+        upload = req.files['file']
+        filename = upload.filename or ""
+        binary_stream = upload.stream
+        file_content_type = upload.content_type or ""
+    else:
+        binary_stream = io.BytesIO(req.get_body() or b"")
+        file_content_type = content_type
+
+    text_stream = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", errors="replace", newline="")
+
+    # Intip baris pertama untuk deteksi format, lalu sambungkan lagi ke iterator
+    first_line = text_stream.readline()
+    if not first_line.strip():
+        return func.HttpResponse(json.dumps({"error": "Statement file is empty"}), status_code=400)
+    statement_format = req.params.get("format") or statement_parser.detect_format(first_line, filename, file_content_type)
+
+    def _lines():
+        yield first_line
+        yield from text_stream
+
+    try:
+        container = _get_container()
+        summary = {"rows_read": 0, "imported": 0, "duplicates": 0, "invalid": 0, "failed": 0}
+        errors = []
+        occurrences = statement_parser.OccurrenceCounter(IMPORT_DEDUPE_WINDOW)
+        chunk = []
+
+        def _flush(chunk_docs):
+            # Buang baris yang sudah pernah di-import (id deterministik dari hash)
+            existing = _find_existing_ids(container, user_id, [doc["id"] for doc in chunk_docs])
+            new_docs = [doc for doc in chunk_docs if doc["id"] not in existing]
+            summary["duplicates"] += len(chunk_docs) - len(new_docs)
+
+            created = []
+            for write_result, document in zip(_write_transactions_batch(container, user_id, new_docs), new_docs):
+                if write_result["status"] == "created":
+                    created.append(document)
+                elif write_result.get("error") == "Conflict":
+                    summary["duplicates"] += 1
+                else:
+                    summary["failed"] += 1
+            summary["imported"] += len(created)
+            _enqueue_for_categorization(created)
+
+        # --- 3. PARSE BARIS PER BARIS & TULIS PER CHUNK ---
+        for row in statement_parser.iter_statement_rows(_lines(), statement_format):
+            if isinstance(row, statement_parser.StatementParseError):
+                summary["invalid"] += 1
+                if len(errors) < IMPORT_MAX_ERROR_SAMPLES:
+                    errors.append(str(row))
+                continue
+
+            summary["rows_read"] += 1
+            occurrence = occurrences.next(statement_parser.row_basis(user_id, row))
+            if row.external_id and occurrence:
+                # FITID sama muncul lagi di file yang sama = baris yang sama (overlap periode)
+                summary["duplicates"] += 1
+                continue
+            digest = statement_parser.row_hash(user_id, row, occurrence)
+
+            document = _build_transaction_document(
+                user_id, row.description, row.amount,
+                {"city": "Unknown", "country": "Unknown"},
+                "Statement Import", "text",
+                transaction_date=row.transaction_date,
+                transaction_id=f"stmt-{digest[:32]}"
+            )
+            document["import_hash"] = digest
+            document["direction"] = row.direction
+            chunk.append(document)
+
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                _flush(chunk)
+                chunk = []
+
+        if chunk:
+            _flush(chunk)
+
+        return func.HttpResponse(
+            json.dumps({
+                "message": "Import Finished",
+                "format": statement_format,
+                **summary,
+                "errors": errors
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Import Error: {str(e)}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
+
+
 @app.route(route="transaction/get", methods=["GET"])
 def GetTransaction(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Getting transaction detail.')
@@ -208,9 +775,7 @@ def GetTransaction(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(json.dumps({"error": "Please provide transaction id"}), status_code=400)
 
     try:
-        client = CosmosClient.from_connection_string(COSMOS_CONN_STR)
-        database = client.get_database_client(DATABASE_NAME)
-        container = database.get_container_client(CONTAINER_NAME)
+        container = _get_container()
 
         # BACA ITEM
         # Kuncinya di sini: partition_key=user_id (dari token).
@@ -236,32 +801,37 @@ def GetUserTransactions(req: func.HttpRequest) -> func.HttpResponse:
     if not user_id:
          return func.HttpResponse(json.dumps({"error": "Invalid Token"}), status_code=401)
 
+    # --- 2. PARAMETER PAGINATION & FILTER ---
+    try:
+        page_size = _parse_page_size(req.params.get("page_size"))
+        continuation_token = _decode_continuation_token(req.params.get("continuation_token"))
+        query, parameters = _build_transaction_query(user_id, req.params)
+    except ValueError as e:
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=400, mimetype="application/json")
+
     try:
-        client = CosmosClient.from_connection_string(COSMOS_CONN_STR)
-        container = client.get_database_client(DATABASE_NAME).get_container_client(CONTAINER_NAME)
+        container = _get_container()
 
-        # --- 2. QUERY COSMOS DB ---
+        # --- 3. QUERY COSMOS DB ---
         # Filter: user_id AND type='transaction'
         # Sort: transaction_date DESC (Terbaru diatas)
-        query = """
-            SELECT * FROM c 
-            WHERE c.user_id = @userId 
-            AND c.type = 'transaction' 
-            ORDER BY c.transaction_date DESC
-        """
-        
-        parameters = [
-            {"name": "@userId", "value": user_id}
-        ]
-
-        # Eksekusi Query
-        items = list(container.query_items(
+        # Projection: hanya field list view, detail lengkap lewat transaction/get
+        # Filter opsional (tanggal, kategori, amount) di-push down ke WHERE
+        # Eksekusi Query: ambil SATU halaman saja lewat by_page()
+        pager = container.query_items(
             query=query,
             parameters=parameters,
-            enable_cross_partition_query=False 
-        ))
+            partition_key=user_id,
+            max_item_count=page_size
+        ).by_page(continuation_token)
 
-        # --- 3. DATA PROCESSING (LENGKAP) ---
+        try:
+            items = list(next(pager))
+        except StopIteration:
+            items = []
+        next_token = _encode_continuation_token(pager.continuation_token)
+
+        # --- 4. DATA PROCESSING (LENGKAP) ---
         history_data = []
         for item in items:
             history_data.append({
@@ -279,13 +849,19 @@ def GetUserTransactions(req: func.HttpRequest) -> func.HttpResponse:
                 "source": item.get("source", "cash"),
                 "input_type": item.get("input_type", "text"),
                 "is_processed": item.get("is_processed", False),
-                "ai_confidence": item.get("ai_confidence") # Tambahan data dari AI
+                "ai_confidence": item.get("ai_confidence"), # Tambahan data dari AI
+                # Struk yang difoto ulang (perceptual hash), supaya user bisa menghapus duplikatnya
+                "duplicate_of": item.get("duplicate_of"),
+                "duplicate_distance": item.get("duplicate_distance")
             })
 
         return func.HttpResponse(
             body=json.dumps({
                 "message": "Success",
                 "total_rows": len(history_data),
+                "page_size": page_size,
+                "continuation_token": next_token,
+                "has_more": next_token is not None,
                 "data": history_data
             }),
             status_code=200,
@@ -294,4 +870,109 @@ def GetUserTransactions(req: func.HttpRequest) -> func.HttpResponse:
 
     except Exception as e:
         logging.error(f"History Error: {str(e)}")
-        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
\ No newline at end of file
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
+
+@app.route(route="transaction/export", methods=["GET"])
+def ExportTransactions(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Exporting User Transaction History.')
+
+    # --- 1. JWT SECURITY CHECK ---
+    user_info = _get_user_info_from_token(req)
+    if not user_info:
+        return func.HttpResponse(json.dumps({"error": "Unauthorized"}), status_code=401)
+
+    user_id = user_info.get("user_id")
+    if not user_id:
+         return func.HttpResponse(json.dumps({"error": "Invalid Token"}), status_code=401)
+
+    # --- 2. FORMAT & FILTER (sama dengan transaction/list) ---
+    export_format = (req.params.get("format") or "ndjson").lower()
+    if export_format not in ("ndjson", "csv"):
+        return func.HttpResponse(json.dumps({"error": "format must be 'ndjson' or 'csv'"}), status_code=400, mimetype="application/json")
+
+    try:
+        query, parameters = _build_transaction_query(user_id, req.params)
+    except ValueError as e:
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=400, mimetype="application/json")
+
+    try:
+        blob_service_client = azure_clients.get_blob_service_client(STORAGE_CONN_STR)
+        try:
+            account_key = _export_account_key(blob_service_client)
+        except ValueError as e:
+            logging.error(f"Export unavailable: {e}")
+            return func.HttpResponse(json.dumps({"error": "Export download links are not configured"}), status_code=503, mimetype="application/json")
+
+        container = _get_container()
+
+        pages = container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=user_id,
+            max_item_count=EXPORT_PAGE_SIZE
+        ).by_page()
+
+        # --- 3. TULIS HALAMAN DEMI HALAMAN KE BLOCK BLOB ---
+        container_client = blob_service_client.get_container_client(EXPORT_BLOB_CONTAINER_NAME)
+        try:
+            container_client.create_container()
+        except Exception:
+            pass # Sudah ada
+
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        blob_name = f"{user_id}/transactions_{timestamp}_{uuid.uuid4().hex[:8]}.{export_format}"
+        blob_client = container_client.get_blob_client(blob_name)
+
+        block_ids = []
+        buffer = bytearray()
+        total_rows = 0
+        header_written = False
+
+        def _stage(data: bytes):
+            block_id = base64.b64encode(f"{len(block_ids):08d}".encode("ascii")).decode("ascii")
+            blob_client.stage_block(block_id=block_id, data=bytes(data))
+            block_ids.append(block_id)
+
+        for page in pages:
+            items = list(page)
+            # Query terfilter sering menghasilkan halaman kosong (juga di awal)
+            if not items:
+                continue
+            buffer.extend(_export_rows_to_bytes(items, export_format, include_header=not header_written))
+            header_written = True
+            total_rows += len(items)
+            if len(buffer) >= EXPORT_BLOCK_BYTES:
+                _stage(buffer)
+                buffer = bytearray()
+
+        if not header_written:
+            # Tidak ada transaksi: CSV tetap berisi baris header
+            buffer.extend(_export_rows_to_bytes([], export_format, include_header=True))
+
+        if buffer:
+            _stage(buffer)
+
+        content_type = "application/x-ndjson" if export_format == "ndjson" else "text/csv"
+        blob_client.commit_block_list(
+            [BlobBlock(block_id=block_id) for block_id in block_ids],
+            content_settings=ContentSettings(
+                content_type=content_type,
+                content_disposition=f"attachment; filename=transactions.{export_format}"
+            )
+        )
+
+        return func.HttpResponse(
+            body=json.dumps({
+                "message": "Success",
+                "format": export_format,
+                "total_rows": total_rows,
+                "download_url": _export_download_url(blob_client, account_key),
+                "expires_in_minutes": EXPORT_LINK_TTL_MINUTES
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Export Error: {str(e)}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500)
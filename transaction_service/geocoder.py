@@ -0,0 +1,108 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import reverse_geocoder as rg
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# REVERSE GEOCODING (PRELOAD + LRU CACHE)
+# KD-tree reverse_geocoder dibangun SEKALI per worker (mode=1, single-process),
+# bukan lazy di request pertama, dan tanpa multiprocess pool per panggilan.
+# ==========================================
+
+# Jumlah digit desimal koordinat untuk key cache (3 digit ~ 110 meter)
+GEOCODE_PRECISION = int(os.environ.get("GEOCODE_PRECISION", "3"))
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", "4096"))
+
+UNKNOWN_LOCATION = {"city": "Unknown", "country": "Unknown"}
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def warm_up():
+    """
+    Bangun KD-tree di awal (dipanggil saat worker start). Aman dipanggil berkali-kali.
+    """
+    global _geocoder
+    if _geocoder is not None:
+        return _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = rg.RGeocoder(mode=1, verbose=False)
+            logger.info("Reverse geocoder KD-tree loaded (single-process mode).")
+    return _geocoder
+
+
+def _cache_key(lat, lon) -> tuple | None:
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return (round(lat, GEOCODE_PRECISION), round(lon, GEOCODE_PRECISION))
+
+
+def _cache_get(key):
+    with _cache_lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+        return value
+
+
+def _cache_put(key, value):
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > GEOCODE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def lookup_many(coordinates) -> list[dict]:
+    """
+    Reverse geocoding banyak koordinat sekaligus (untuk bulk ingest).
+    Koordinat yang belum ada di cache di-query dalam SATU panggilan KD-tree.
+    Koordinat kosong/invalid menghasilkan UNKNOWN_LOCATION.
+    """
+    keys = [_cache_key(lat, lon) if lat not in (None, "") and lon not in (None, "") else None
+            for lat, lon in coordinates]
+    results = {}
+    missing = []
+    for key in keys:
+        if key is None or key in results:
+            continue
+        cached = _cache_get(key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            missing.append(key)
+
+    if missing:
+        with _cache_lock:
+            _stats["misses"] += len(missing)
+        try:
+            for key, record in zip(missing, warm_up().query(missing)):
+                location_obj = {"city": record.get("name", "Unknown"), "country": record.get("cc", "Unknown")}
+                _cache_put(key, location_obj)
+                results[key] = location_obj
+        except Exception as e:
+            logger.error(f"Reverse geocoding failed: {e}")
+
+    return [dict(results.get(key, UNKNOWN_LOCATION)) if key else dict(UNKNOWN_LOCATION) for key in keys]
+
+
+def lookup(lat, lon) -> dict:
+    return lookup_many([(lat, lon)])[0]
+
+
+def get_stats() -> dict:
+    with _cache_lock:
+        return {**_stats, "size": len(_cache), "precision": GEOCODE_PRECISION}
@@ -0,0 +1,84 @@
+import os
+import logging
+from datetime import datetime, timezone
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+from image_normalizer import hamming_distance
+
+# ==========================================
+# INDEX PERCEPTUAL HASH STRUK TERBARU PER USER
+# Satu dokumen per user (partition key = user_id):
+# {
+#   "id": "image-hash-index", "type": "image_hash_index", "user_id",
+#   "entries": [{"dhash", "transaction_id", "created_at"}, ...]   # terbaru di akhir
+# }
+# Foto struk baru dibandingkan (Hamming distance dHash) dengan entri di sini;
+# yang jaraknya <= DHASH_MAX_DISTANCE hanya ditandai sebagai kemungkinan duplikat
+# (duplicate_of), bukan dianggap pasti struk yang sama.
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+INDEX_ID = "image-hash-index"
+INDEX_TYPE = "image_hash_index"
+RECENT_IMAGE_HASH_LIMIT = int(os.environ.get("RECENT_IMAGE_HASH_LIMIT", "200"))
+DHASH_MAX_DISTANCE = int(os.environ.get("DHASH_MAX_DISTANCE", "6"))
+MAX_ETAG_RETRIES = 5
+
+
+def _read_index(container, user_id: str) -> tuple[dict, str | None]:
+    try:
+        doc = container.read_item(item=INDEX_ID, partition_key=user_id)
+        return doc, doc.get("_etag")
+    except CosmosResourceNotFoundError:
+        return {"id": INDEX_ID, "type": INDEX_TYPE, "user_id": user_id, "entries": []}, None
+
+
+def find_match(container, user_id: str, image_dhash: str) -> dict | None:
+    """
+    Entri paling mirip di index user ({"transaction_id", "distance", ...}) atau None.
+    Hanya kandidat duplikat: dHash 64-bit bisa bertabrakan untuk struk berbeda.
+    """
+    doc, _ = _read_index(container, user_id)
+    match = None
+    for entry in doc["entries"]:
+        distance = hamming_distance(image_dhash, entry["dhash"])
+        if distance <= DHASH_MAX_DISTANCE and (match is None or distance < match["distance"]):
+            match = {**entry, "distance": distance}
+    return match
+
+
+def record(container, user_id: str, image_dhash: str, transaction_id: str) -> bool:
+    """
+    Tambahkan hash struk ke index user. Dipanggil setelah transaksi tersimpan,
+    supaya create yang gagal tidak meninggalkan entri hantu.
+    """
+    for attempt in range(MAX_ETAG_RETRIES):
+        doc, etag = _read_index(container, user_id)
+        doc["entries"].append({
+            "dhash": image_dhash,
+            "transaction_id": transaction_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        doc["entries"] = doc["entries"][-RECENT_IMAGE_HASH_LIMIT:]
+
+        try:
+            if etag:
+                container.replace_item(
+                    item=INDEX_ID, body=doc,
+                    etag=etag, match_condition=MatchConditions.IfNotModified
+                )
+            else:
+                container.create_item(body=doc)
+            return True
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+            logger.info(f"Image hash index for {user_id} changed concurrently, retry {attempt + 1}")
+
+    # Index hanya optimasi: kalau terus konflik, lanjut tanpa mencatat hash
+    logger.warning(f"Failed to update image hash index for {user_id}")
+    return False
@@ -0,0 +1,128 @@
+import io
+import os
+import random
+import logging
+
+# ==========================================
+# NORMALISASI FOTO STRUK SEBELUM UPLOAD
+# Foto HP (4-10 MB) diperbaiki orientasinya (EXIF), diperkecil ke resolusi
+# yang cukup untuk OCR, di-encode ulang ke JPEG dan metadata-nya dibuang.
+# Untuk JPEG, decoder diminta langsung men-decode di skala kecil
+# (Image.draft), jadi gambar penuh tidak pernah ada di memori.
+#
+# IMAGE_NORMALIZATION_SAMPLE_RATE < 1.0 menyisakan sebagian upload tanpa
+# normalisasi, supaya kualitas OCR sebelum/sesudah bisa dibandingkan
+# (field image_normalization.normalized + ocr_quality di dokumen transaksi).
+#
+# Perceptual hash (dHash) dihitung dari gambar yang sama untuk deteksi
+# struk duplikat (lihat image_hash_index.py).
+# ==========================================
+
+logger = logging.getLogger(__name__)
+
+IMAGE_NORMALIZATION_ENABLED = os.environ.get("IMAGE_NORMALIZATION_ENABLED", "true").lower() == "true"
+IMAGE_NORMALIZATION_SAMPLE_RATE = float(os.environ.get("IMAGE_NORMALIZATION_SAMPLE_RATE", "1.0"))
+# Sisi terpanjang; Azure Document Intelligence tetap akurat di ~2000 px untuk struk
+RECEIPT_MAX_DIMENSION = int(os.environ.get("RECEIPT_MAX_DIMENSION", "2000"))
+RECEIPT_JPEG_QUALITY = int(os.environ.get("RECEIPT_JPEG_QUALITY", "85"))
+
+
+class _CountingReader:
+    """
+    Hitung jumlah byte yang dibaca Pillow dari stream upload (ukuran asli).
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        self.bytes_read += len(chunk or b"")
+        return chunk
+
+    def seek(self, offset, whence=0):
+        return self._stream.seek(offset, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+
+def dhash(image, hash_size: int = 8) -> str:
+    """
+    Difference hash: grayscale (hash_size+1 x hash_size), bandingkan piksel
+    bertetangga. Foto ulang dari struk yang sama menghasilkan hash yang jaraknya
+    (Hamming) kecil walau byte file-nya berbeda. Return hex 16 karakter (64 bit).
+    """
+    from PIL import Image
+
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def normalize_image(stream):
+    """
+    Return (stream_untuk_upload, info). info['dhash'] berisi perceptual hash jika
+    gambar bisa dibaca Pillow. Jika normalisasi dimatikan / tidak terpilih sampling /
+    format tidak didukung, stream asli dikembalikan (posisi di-reset ke awal) dan
+    info['normalized'] = False.
+    """
+    info = {"normalized": False}
+    should_normalize = IMAGE_NORMALIZATION_ENABLED and random.random() < IMAGE_NORMALIZATION_SAMPLE_RATE
+
+    start = 0
+    try:
+        from PIL import Image, ImageOps
+
+        start = stream.tell()
+        reader = _CountingReader(stream)
+        with Image.open(reader) as image:
+            original_size = image.size
+            original_format = image.format
+            # JPEG: decode langsung di skala 1/2, 1/4, 1/8 yang masih >= target
+            image.draft("RGB", (RECEIPT_MAX_DIMENSION, RECEIPT_MAX_DIMENSION))
+            image = ImageOps.exif_transpose(image)
+            info["dhash"] = dhash(image)
+            if not should_normalize:
+                stream.seek(start)
+                return stream, info
+
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.thumbnail((RECEIPT_MAX_DIMENSION, RECEIPT_MAX_DIMENSION), Image.LANCZOS)
+
+            output = io.BytesIO()
+            # Tanpa argumen exif/icc_profile -> metadata (GPS, kamera) ikut terbuang
+            image.save(output, format="JPEG", quality=RECEIPT_JPEG_QUALITY, optimize=True)
+
+        # Sisa stream yang tidak dibaca Pillow tetap dihitung sebagai ukuran asli
+        reader.bytes_read += len(stream.read() or b"")
+        output.seek(0)
+        info.update({
+            "normalized": True,
+            "original_format": original_format,
+            "original_bytes": reader.bytes_read,
+            "original_size": list(original_size),
+            "stored_bytes": output.getbuffer().nbytes,
+            "stored_size": list(image.size),
+        })
+        logger.info(f"Receipt image normalized: {info}")
+        return output, info
+    except Exception as e:
+        logger.warning(f"Image normalization skipped: {e}")
+        try:
+            stream.seek(start)
+        except Exception:
+            pass
+        return stream, {"normalized": False, "error": str(e)}
@@ -0,0 +1,327 @@
+import csv
+import re
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+# ==========================================
+# PARSER MUTASI REKENING (CSV & OFX)
+# Semua parser berbentuk generator: file dibaca baris per baris,
+# tidak pernah dimuat utuh ke memori.
+# ==========================================
+
+# Nama bulan Indonesia (dan Inggris) -> nomor bulan
+_MONTHS = {
+    "jan": 1, "januari": 1, "january": 1,
+    "feb": 2, "februari": 2, "february": 2, "peb": 2,
+    "mar": 3, "maret": 3, "march": 3,
+    "apr": 4, "april": 4,
+    "mei": 5, "may": 5,
+    "jun": 6, "juni": 6, "june": 6,
+    "jul": 7, "juli": 7, "july": 7,
+    "agu": 8, "agt": 8, "ags": 8, "agustus": 8, "aug": 8, "august": 8,
+    "sep": 9, "sept": 9, "september": 9,
+    "okt": 10, "oktober": 10, "oct": 10, "october": 10,
+    "nov": 11, "nopember": 11, "november": 11,
+    "des": 12, "desember": 12, "dec": 12, "december": 12,
+}
+
+_NUMERIC_DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y", "%Y-%m-%d", "%Y/%m/%d"]
+
+# Alias header kolom CSV yang umum dipakai bank Indonesia
+_DATE_HEADERS = {"tanggal", "tgl", "date", "tanggal transaksi", "tgl transaksi", "transaction date", "posting date"}
+_DESCRIPTION_HEADERS = {"keterangan", "deskripsi", "description", "uraian", "uraian transaksi", "remark", "remarks", "berita"}
+_AMOUNT_HEADERS = {"jumlah", "amount", "nominal", "mutasi", "nilai"}
+_DEBIT_HEADERS = {"debit", "debet", "db", "pengeluaran", "keluar"}
+_CREDIT_HEADERS = {"kredit", "credit", "cr", "pemasukan", "masuk"}
+
+_OFX_TAG_PATTERN = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)")
+
+
+@dataclass
+class StatementRow:
+    line_number: int
+    transaction_date: str   # ISO format
+    description: str
+    amount: float           # Selalu positif
+    direction: str          # "debit" (uang keluar) / "credit" (uang masuk)
+    external_id: str | None = None  # FITID untuk OFX
+
+
+class StatementParseError(ValueError):
+    def __init__(self, line_number: int, message: str):
+        super().__init__(f"Line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def parse_indonesian_amount(raw: str) -> float:
+    """
+    Parse angka format Indonesia/Inggris:
+    '66.900' -> 66900, '1.234.567,89' -> 1234567.89, 'Rp 15.000,-' -> 15000,
+    '1,234.50' -> 1234.5, '(25.000)' -> -25000, '50.000 DB' -> -50000.
+    """
+    if raw is None:
+        raise ValueError("Empty amount")
+    text = str(raw).strip().upper()
+    if not text:
+        raise ValueError("Empty amount")
+
+    negative = False
+    if text.startswith("(") and text.endswith(")"):
+        negative, text = True, text[1:-1]
+    if text.endswith(" DB") or text.endswith("DB"):
+        negative, text = True, text[:-2]
+    elif text.endswith(" CR") or text.endswith("CR"):
+        text = text[:-2]
+
+    text = text.replace("RP", "").replace("IDR", "").replace(",-", "").replace(" ", "").strip()
+    if text.startswith("-"):
+        negative, text = True, text[1:]
+    elif text.startswith("+"):
+        text = text[1:]
+    if text.endswith("-"):
+        text = text[:-1]
+
+    if not text or not re.fullmatch(r"[0-9.,]+", text):
+        raise ValueError(f"Invalid amount: {raw}")
+
+    if "." in text and "," in text:
+        # Separator yang muncul terakhir adalah desimal
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "." in text or "," in text:
+        sep = "." if "." in text else ","
+        parts = text.split(sep)
+        # Banyak separator, atau tepat 3 digit setelahnya -> pemisah ribuan
+        if len(parts) > 2 or len(parts[-1]) == 3:
+            text = text.replace(sep, "")
+        else:
+            text = text.replace(sep, ".")
+
+    value = float(text)
+    return -value if negative else value
+
+
+def parse_indonesian_date(raw: str) -> str:
+    """
+    Parse tanggal mutasi -> ISO string.
+    Mendukung '17/10/2025', '17-10-25', '2025-10-17', '17 Okt 2025', '17-Des-2025'
+    dan format OFX '20251017' / '20251017120000[-7:MST]'.
+    """
+    if raw is None or not str(raw).strip():
+        raise ValueError("Empty date")
+    text = str(raw).strip()
+
+    # OFX: YYYYMMDD[HHMMSS[.XXX]][TZ]
+    ofx_match = re.fullmatch(r"(\d{8})(\d{6})?(?:\.\d+)?(?:\[.*\])?", text)
+    if ofx_match:
+        fmt = "%Y%m%d%H%M%S" if ofx_match.group(2) else "%Y%m%d"
+        return datetime.strptime(ofx_match.group(1) + (ofx_match.group(2) or ""), fmt).isoformat()
+
+    # Buang bagian jam jika ada ('17/10/2025 13:45')
+    date_part = text.split(" ")[0] if re.match(r"^\d", text) and ":" in text else text
+
+    for fmt in _NUMERIC_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_part, fmt).isoformat()
+        except ValueError:
+            continue
+
+    # Nama bulan: '17 Okt 2025', '17-Okt-2025', '17 Oktober 2025'
+    month_match = re.fullmatch(r"(\d{1,2})[\s\-/]+([A-Za-z]+)[\s\-/]+(\d{2,4})", date_part)
+    if month_match:
+        month = _MONTHS.get(month_match.group(2).lower())
+        if month:
+            year = int(month_match.group(3))
+            if year < 100:
+                year += 2000
+            return datetime(year, month, int(month_match.group(1))).isoformat()
+
+    raise ValueError(f"Invalid date: {raw}")
+
+
+def row_basis(user_id: str, row: StatementRow) -> str:
+    """
+    Identitas isi satu baris mutasi. OFX memakai FITID (unik dari bank);
+    CSV memakai tanggal + arah + amount + deskripsi.
+    """
+    if row.external_id:
+        return f"{user_id}|ofx|{row.external_id}"
+    normalized_desc = " ".join(row.description.lower().split())
+    return f"{user_id}|{row.transaction_date[:10]}|{row.direction}|{row.amount:.2f}|{normalized_desc}"
+
+
+def row_hash(user_id: str, row: StatementRow, occurrence: int = 0) -> str:
+    """
+    Hash deterministik satu baris mutasi untuk deteksi duplikat antar import.
+    occurrence = urutan kemunculan baris identik di file yang sama (0, 1, ...),
+    jadi dua biaya admin yang sama di hari yang sama tetap jadi dua transaksi,
+    sementara import ulang file yang sama menghasilkan hash yang sama.
+    """
+    basis = row_basis(user_id, row)
+    if occurrence:
+        basis = f"{basis}|{occurrence}"
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+
+class OccurrenceCounter:
+    """
+    Hitung kemunculan basis baris identik dengan memori terbatas: hanya
+    'window' basis terakhir yang diingat. Mutasi bank urut tanggal, jadi
+    baris identik selalu berdekatan.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._counts = OrderedDict()
+
+    def next(self, basis: str) -> int:
+        occurrence = self._counts.pop(basis, 0)
+        self._counts[basis] = occurrence + 1
+        if len(self._counts) > self.window:
+            self._counts.popitem(last=False)
+        return occurrence
+
+
+def detect_format(first_line: str, filename: str = "", content_type: str = "") -> str:
+    """
+    Tentukan format file ('csv' / 'ofx') dari nama file, content type, atau isi baris pertama.
+    """
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    if name.endswith((".ofx", ".qfx")) or "ofx" in ctype:
+        return "ofx"
+    if name.endswith((".csv", ".txt")) or "csv" in ctype:
+        return "csv"
+    head = (first_line or "").strip().upper()
+    if head.startswith("OFXHEADER") or head.startswith("<?XML") or "<OFX>" in head:
+        return "ofx"
+    return "csv"
+
+
+def _match_column(headers: list[str], aliases: set[str]) -> int | None:
+    for index, header in enumerate(headers):
+        if header in aliases:
+            return index
+    return None
+
+
+def iter_csv_rows(lines):
+    """
+    Generator StatementRow dari iterable baris CSV (file object teks).
+    Delimiter (',' / ';' / tab) dideteksi dari baris header.
+    Baris yang tidak valid menghasilkan StatementParseError (di-yield, bukan raise)
+    supaya pemanggil bisa melaporkan lalu melanjutkan.
+    """
+    line_iter = iter(lines)
+    header_line = ""
+    for header_line in line_iter:
+        if header_line.strip():
+            break
+    if not header_line.strip():
+        return
+
+    try:
+        delimiter = csv.Sniffer().sniff(header_line, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+
+    headers = [h.strip().lower() for h in next(csv.reader([header_line], delimiter=delimiter))]
+    date_col = _match_column(headers, _DATE_HEADERS)
+    desc_col = _match_column(headers, _DESCRIPTION_HEADERS)
+    amount_col = _match_column(headers, _AMOUNT_HEADERS)
+    debit_col = _match_column(headers, _DEBIT_HEADERS)
+    credit_col = _match_column(headers, _CREDIT_HEADERS)
+
+    if date_col is None or desc_col is None or (amount_col is None and debit_col is None and credit_col is None):
+        yield StatementParseError(1, "CSV header must contain date, description and amount (or debit/credit) columns")
+        return
+
+    def _cell(record, col):
+        return record[col].strip() if col is not None and col < len(record) else ""
+
+    reader = csv.reader(line_iter, delimiter=delimiter)
+    for line_number, record in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in record):
+            continue
+        try:
+            transaction_date = parse_indonesian_date(_cell(record, date_col))
+            description = _cell(record, desc_col)
+            if not description:
+                raise ValueError("Empty description")
+
+            debit_raw = _cell(record, debit_col)
+            credit_raw = _cell(record, credit_col)
+            if debit_raw and parse_indonesian_amount(debit_raw) != 0:
+                value = -abs(parse_indonesian_amount(debit_raw))
+            elif credit_raw and parse_indonesian_amount(credit_raw) != 0:
+                value = abs(parse_indonesian_amount(credit_raw))
+            else:
+                value = parse_indonesian_amount(_cell(record, amount_col))
+
+            yield StatementRow(
+                line_number=line_number,
+                transaction_date=transaction_date,
+                description=description,
+                amount=abs(value),
+                direction="debit" if value < 0 else "credit"
+            )
+        except ValueError as e:
+            yield StatementParseError(line_number, str(e))
+
+
+def iter_ofx_rows(lines):
+    """
+    Generator StatementRow dari file OFX (SGML v1 maupun XML v2).
+    Hanya blok <STMTTRN> yang sedang dibaca yang disimpan di memori.
+    """
+    current = None
+    start_line = 0
+    for line_number, line in enumerate(lines, start=1):
+        for closing, tag, value in _OFX_TAG_PATTERN.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if not closing:
+                    current, start_line = {}, line_number
+                    continue
+                if current is not None:
+                    yield _ofx_block_to_row(current, start_line)
+                current = None
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+
+    # SGML tanpa tag penutup di akhir file
+    if current:
+        yield _ofx_block_to_row(current, start_line)
+
+
+def _ofx_block_to_row(block: dict, line_number: int):
+    try:
+        value = parse_indonesian_amount(block.get("TRNAMT"))
+        trn_type = block.get("TRNTYPE", "").upper()
+        if trn_type in ("DEBIT", "PAYMENT", "FEE", "SRVCHG", "ATM", "POS", "CHECK") and value > 0:
+            value = -value
+        description = block.get("NAME") or block.get("MEMO") or ""
+        if block.get("NAME") and block.get("MEMO") and block["MEMO"] != block["NAME"]:
+            description = f"{block['NAME']} - {block['MEMO']}"
+        if not description:
+            raise ValueError("Empty description")
+        return StatementRow(
+            line_number=line_number,
+            transaction_date=parse_indonesian_date(block.get("DTPOSTED")),
+            description=description,
+            amount=abs(value),
+            direction="debit" if value < 0 else "credit",
+            external_id=block.get("FITID")
+        )
+    except ValueError as e:
+        return StatementParseError(line_number, str(e))
+
+
+def iter_statement_rows(lines, statement_format: str):
+    if statement_format == "ofx":
+        return iter_ofx_rows(lines)
+    return iter_csv_rows(lines)
@@ -6,9 +6,8 @@ import jwt
 import bcrypt
 import uuid
 from datetime import datetime, timedelta, timezone
-from azure.eventgrid import EventGridPublisherClient
-from azure.core.credentials import AzureKeyCredential
-from azure.cosmos import CosmosClient, exceptions
+import azure_clients
+import token_verifier
 
 app = func.FunctionApp()
 
@@ -30,25 +29,14 @@ def get_container():
     if not COSMOS_CONN_STR:
         raise ValueError("COSMOS_DB_CONN_STR belum di-set!")
     
-    client = CosmosClient.from_connection_string(COSMOS_CONN_STR)
-    database = client.get_database_client(DB_NAME)
-    return database.get_container_client(CONTAINER_NAME)
+    return azure_clients.get_cosmos_container(COSMOS_CONN_STR, DB_NAME, CONTAINER_NAME)
 
 # --- HELPER: VALIDASI TOKEN ---
 def _get_user_info_from_token(req: func.HttpRequest) -> dict | None:
-    auth_header = req.headers.get('Authorization')
-    if not auth_header:
-        return None
-    try:
-        # Format: "Bearer <token>"
-        token = auth_header.split(' ')[1]
-        
-        # Decode dan validasi signature menggunakan Secret Key kita
-        decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return decoded
-    except Exception as e:
-        logging.error(f"Token invalid: {e}")
-        return None
+    """
+    Validasi Token JWT dan return payloadnya (lewat token_verifier: cache + header identitas gateway).
+    """
+    return token_verifier.verify_request(req)
 
 # -----------------------------------------------------------------
 # FUNGSI 1: REGISTER (Sign Up Manual)
@@ -105,7 +93,7 @@ def UserRegister(req: func.HttpRequest) -> func.HttpResponse:
                     "eventTime": datetime.now(timezone.utc).isoformat(),
                     "dataVersion": "1.0"
                 }
-                client = EventGridPublisherClient(EVENTGRID_ENDPOINT, AzureKeyCredential(EVENTGRID_KEY))
+                client = azure_clients.get_eventgrid_client(EVENTGRID_ENDPOINT, EVENTGRID_KEY)
                 client.send([event_data])
             except Exception as e:
                 logging.warning(f"Gagal kirim event grid: {e}")